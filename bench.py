@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from my_py import logger
+from my_py import chunk_tool
+from my_py import cmd_handler
+from my_py import os_util
+from my_py import third_lib
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tempfile
+
+import paramiko
+
+
+def bench_spawn_latency(round_num=500):
+    """compare the spawn latency of shell, exec and session mode
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    handler = cmd_handler.CmdHandler(handler_name="bench")
+    handler.logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    session = cmd_handler.ShellSession(handler_name="bench")
+    session.logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+
+    case_list = [
+        ("shell", lambda: handler.run_shell("uname")),
+        ("exec", lambda: handler.run_exec(["uname"])),
+        ("exec+posix_spawn", lambda: handler.run_exec(["uname"], is_close_fds=False)),
+        ("session", lambda: session.run_shell("uname")),
+    ]
+    for case_name, case_func in case_list:
+        case_func()
+        start_time = time.perf_counter()
+        for _ in range(round_num):
+            case_func()
+        elapsed_time = time.perf_counter() - start_time
+        bench_logger.info("spawn latency {:>17}: {:.3f} ms/cmd".format(
+            case_name, elapsed_time * 1000 / round_num))
+    session.close()
+
+
+def _bench_time(bench_logger, case_name: str, case_func):
+    start_time = time.perf_counter()
+    case_func()
+    elapsed_time = time.perf_counter() - start_time
+    bench_logger.info("{:>24}: {:.3f} s".format(case_name, elapsed_time))
+    return elapsed_time
+
+
+def bench_fs_tree(file_num=20000, file_size=512, dir_fanout=100):
+    """compare FS.copy_tree/walk/disk_usage with cp -r, os.walk and du on a
+    tree of small files, run with file_num=1000000 for the full-size case
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    handler = cmd_handler.CmdHandler(handler_name="bench")
+    handler.logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    os_util._g_logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        src_dir = os.path.join(work_dir, "src")
+        file_data = os.urandom(file_size)
+        for file_idx in range(file_num):
+            sub_dir = os.path.join(src_dir, str(file_idx // dir_fanout // dir_fanout),
+                                   str(file_idx // dir_fanout % dir_fanout))
+            if (file_idx % dir_fanout == 0):
+                os.makedirs(sub_dir, exist_ok=True)
+            with open(os.path.join(sub_dir, str(file_idx)), "wb") as out_file:
+                out_file.write(file_data)
+        bench_logger.info("tree: {} files of {} bytes".format(file_num, file_size))
+
+        _bench_time(bench_logger, "os.walk",
+                    lambda: sum(len(files) for _, _, files in os.walk(src_dir)))
+        _bench_time(bench_logger, "FS.walk",
+                    lambda: sum(len(files) for _, _, files in os_util.FS.walk(src_dir)))
+        _bench_time(bench_logger, "du -sb",
+                    lambda: handler.run_shell("du -sb " + src_dir))
+        _bench_time(bench_logger, "FS.disk_usage",
+                    lambda: os_util.FS.disk_usage(src_dir))
+        _bench_time(bench_logger, "cp -r",
+                    lambda: handler.run_shell("cp -r {} {}".format(
+                        src_dir, os.path.join(work_dir, "dst_cp"))))
+        _bench_time(bench_logger, "FS.copy_tree",
+                    lambda: os_util.FS.copy_tree(src_dir, os.path.join(work_dir, "dst_fs")))
+
+
+def bench_chunking(data_size=64 * 1024 * 1024):
+    """FastCDC throughput in MB/s (cut points + sha256 fingerprints), with
+    numpy (if installed) and in pure python
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    in_data = os.urandom(data_size)
+    case_list = [("numpy", True)] if chunk_tool._g_has_numpy else []
+    case_list.append(("python", False))
+    for case_name, is_use_numpy in case_list:
+        chunker = chunk_tool.FastCDC(is_use_numpy=is_use_numpy)
+        # the pure-python path is slow, measure it on a slice
+        case_data = in_data if is_use_numpy else in_data[:data_size // 8]
+        chunk_time = _bench_time(bench_logger, "FastCDC ({})".format(case_name),
+                                 lambda: sum(1 for _ in chunker.chunk_data(case_data)))
+        bench_logger.info("FastCDC {:>6}: {:.1f} MB/s".format(
+            case_name, len(case_data) / chunk_time / 1024 / 1024))
+
+
+def bench_fp_index(entry_num=1000000, query_num=400000):
+    """FingerprintIndex lookups per second (half hits, half misses) and
+    memory per entry, against a python set of the same fingerprints
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    fp_list = [os.urandom(32) for _ in range(entry_num)]
+    query_list = fp_list[:query_num // 2] + [os.urandom(32) for _ in range(query_num // 2)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        fp_index = chunk_tool.FingerprintIndex(os.path.join(work_dir, "fp.idx"),
+                                               entry_num=entry_num)
+        _bench_time(bench_logger, "insert_many", lambda: fp_index.insert_many(fp_list))
+        _bench_time(bench_logger, "flush", fp_index.flush)
+        query_time = _bench_time(bench_logger, "contains_many",
+                                 lambda: fp_index.contains_many(query_list))
+        stats = fp_index.get_stats()
+        bench_logger.info("FingerprintIndex: {:.2f} M lookups/s, {:.1f} bytes/entry heap, "
+                          "{:.1f} bytes/entry mmap'd".format(
+                              query_num / query_time / 1000000, stats["mem_per_entry"],
+                              stats["disk_per_entry"]))
+        fp_index.close()
+    fp_set = set(fp_list)
+    query_time = _bench_time(bench_logger, "set lookup",
+                             lambda: [fp in fp_set for fp in query_list])
+    bench_logger.info("python set: {:.2f} M lookups/s, {:.1f} bytes/entry heap".format(
+        query_num / query_time / 1000000,
+        (sys.getsizeof(fp_set) + sum(sys.getsizeof(fp) for fp in fp_list)) / entry_num))
+
+
+class _StubSSHServer(paramiko.ServerInterface):
+    """password auth, exec runs bash locally with the channel as stdio
+    """
+    def __init__(self, usr_name: str, pwd: str, max_sessions=0):
+        self._usr_name = usr_name
+        self._pwd = pwd
+        # open channels at most per connection like MaxSessions of sshd, 0: no limit
+        self._max_sessions = max_sessions
+        self.transport = None
+
+    def check_auth_password(self, username, password):
+        if ((username, password) == (self._usr_name, self._pwd)):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if (self._max_sessions > 0 and len(self.transport._channels) >= self._max_sessions):
+            return paramiko.OPEN_FAILED_RESOURCE_SHORTAGE
+        if (kind == "session"):
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        def _pump(read_func, write_func):
+            for data in iter(read_func, b""):
+                write_func(data)
+
+        def _run():
+            proc = subprocess.Popen(["bash", "-c", command.decode()], stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            def _pump_stdin():
+                _pump(lambda: channel.recv(65536), proc.stdin.write)
+                proc.stdin.close()
+            thread_list = [
+                threading.Thread(target=_pump_stdin, daemon=True),
+                threading.Thread(target=_pump, args=(lambda: proc.stderr.read1(65536),
+                                                     channel.sendall_stderr), daemon=True)]
+            for thread in thread_list:
+                thread.start()
+            _pump(lambda: proc.stdout.read1(65536), channel.sendall)
+            thread_list[1].join()
+            channel.send_exit_status(proc.wait())
+            channel.close()
+        threading.Thread(target=_run, daemon=True).start()
+        return True
+
+
+class _StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _StubSFTPServer(paramiko.SFTPServerInterface):
+    """sftp over the local file system, enough for SSHCmd.put/get
+    """
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+            file_obj = os.fdopen(fd, "r+b" if flags & os.O_RDWR else
+                                 "wb" if flags & os.O_WRONLY else "rb")
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+        handle = _StubSFTPHandle(flags)
+        handle.readfile = file_obj
+        handle.writefile = file_obj
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+
+    def lstat(self, path):
+        return self.stat(path)
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+        return paramiko.SFTP_OK
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as os_err:
+            return paramiko.SFTPServer.convert_errno(os_err.errno)
+        return paramiko.SFTP_OK
+
+
+def _start_stub_ssh_server(usr_name: str, pwd: str, max_sessions=0):
+    """serve _StubSSHServer + _StubSFTPServer on a local port, at most
+    max_sessions open channels per connection (0: no limit)
+
+    Returns:
+        port: listening port
+    """
+    host_key = paramiko.RSAKey.generate(2048)
+    listen_sock = socket.socket()
+    listen_sock.bind(("127.0.0.1", 0))
+    listen_sock.listen(16)
+
+    def _serve(sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _StubSFTPServer)
+        server = _StubSSHServer(usr_name, pwd, max_sessions)
+        server.transport = transport
+        transport.start_server(server=server)
+
+    def _accept_loop():
+        while True:
+            sock, _ = listen_sock.accept()
+            threading.Thread(target=_serve, args=(sock,), daemon=True).start()
+    threading.Thread(target=_accept_loop, daemon=True).start()
+    return listen_sock.getsockname()[1]
+
+
+def bench_sftp(file_size=256 * 1024 * 1024, small_file_num=2000, small_file_size=4096):
+    """SSHCmd.put/get/put_tree throughput in MB/s against a local paramiko
+    ssh+sftp server, with base64 through run_shell_iter and a plain sftp put
+    as the baselines
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    port = _start_stub_ssh_server("bench", "bench")
+    ssh_cmd = third_lib.SSHCmd(port, "127.0.0.1", "bench", "bench",
+                             log_level=logger.G_LOG_LEVEL_ERROR)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    with tempfile.TemporaryDirectory() as work_dir:
+        local_path = os.path.join(work_dir, "big.bin")
+        with open(local_path, "wb") as out_file:
+            out_file.write(os.urandom(file_size))
+
+        def _base64_get():
+            for _ in ssh_cmd.run_shell_iter("base64 {}".format(local_path)):
+                pass
+
+        def _plain_put():
+            ssh_client = paramiko.SSHClient()
+            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh_client.connect("127.0.0.1", port=port, username="bench", password="bench")
+            with ssh_client.open_sftp() as sftp:
+                sftp.put(local_path, os.path.join(work_dir, "plain.bin"))
+            ssh_client.close()
+
+        case_list = [
+            ("base64 via run_shell_iter", _base64_get),
+            ("plain sftp put", _plain_put),
+            ("SSHCmd.put", lambda: ssh_cmd.put(local_path, os.path.join(work_dir, "put.bin"),
+                                               is_verify=False)),
+            ("SSHCmd.put compressed", lambda: ssh_cmd.put(
+                local_path, os.path.join(work_dir, "put_z.bin"), is_compress=True,
+                is_verify=False)),
+            ("SSHCmd.get", lambda: ssh_cmd.get(local_path, os.path.join(work_dir, "get.bin"),
+                                               is_verify=False)),
+        ]
+        for case_name, case_func in case_list:
+            case_time = _bench_time(bench_logger, case_name, case_func)
+            bench_logger.info("{:>26}: {:.1f} MB/s".format(
+                case_name, file_size / case_time / 1024 / 1024))
+
+        tree_dir = os.path.join(work_dir, "tree")
+        for file_idx in range(small_file_num):
+            file_path = os.path.join(tree_dir, str(file_idx % 20), str(file_idx))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as out_file:
+                out_file.write(os.urandom(small_file_size))
+        _, stats = ssh_cmd.put_tree(tree_dir, os.path.join(work_dir, "tree_copy"))
+        bench_logger.info("put_tree {} small files (verified): {:.3f} s, {:.1f} files/s".format(
+            stats["file_num"], stats["elapsed"], stats["file_num"] / stats["elapsed"]))
+    ssh_cmd.close()
+
+
+def bench_process_index(keyword_list=("python", "sshd", "bash", "sleep", "systemd")):
+    """one Util.find_process_with_keyword walk per keyword, against one
+    ProcessIndex snapshot answering all of them and an incremental refresh
+    """
+    bench_logger = logger.get_logger("bench", logger.G_LOG_LEVEL_INFO)
+    _bench_time(bench_logger, "walk per keyword", lambda: [
+        third_lib.Util.find_process_with_keyword(keyword) for keyword in keyword_list])
+    process_index = None
+
+    def _build():
+        nonlocal process_index
+        process_index = third_lib.ProcessIndex()
+    _bench_time(bench_logger, "ProcessIndex snapshot", _build)
+    _bench_time(bench_logger, "ProcessIndex find_many",
+                lambda: process_index.find_many(list(keyword_list)))
+    _bench_time(bench_logger, "ProcessIndex refresh", process_index.refresh)
+    bench_logger.info("ProcessIndex: {} processes".format(len(process_index)))
+
+
+if __name__ == "__main__":
+    bench_spawn_latency()
+    bench_fs_tree()
+    bench_chunking()
+    bench_fp_index()
+    bench_sftp()
+    bench_process_index()
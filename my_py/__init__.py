@@ -2,6 +2,7 @@
 common python lib used by my project
 """
 __all__ = [
+    "chunk_tool",
     "common_tool",
     "crypto_tool",
     "logger",
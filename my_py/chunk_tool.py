@@ -0,0 +1,672 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+content-defined chunking (FastCDC) and chunk fingerprint index for deduplication
+'''
+
+from my_py import logger
+from my_py import common_tool
+from my_py import crypto_tool
+from my_py import os_util
+
+import array
+import bisect
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+
+_g_has_numpy = common_tool.is_module_exist("numpy")
+if (_g_has_numpy):
+    import numpy
+
+_g_mod_name = "chunk_tool"
+_g_logger = logger.get_logger(name=_g_mod_name)
+
+_g_cdc_min_size = 2 * 1024
+_g_cdc_avg_size = 8 * 1024
+_g_cdc_max_size = 64 * 1024
+# bytes scanned per numpy pass, must be larger than the max chunk size
+_g_cdc_window_size = 8 * 1024 * 1024
+# bits added to/removed from the avg mask before/after the avg size
+_g_cdc_normal_level = 2
+
+_g_fp_index_entry_num = 1024 * 1024
+_g_fp_bloom_fp_rate = 0.01
+# buffered inserts merged into the store at once
+_g_fp_buffer_max_entry = 256 * 1024
+
+# the gear hash is 32-bit and shifts one bit per byte, so it only depends
+# on the last _G_GEAR_WINDOW bytes
+_G_GEAR_WINDOW = 32
+_G_GEAR_MASK = 0xFFFFFFFF
+# fixed table so the cut points are stable across runs and hosts
+_G_GEAR_TABLE = [int.from_bytes(hashlib.sha256(b"gear" + bytes([byte_val])).digest()[:4],
+                                "little") for byte_val in range(256)]
+
+# store file: header | fan-out table | sorted keys | fingerprints, the key is
+# the first 8 bytes of the fingerprint as an uint64 (little-endian on disk)
+_G_FP_INDEX_MAGIC = b"MYFPIDX1"
+_G_FP_INDEX_HEADER = struct.Struct("<8sIIQQ")
+_G_FP_FANOUT_BIT = 16
+_G_FP_FANOUT_SIZE = ((1 << _G_FP_FANOUT_BIT) + 1) * 8
+_G_UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+class FastCDC:
+    '''
+    FastCDC chunker, yields (offset, length, fingerprint) of each chunk
+
+    The cut point of a chunk is the first position after min_size whose
+    gear hash matches the hard mask (before avg_size) or the easy mask
+    (after avg_size), else max_size. With numpy the gear hash of a whole
+    window is computed in log2(32) vectorized passes and the candidates are
+    found with one mask test, the pure-python path gives the same cut points.
+    '''
+    def __init__(self, min_size=_g_cdc_min_size, avg_size=_g_cdc_avg_size,
+                 max_size=_g_cdc_max_size, algo="sha256", is_hex=True,
+                 is_use_numpy=True):
+        '''
+        Args:
+            min_size: min chunk size, at least 64
+            avg_size: expected chunk size, rounded to a power of 2
+            max_size: max chunk size
+            algo: fingerprint algo, one of crypto_tool._G_HASH_ALGO_LIST
+            is_hex: hex str fingerprints, else the raw digest bytes
+            is_use_numpy: use numpy when it is installed
+        '''
+        if (not (2 * _G_GEAR_WINDOW <= min_size < avg_size < max_size)):
+            _g_logger.error("invalid chunk size (min: {}, avg: {}, max: {}), use default".format(
+                min_size, avg_size, max_size))
+            min_size, avg_size, max_size = _g_cdc_min_size, _g_cdc_avg_size, _g_cdc_max_size
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.algo = algo
+        self.is_hex = is_hex
+        self.is_use_numpy = is_use_numpy and _g_has_numpy
+        # the high bits of the gear hash mix the most bytes, the easy mask is
+        # a subset of the hard one so its candidates include the hard ones
+        avg_bit_num = max(avg_size.bit_length() - 1, _g_cdc_normal_level + 1)
+        hard_bit_num = min(avg_bit_num + _g_cdc_normal_level, _G_GEAR_WINDOW)
+        easy_bit_num = avg_bit_num - _g_cdc_normal_level
+        self._hard_mask = ((1 << hard_bit_num) - 1) << (_G_GEAR_WINDOW - hard_bit_num)
+        self._easy_mask = ((1 << easy_bit_num) - 1) << (_G_GEAR_WINDOW - easy_bit_num)
+        self._window_size = max(_g_cdc_window_size, 4 * max_size)
+        if (self.is_use_numpy):
+            self._gear_array = numpy.array(_G_GEAR_TABLE, dtype=numpy.uint32)
+
+    def _gear_hash_array(self, in_data, start: int, end: int):
+        # hash[p] = sum(gear[data[p - k]] << k for k < 32), built by doubling:
+        # hash_2w[p] = hash_w[p] + (hash_w[p - w] << w)
+        byte_array = numpy.frombuffer(in_data, dtype=numpy.uint8, count=end - start,
+                                      offset=start)
+        hash_array = self._gear_array[byte_array]
+        del byte_array
+        shift_array = numpy.empty_like(hash_array)
+        shift_num = 1
+        while shift_num < min(_G_GEAR_WINDOW, len(hash_array)):
+            item_num = len(hash_array) - shift_num
+            numpy.left_shift(hash_array[:item_num], shift_num, out=shift_array[:item_num])
+            numpy.add(hash_array[shift_num:], shift_array[:item_num],
+                      out=hash_array[shift_num:])
+            shift_num *= 2
+        return hash_array
+
+    def _cut_numpy(self, in_data, start: int, end: int, is_eof: bool):
+        ctx_start = max(start - _G_GEAR_WINDOW + 1, 0)
+        hash_array = self._gear_hash_array(in_data, ctx_start, end)
+        easy_pos_array = numpy.flatnonzero((hash_array & numpy.uint32(self._easy_mask)) == 0)
+        hard_pos_array = easy_pos_array[
+            (hash_array[easy_pos_array] & numpy.uint32(self._hard_mask)) == 0] + ctx_start
+        easy_pos_array += ctx_start
+        del hash_array
+
+        def find_cut(pos: int, normal_size: int, chunk_size: int):
+            # a match at the last byte of a chunk of cut_size bytes
+            end_pos = pos - 1
+            idx = numpy.searchsorted(hard_pos_array, end_pos + self.min_size)
+            if (idx < len(hard_pos_array) and hard_pos_array[idx] < end_pos + normal_size):
+                return int(hard_pos_array[idx]) - end_pos
+            idx = numpy.searchsorted(easy_pos_array, end_pos + normal_size)
+            if (idx < len(easy_pos_array) and easy_pos_array[idx] < end_pos + chunk_size):
+                return int(easy_pos_array[idx]) - end_pos
+            return chunk_size
+
+        return self._cut_loop(start, end, is_eof, find_cut)
+
+    def _cut_python(self, in_data, start: int, end: int, is_eof: bool):
+        gear_table = _G_GEAR_TABLE
+        hard_mask = self._hard_mask
+        easy_mask = self._easy_mask
+
+        def find_cut(pos: int, normal_size: int, chunk_size: int):
+            hash_val = 0
+            # warm up with the bytes before min_size, the hash is rolling
+            for byte_val in in_data[max(pos + self.min_size - _G_GEAR_WINDOW, 0):
+                                    pos + self.min_size - 1]:
+                hash_val = ((hash_val << 1) + gear_table[byte_val]) & _G_GEAR_MASK
+            cut_size = self.min_size
+            for byte_val in in_data[pos + self.min_size - 1:pos + normal_size - 1]:
+                hash_val = ((hash_val << 1) + gear_table[byte_val]) & _G_GEAR_MASK
+                if (not hash_val & hard_mask):
+                    return cut_size
+                cut_size += 1
+            for byte_val in in_data[pos + normal_size - 1:pos + chunk_size - 1]:
+                hash_val = ((hash_val << 1) + gear_table[byte_val]) & _G_GEAR_MASK
+                if (not hash_val & easy_mask):
+                    return cut_size
+                cut_size += 1
+            return chunk_size
+
+        return self._cut_loop(start, end, is_eof, find_cut)
+
+    def _cut_loop(self, start: int, end: int, is_eof: bool, find_cut):
+        '''
+        Returns:
+            cut_list: (offset, length) of the chunks found in [start, end)
+            pos: where the next call must start, a chunk is only cut when
+                 max_size bytes are available or at the end of the input
+        '''
+        cut_list = []
+        pos = start
+        while pos < end:
+            remain_size = end - pos
+            if (remain_size < self.max_size and not is_eof):
+                break
+            if (remain_size <= self.min_size):
+                cut_size = remain_size
+            else:
+                chunk_size = min(remain_size, self.max_size)
+                cut_size = find_cut(pos, min(self.avg_size, chunk_size), chunk_size)
+            cut_list.append((pos, cut_size))
+            pos += cut_size
+        return cut_list, pos
+
+    def cut_points(self, in_data, start=0, end=None, is_eof=True):
+        '''
+        find the chunks of a bytes-like object (bytes, bytearray, mmap)
+
+        Args:
+            in_data: input data
+            start: start offset
+            end: end offset, None for the end of in_data
+            is_eof: in_data ends at end, else the tail shorter than max_size
+                    is left uncut
+
+        Returns:
+            cut_list: (offset, length) of each chunk
+            pos: offset of the first byte not covered by cut_list
+        '''
+        end = len(in_data) if end is None else end
+        if (self.is_use_numpy):
+            return self._cut_numpy(in_data, start, end, is_eof)
+        return self._cut_python(in_data, start, end, is_eof)
+
+    def _iter_buffer(self, in_data, base_offset: int, start: int, end: int, is_eof: bool):
+        cut_list, pos = self.cut_points(in_data, start=start, end=end, is_eof=is_eof)
+        with memoryview(in_data) as data_view:
+            for offset, length in cut_list:
+                with data_view[offset:offset + length] as chunk_view:
+                    yield (base_offset + offset, length,
+                           crypto_tool.Hasher.hash_data(chunk_view, self.algo, self.is_hex))
+        return pos
+
+    def _iter_windows(self, in_data, data_size: int):
+        # bound the size of the numpy arrays to a window
+        pos = 0
+        while pos < data_size:
+            end = min(pos + self._window_size, data_size)
+            pos = yield from self._iter_buffer(in_data, 0, pos, end,
+                                               is_eof=(end == data_size))
+
+    def chunk_data(self, in_data):
+        '''
+        split a bytes-like object (bytes, bytearray, mmap) into chunks
+
+        Returns:
+            generator of (offset, length, fingerprint)
+        '''
+        yield from self._iter_windows(in_data, len(in_data))
+
+    def chunk_file(self, file_path: str):
+        '''
+        split a file into chunks, the file is mmap'd and scanned by windows
+
+        Args:
+            file_path: input file path
+
+        Returns:
+            generator of (offset, length, fingerprint), nothing is yielded
+            if the file cannot be read (the error is logged)
+        '''
+        try:
+            with open(os.path.expanduser(file_path), "rb") as in_file:
+                file_size = os.fstat(in_file.fileno()).st_size
+                if (file_size == 0):
+                    return
+                with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as in_map:
+                    in_map.madvise(mmap.MADV_SEQUENTIAL)
+                    yield from self._iter_windows(in_map, file_size)
+        except OSError as os_err:
+            _g_logger.error("chunk file ({}) failed: {}".format(
+                file_path, os_util.translate_linux_err_code(os_err.errno)))
+
+    def chunk_stream(self, in_stream):
+        '''
+        split a binary stream (file object, pipe) into chunks
+
+        Args:
+            in_stream: object with read(size) returning bytes
+
+        Returns:
+            generator of (offset, length, fingerprint)
+        '''
+        buf = bytearray()
+        # stream offset of buf[0], the gear hash needs the bytes before pos
+        buf_offset = 0
+        pos = 0
+        is_eof = False
+        while not is_eof:
+            data = in_stream.read(self._window_size)
+            if (not data):
+                is_eof = True
+            else:
+                buf += data
+                if (len(buf) - pos < self._window_size):
+                    continue
+            pos = yield from self._iter_buffer(buf, buf_offset, pos, len(buf), is_eof)
+            drop_size = max(pos - _G_GEAR_WINDOW, 0)
+            del buf[:drop_size]
+            buf_offset += drop_size
+            pos -= drop_size
+
+
+class BloomFilter:
+    '''
+    bloom filter on cryptographic fingerprints, the k bit positions are
+    derived from the fingerprint bytes (double hashing), no extra hashing
+    '''
+    def __init__(self, entry_num: int, fp_rate=_g_fp_bloom_fp_rate):
+        bit_num = max(int(-entry_num * math.log(fp_rate) / (math.log(2) ** 2)), 64)
+        # power of 2 so the modulo is a mask
+        self.bit_num = 1 << (bit_num - 1).bit_length()
+        self.hash_num = max(int(round(self.bit_num / max(entry_num, 1) * math.log(2))), 1)
+        self.hash_num = min(self.hash_num, 16)
+        self.entry_num = entry_num
+        self._bit_mask = self.bit_num - 1
+        self._bit_array = bytearray(self.bit_num // 8)
+        if (_g_has_numpy):
+            self._bit_np = numpy.frombuffer(self._bit_array, dtype=numpy.uint8)
+            self._hash_idx_np = numpy.arange(self.hash_num, dtype=numpy.uint64)
+
+    def __len__(self):
+        return len(self._bit_array)
+
+    def _pos_list(self, fp: bytes):
+        hash_1 = int.from_bytes(fp[:8], "little")
+        hash_2 = int.from_bytes(fp[8:16], "little") | 1
+        return [((hash_1 + hash_idx * hash_2) & _G_UINT64_MASK) & self._bit_mask
+                for hash_idx in range(self.hash_num)]
+
+    def _pos_array(self, fp_array):
+        # fp_array: (n, fp_size) uint8, uint64 overflow wraps like the python path
+        hash_1 = numpy.ascontiguousarray(fp_array[:, :8]).view("<u8")
+        hash_2 = numpy.ascontiguousarray(fp_array[:, 8:16]).view("<u8") | numpy.uint64(1)
+        return (hash_1 + self._hash_idx_np * hash_2) & numpy.uint64(self._bit_mask)
+
+    def add_many(self, fp_list: list, fp_array=None):
+        if (fp_array is not None):
+            pos_array = self._pos_array(fp_array).ravel()
+            numpy.bitwise_or.at(self._bit_np, pos_array >> numpy.uint64(3),
+                                numpy.left_shift(1, pos_array & numpy.uint64(7)).astype(numpy.uint8))
+            return
+        bit_array = self._bit_array
+        for fp in fp_list:
+            for pos in self._pos_list(fp):
+                bit_array[pos >> 3] |= 1 << (pos & 7)
+
+    def contains_many(self, fp_list: list, fp_array=None):
+        '''
+        Returns:
+            list of bool, or a bool numpy array if fp_array is given
+        '''
+        if (fp_array is not None):
+            pos_array = self._pos_array(fp_array)
+            bit_array = (self._bit_np[pos_array >> numpy.uint64(3)] >>
+                         (pos_array & numpy.uint64(7)).astype(numpy.uint8)) & 1
+            return bit_array.all(axis=1)
+        bit_array = self._bit_array
+        return [all(bit_array[pos >> 3] >> (pos & 7) & 1 for pos in self._pos_list(fp))
+                for fp in fp_list]
+
+
+class FingerprintIndex:
+    '''
+    "have we seen this chunk" index of fixed-size fingerprints (e.g. the raw
+    sha256 digests of FastCDC chunks), three layers:
+        1. in-memory bloom filter, most new chunks stop here
+        2. sorted store file, mmap'd, a 2^16 fan-out table on the key prefix
+           narrows the binary search (numpy searchsorted when installed)
+        3. write buffer (a set), merged into the store when it holds
+           buffer_max_entry fingerprints, or by flush/close
+    The store costs fp_size + 8 bytes per entry on disk (page cache), the
+    heap only holds the bloom filter and the buffer. Not thread-safe.
+    '''
+    def __init__(self, index_path: str, fp_size=32, entry_num=_g_fp_index_entry_num,
+                 bloom_fp_rate=_g_fp_bloom_fp_rate, buffer_max_entry=_g_fp_buffer_max_entry,
+                 is_use_numpy=True):
+        '''
+        Args:
+            index_path: store file path, created by the first merge
+            fp_size: fingerprint size in bytes, at least 16
+            entry_num: expected number of entries, sizes the bloom filter,
+                       which is rebuilt larger when the store outgrows it
+            bloom_fp_rate: bloom filter false positive rate
+            buffer_max_entry: merge the write buffer at this size
+            is_use_numpy: use numpy when it is installed
+        '''
+        self._index_path = os.path.expanduser(index_path)
+        self.fp_size = fp_size
+        self._bloom_fp_rate = bloom_fp_rate
+        self._buffer_max_entry = buffer_max_entry
+        self.is_use_numpy = is_use_numpy and _g_has_numpy
+        self._buffer_set = set()
+        self._store_num = 0
+        self._store_file = None
+        self._store_map = None
+        self._fanout_view = None
+        self._key_view = None
+        self._fp_view = None
+        self._key_np = None
+        self._fp_np = None
+        self.merge_count = 0
+        self._open_store()
+        self.bloom = BloomFilter(max(entry_num, self._store_num * 2), bloom_fp_rate)
+        self._add_store_to_bloom()
+
+    def __len__(self):
+        return self._store_num + len(self._buffer_set)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open_store(self):
+        self._close_store()
+        if (not os.path.exists(self._index_path)):
+            return
+        self._store_file = open(self._index_path, "rb")
+        header = self._store_file.read(_G_FP_INDEX_HEADER.size)
+        if (len(header) == _G_FP_INDEX_HEADER.size):
+            magic, fp_size, _, store_num, _ = _G_FP_INDEX_HEADER.unpack(header)
+        if (len(header) != _G_FP_INDEX_HEADER.size or magic != _G_FP_INDEX_MAGIC or
+            fp_size != self.fp_size):
+            self._close_store()
+            _g_logger.error("invalid fingerprint index: {}".format(self._index_path))
+            raise ValueError("invalid fingerprint index: {}".format(self._index_path))
+        self._store_num = store_num
+        if (store_num == 0):
+            return
+        self._store_map = mmap.mmap(self._store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        key_offset = _G_FP_INDEX_HEADER.size + _G_FP_FANOUT_SIZE
+        fp_offset = key_offset + 8 * store_num
+        with memoryview(self._store_map) as map_view:
+            self._fanout_view = map_view[_G_FP_INDEX_HEADER.size:key_offset].cast("Q")
+            self._key_view = map_view[key_offset:fp_offset].cast("Q")
+            self._fp_view = map_view[fp_offset:fp_offset + self.fp_size * store_num]
+        if (self.is_use_numpy):
+            self._key_np = numpy.frombuffer(self._store_map, dtype="<u8", count=store_num,
+                                            offset=key_offset)
+            self._fp_np = numpy.frombuffer(
+                self._store_map, dtype=numpy.uint8, count=self.fp_size * store_num,
+                offset=fp_offset).reshape(store_num, self.fp_size)
+
+    def _close_store(self):
+        # the views must go before the mmap can be closed
+        for view in (self._fanout_view, self._key_view, self._fp_view):
+            if (view is not None):
+                view.release()
+        self._fanout_view = self._key_view = self._fp_view = None
+        self._key_np = self._fp_np = None
+        if (self._store_map is not None):
+            self._store_map.close()
+            self._store_map = None
+        if (self._store_file is not None):
+            self._store_file.close()
+            self._store_file = None
+        self._store_num = 0
+
+    def _add_store_to_bloom(self):
+        if (self._store_num == 0):
+            return
+        if (self.is_use_numpy):
+            self.bloom.add_many(None, fp_array=self._fp_np)
+            return
+        fp_size = self.fp_size
+        self.bloom.add_many(self._fp_view[idx * fp_size:(idx + 1) * fp_size].tobytes()
+                            for idx in range(self._store_num))
+
+    def _to_fp_list(self, fp_list):
+        # hex str (Hasher default) or raw bytes
+        fp_list = list(fp_list)
+        if (not all(type(fp) is bytes for fp in fp_list)):
+            fp_list = [bytes.fromhex(fp) if isinstance(fp, str) else bytes(fp)
+                       for fp in fp_list]
+        bad_size_set = set(map(len, fp_list)) - {self.fp_size}
+        if (len(bad_size_set) != 0):
+            _g_logger.error("invalid fingerprint size: {} (expect {})".format(
+                sorted(bad_size_set), self.fp_size))
+            return None
+        return fp_list
+
+    def _store_contains(self, fp: bytes):
+        key = int.from_bytes(fp[:8], "big")
+        prefix = key >> (64 - _G_FP_FANOUT_BIT)
+        hi = self._fanout_view[prefix + 1]
+        idx = bisect.bisect_left(self._key_view, key, self._fanout_view[prefix], hi)
+        # keys may collide on the 8-byte prefix, check the whole fingerprint
+        while idx < hi and self._key_view[idx] == key:
+            if (self._fp_view[idx * self.fp_size:(idx + 1) * self.fp_size] == fp):
+                return True
+            idx += 1
+        return False
+
+    def _store_contains_many(self, fp_list: list, idx_list, fp_array):
+        key_array = numpy.ascontiguousarray(fp_array[:, :8]).view(">u8").ravel().astype("<u8")
+        idx_array = numpy.searchsorted(self._key_np, key_array)
+        idx_array[idx_array >= self._store_num] = self._store_num - 1
+        is_found_array = (self._key_np[idx_array] == key_array) & \
+            (self._fp_np[idx_array] == fp_array).all(axis=1)
+        # the same key prefix with another fingerprint, rare
+        for pos in numpy.flatnonzero((self._key_np[idx_array] == key_array) & ~is_found_array):
+            is_found_array[pos] = self._store_contains(fp_list[idx_list[pos]])
+        return is_found_array
+
+    def contains_many(self, fp_list: list):
+        '''
+        check a batch of fingerprints
+
+        Args:
+            fp_list: list of fingerprints, raw bytes or hex str
+
+        Returns:
+            list of bool, None if a fingerprint has a wrong size
+        '''
+        fp_list = self._to_fp_list(fp_list)
+        if (fp_list is None):
+            return None
+        return self._contains_many(fp_list)
+
+    def _contains_many(self, fp_list: list):
+        if (len(fp_list) == 0):
+            return []
+        if (not self.is_use_numpy):
+            return [(fp in self._buffer_set or
+                     (self._store_num != 0 and self._store_contains(fp))) if is_maybe else False
+                    for fp, is_maybe in zip(fp_list, self.bloom.contains_many(fp_list))]
+
+        fp_array = numpy.frombuffer(b"".join(fp_list), dtype=numpy.uint8).reshape(
+            len(fp_list), self.fp_size)
+        maybe_idx_array = numpy.flatnonzero(self.bloom.contains_many(None, fp_array=fp_array))
+        is_found_array = numpy.zeros(len(fp_list), dtype=bool)
+        if (len(self._buffer_set) != 0 and len(maybe_idx_array) != 0):
+            is_buffer_array = numpy.fromiter(
+                (fp_list[idx] in self._buffer_set for idx in maybe_idx_array.tolist()),
+                dtype=bool, count=len(maybe_idx_array))
+            is_found_array[maybe_idx_array[is_buffer_array]] = True
+            maybe_idx_array = maybe_idx_array[~is_buffer_array]
+        if (self._store_num != 0 and len(maybe_idx_array) != 0):
+            is_found_array[maybe_idx_array] = self._store_contains_many(
+                fp_list, maybe_idx_array, fp_array[maybe_idx_array])
+        return is_found_array.tolist()
+
+    def insert_many(self, fp_list: list):
+        '''
+        insert a batch of fingerprints, merge the write buffer when it is full
+
+        Args:
+            fp_list: list of fingerprints, raw bytes or hex str
+
+        Returns:
+            list of bool, True if the fingerprint was new, None if a
+            fingerprint has a wrong size
+        '''
+        fp_list = self._to_fp_list(fp_list)
+        if (fp_list is None):
+            return None
+        is_new_list = []
+        new_fp_list = []
+        for fp, is_found in zip(fp_list, self._contains_many(fp_list)):
+            # duplicates inside the batch are caught by the buffer
+            is_new = not is_found and fp not in self._buffer_set
+            if (is_new):
+                self._buffer_set.add(fp)
+                new_fp_list.append(fp)
+            is_new_list.append(is_new)
+        if (len(new_fp_list) != 0):
+            if (self.is_use_numpy):
+                self.bloom.add_many(None, fp_array=numpy.frombuffer(
+                    b"".join(new_fp_list), dtype=numpy.uint8).reshape(-1, self.fp_size))
+            else:
+                self.bloom.add_many(new_fp_list)
+        if (len(self._buffer_set) >= self._buffer_max_entry):
+            self.flush()
+        return is_new_list
+
+    def flush(self):
+        '''
+        merge the write buffer into the store file (rewritten, then renamed)
+
+        Returns:
+            ret_code: return code
+        '''
+        if (len(self._buffer_set) == 0):
+            return 0
+        new_fp_list = sorted(self._buffer_set)
+        store_num = self._store_num + len(new_fp_list)
+        tmp_path = self._index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as out_file:
+                out_file.write(_G_FP_INDEX_HEADER.pack(_G_FP_INDEX_MAGIC, self.fp_size, 0,
+                                                       store_num, 0))
+                if (self.is_use_numpy):
+                    self._write_merged_numpy(out_file, new_fp_list)
+                else:
+                    self._write_merged_python(out_file, new_fp_list)
+                out_file.flush()
+                os.fsync(out_file.fileno())
+            self._close_store()
+            os.replace(tmp_path, self._index_path)
+            self._open_store()
+        except OSError as os_err:
+            _g_logger.error("merge fingerprint index ({}) failed: {}".format(
+                self._index_path, os_util.translate_linux_err_code(os_err.errno)))
+            if (self._store_map is None):
+                self._open_store()
+            return os_err.errno
+        self._buffer_set.clear()
+        self.merge_count += 1
+        if (self._store_num > self.bloom.entry_num):
+            # keep the false positive rate
+            self.bloom = BloomFilter(self._store_num * 2, self._bloom_fp_rate)
+            self._add_store_to_bloom()
+        return 0
+
+    def _write_merged_numpy(self, out_file, new_fp_list: list):
+        new_fp_array = numpy.frombuffer(b"".join(new_fp_list), dtype=numpy.uint8).reshape(
+            len(new_fp_list), self.fp_size)
+        new_key_array = numpy.ascontiguousarray(new_fp_array[:, :8]).view(">u8").ravel() \
+            .astype("<u8")
+        if (self._store_num != 0):
+            key_array = numpy.concatenate((self._key_np, new_key_array))
+            fp_array = numpy.concatenate((self._fp_np, new_fp_array))
+            # both parts are sorted, the order of equal keys does not matter
+            order_array = numpy.argsort(key_array, kind="stable")
+            key_array = key_array[order_array]
+            fp_array = fp_array[order_array]
+        else:
+            key_array, fp_array = new_key_array, new_fp_array
+        fanout_array = numpy.empty((1 << _G_FP_FANOUT_BIT) + 1, dtype="<u8")
+        fanout_array[:-1] = numpy.searchsorted(
+            key_array, numpy.arange(1 << _G_FP_FANOUT_BIT, dtype=numpy.uint64) <<
+            numpy.uint64(64 - _G_FP_FANOUT_BIT))
+        fanout_array[-1] = len(key_array)
+        out_file.write(fanout_array.tobytes())
+        out_file.write(key_array.tobytes())
+        out_file.write(fp_array.tobytes())
+
+    def _write_merged_python(self, out_file, new_fp_list: list):
+        fp_size = self.fp_size
+        old_fp_iter = (self._fp_view[idx * fp_size:(idx + 1) * fp_size].tobytes()
+                       for idx in range(self._store_num))
+        fp_list = list(heapq.merge(old_fp_iter, new_fp_list))
+        key_array = array.array("Q", (int.from_bytes(fp[:8], "big") for fp in fp_list))
+        fanout_array = array.array("Q", [0] * ((1 << _G_FP_FANOUT_BIT) + 1))
+        for key in key_array:
+            fanout_array[(key >> (64 - _G_FP_FANOUT_BIT)) + 1] += 1
+        for prefix in range(1 << _G_FP_FANOUT_BIT):
+            fanout_array[prefix + 1] += fanout_array[prefix]
+        if (sys.byteorder == "big"):
+            fanout_array.byteswap()
+            key_array.byteswap()
+        out_file.write(fanout_array.tobytes())
+        out_file.write(key_array.tobytes())
+        out_file.write(b"".join(fp_list))
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats: dict of the entry number and memory usage, mem_per_entry
+                   counts the heap (bloom filter + write buffer), the store
+                   is mmap'd and costs disk_per_entry in the page cache
+        '''
+        entry_num = len(self)
+        buffer_size = sys.getsizeof(self._buffer_set) + \
+            len(self._buffer_set) * (sys.getsizeof(b"") + self.fp_size)
+        store_size = os.path.getsize(self._index_path) if self._store_num != 0 else 0
+        return {
+            "entry_num": entry_num,
+            "store_num": self._store_num,
+            "buffer_num": len(self._buffer_set),
+            "merge_count": self.merge_count,
+            "bloom_size": len(self.bloom),
+            "bloom_hash_num": self.bloom.hash_num,
+            "buffer_size": buffer_size,
+            "store_size": store_size,
+            "mem_per_entry": (len(self.bloom) + buffer_size) / max(entry_num, 1),
+            "disk_per_entry": store_size / max(self._store_num, 1),
+        }
+
+    def close(self):
+        '''
+        merge the write buffer and unmap the store
+        '''
+        ret = self.flush()
+        self._close_store()
+        return ret
@@ -2,27 +2,168 @@
 # -*- coding: utf-8 -*-
 
 import subprocess
+import asyncio
 import time
 import select
-import selectors
+import codecs
+import mmap
+import tempfile
 import fcntl
 import os
 import threading
 import errno
 import signal
-from typing import Dict
+import sys
+import concurrent.futures
+import collections
+import itertools
+import queue
+import shlex
+import shutil
+import uuid
+from typing import Callable, Dict, List, Set
 
 from my_py import logger
 from my_py import common_tool
 
 _g_mod_name = "cmd_handler"
 _g_logger = logger.get_logger(name=_g_mod_name)
-_g_running_subprocess_map: Dict[str, subprocess.Popen]= {}
-_g_running_subprocess_map_lock = threading.Lock()
+_g_running_job_map: Dict[int, "_Job"] = {}
+_g_running_job_map_lock = threading.Lock()
+_g_job_id_counter = itertools.count(1)
+_g_running_batch_set: Set["_BatchCtx"] = set()
+_g_running_batch_set_lock = threading.Lock()
 _g_interrupt_enable = False
 _g_interrupt_lock = threading.Lock()
 
 _g_terminate_timeout_second = 3
+_g_read_chunk_size = 65536
+_g_capture_mem_size = 4 * 1024 * 1024
+_g_capture_preview_size = 4096
+_g_spill_dir = None
+_g_session_shell_path = "/bin/bash"
+_g_cmd_cache_max_entry = 256
+_g_child_watcher_lock = threading.Lock()
+_g_is_child_watcher_set = False
+
+
+class _Job():
+    def __init__(self, job_id: int, cmd: str, pid: int, is_group_leader: bool):
+        """a running child process in the registry
+
+        Args:
+            job_id (int): unique job id
+            cmd (str): shell command
+            pid (int): pid of the child
+            is_group_leader (bool): the child leads its own process group
+        """
+        self.job_id = job_id
+        self.cmd = cmd
+        self.pid = pid
+        self.is_group_leader = is_group_leader
+        self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
+
+
+def _register_job(cmd: str, pid: int, is_group_leader: bool):
+    """add a child to the registry
+
+    Returns:
+        job_id: unique job id, identical commands get different ids
+    """
+    job_id = next(_g_job_id_counter)
+    with _g_running_job_map_lock:
+        _g_running_job_map[job_id] = _Job(job_id, cmd, pid, is_group_leader)
+    return job_id
+
+
+def _unregister_job(job_id: int):
+    with _g_running_job_map_lock:
+        _g_running_job_map.pop(job_id, None)
+    return None
+
+
+def get_running_jobs():
+    """snapshot of the running jobs
+
+    Returns:
+        job_list: list of dict with job_id, pid, cmd, start_time, elapsed
+    """
+    cur_monotonic = time.monotonic()
+    with _g_running_job_map_lock:
+        job_list = list(_g_running_job_map.values())
+    return [{
+        "job_id": job.job_id,
+        "pid": job.pid,
+        "cmd": job.cmd,
+        "start_time": job.start_time,
+        "elapsed": cur_monotonic - job.start_monotonic
+    } for job in job_list]
+
+
+def _is_job_alive(job: _Job):
+    # WNOWAIT leaves the child to its owner to reap
+    try:
+        return os.waitid(os.P_PID, job.pid,
+                         os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+    except ChildProcessError:
+        return False
+
+
+def _signal_job(job: _Job, cur_signal):
+    try:
+        if (job.is_group_leader):
+            os.killpg(job.pid, cur_signal)
+        else:
+            os.kill(job.pid, cur_signal)
+    except ProcessLookupError:
+        pass
+    return None
+
+
+def _wait_jobs(job_list: List[_Job], timeout: float):
+    """wait a list of jobs to exit against one shared deadline
+
+    Args:
+        job_list (List[_Job]): jobs to wait
+        timeout (float): timeout val
+
+    Returns:
+        job_list: jobs still alive after the deadline
+    """
+    deadline = time.monotonic() + timeout
+    pidfd_job_map = {}
+    poll_job_list = []
+    poller = select.poll()
+    for job in job_list:
+        try:
+            pidfd = os.pidfd_open(job.pid)
+        except (AttributeError, OSError):
+            poll_job_list.append(job)
+            continue
+        pidfd_job_map[pidfd] = job
+        poller.register(pidfd, select.POLLIN)
+
+    try:
+        while len(pidfd_job_map) + len(poll_job_list) != 0:
+            remaining = deadline - time.monotonic()
+            if (remaining <= 0):
+                break
+            if (len(poll_job_list) != 0):
+                # no pidfd for some jobs, check them periodically
+                remaining = min(remaining, 0.05)
+            if (len(pidfd_job_map) != 0):
+                for pidfd, _ in poller.poll(remaining * 1000):
+                    poller.unregister(pidfd)
+                    os.close(pidfd)
+                    del pidfd_job_map[pidfd]
+            else:
+                time.sleep(remaining)
+            poll_job_list = [job for job in poll_job_list if _is_job_alive(job)]
+    finally:
+        for pidfd in pidfd_job_map:
+            os.close(pidfd)
+    return list(pidfd_job_map.values()) + poll_job_list
 
 
 def keyboard_interrupt_handler(cur_signal, frame):
@@ -33,22 +174,38 @@ def keyboard_interrupt_handler(cur_signal, frame):
         frame (_type_): frame
     """
     _g_logger.warning("receive ctrl+c interrupt, stop all running sub-process")
-    _g_running_subprocess_map_lock.acquire()
-    for cmd in list(_g_running_subprocess_map.keys()):
-        if (_g_running_subprocess_map[cmd].poll() is not None):
-            del _g_running_subprocess_map[cmd]
-        else:
-            try:
-                _g_logger.warning("terminate: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
-                _g_running_subprocess_map[cmd].terminate()
-                _g_running_subprocess_map[cmd].wait(timeout=_g_terminate_timeout_second)
-                del _g_running_subprocess_map[cmd]
-            except subprocess.TimeoutExpired:
-                _g_logger.warning("terminate time expired {}s, start to kill".format(
-                    _g_terminate_timeout_second))
-                _g_running_subprocess_map[cmd].kill()
-    _g_running_subprocess_map_lock.release()
+    # the handler runs in the main thread, which may hold any lock here, so
+    # only take lock-free snapshots (one C-level copy under the GIL)
+    for batch_ctx in list(_g_running_batch_set):
+        # stop all running batches from starting new commands
+        batch_ctx.is_cancelled = True
+    job_list = [job for job in list(_g_running_job_map.values())
+                if _is_job_alive(job)]
+
+    # signal all the groups at once, then wait them together
+    for job in job_list:
+        _g_logger.warning("terminate job {} (pid: {}): {}".format(
+            job.job_id, job.pid,
+            common_tool.Color.set_text(job.cmd, common_tool.Color.BLUE)))
+        _signal_job(job, signal.SIGTERM)
+    job_list = _wait_jobs(job_list, _g_terminate_timeout_second)
+    if (len(job_list) != 0):
+        _g_logger.warning("terminate time expired {}s, start to kill {} job(s)".format(
+            _g_terminate_timeout_second, len(job_list)))
+        for job in job_list:
+            _signal_job(job, signal.SIGKILL)
+    return None
+
+
+def _popen_group_kwargs(timeout=0):
+    """Popen kwargs of the process group, a child gets its own group when it
+    needs a timeout or when the keyboard interrupt handler is set (the
+    handler stops the group); otherwise it stays in the foreground group so
+    that ctrl+c and tty prompts (e.g., sudo) reach it
+    """
+    if (timeout > 0 or _g_interrupt_enable):
+        return _new_process_group_kwargs()
+    return {}
 
 
 def set_keyboard_interrupt():
@@ -81,45 +238,330 @@ def remove_keyboard_interrupt():
     return 0
 
 
-def output_reader_thd(process: subprocess.Popen,
-                      stdout_buf: bytearray,
-                      stderr_buf: bytearray,
-                      is_verbose=False):
-    """thread of reading output
+class _OutputReader():
+    def __init__(self, process: subprocess.Popen,
+                 stdout_buf: bytearray,
+                 stderr_buf: bytearray,
+                 is_verbose=False):
+        """output of one process served by the io reactor
+
+        Args:
+            process (subprocess.Popen): input process
+            stdout_buf (bytearray): buffer of stdout, anything with extend(bytes)
+            stderr_buf (bytearray): buffer of stderr, anything with extend(bytes)
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+        """
+        self.process = process
+        self.is_verbose = is_verbose
+        self.fd_buf_map = {
+            process.stdout.fileno(): stdout_buf,
+            process.stderr.fileno(): stderr_buf
+        }
+        self.decoder_map = {}
+        if (is_verbose):
+            for fd in self.fd_buf_map:
+                self.decoder_map[fd] = codecs.getincrementaldecoder(
+                    common_tool._g_encode_fmt)(errors="replace")
+        self._done_event = threading.Event()
+
+    def on_data(self, fd: int, data: bytes):
+        if (self.is_verbose):
+            print(self.decoder_map[fd].decode(data), end="", flush=True)
+        self.fd_buf_map[fd].extend(data)
+
+    def on_eof(self, fd: int):
+        """return True when all the pipes of the process are closed"""
+        del self.fd_buf_map[fd]
+        if (len(self.fd_buf_map) == 0):
+            self._done_event.set()
+            return True
+        return False
+
+    def join(self, timeout=None):
+        """wait until all the output of the process is collected
+
+        Args:
+            timeout (float, optional): timeout val. Defaults to None.
+
+        Returns:
+            True: all output collected
+            False: timeout
+        """
+        return self._done_event.wait(timeout=timeout)
+
+
+class _IOReactor():
+    def __init__(self):
+        """process-wide reactor, one thread and one epoll instance serve the
+        stdout/stderr pipes of all running commands
+        """
+        self._lock = threading.Lock()
+        self._epoll = None
+        self._thd = None
+        self._fd_reader_map: Dict[int, _OutputReader] = {}
+
+    def register(self, process: subprocess.Popen,
+                 stdout_buf: bytearray,
+                 stderr_buf: bytearray,
+                 is_verbose=False):
+        """start collecting the output of a process
+
+        Args:
+            process (subprocess.Popen): input process, pipes in non-blocking mode
+            stdout_buf (bytearray): buffer of stdout
+            stderr_buf (bytearray): buffer of stderr
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+
+        Returns:
+            output_reader: call join() to wait the output
+        """
+        output_reader = _OutputReader(process, stdout_buf, stderr_buf, is_verbose)
+        with self._lock:
+            if (self._thd is None):
+                self._epoll = select.epoll()
+                self._thd = threading.Thread(target=self._run,
+                                             name="cmd_io_reactor",
+                                             daemon=True)
+                self._thd.start()
+            for fd in output_reader.fd_buf_map:
+                self._fd_reader_map[fd] = output_reader
+                self._epoll.register(fd, select.EPOLLIN | select.EPOLLHUP)
+        return output_reader
+
+    def detach(self, output_reader: _OutputReader):
+        """stop collecting the output of a process, e.g., the pipe is kept
+        open by an orphan grandchild after the process is killed
+
+        Args:
+            output_reader (_OutputReader): the reader to detach
+        """
+        with self._lock:
+            for fd in list(output_reader.fd_buf_map):
+                if (self._fd_reader_map.pop(fd, None) is not None):
+                    self._epoll.unregister(fd)
+                output_reader.on_eof(fd)
+        return None
+
+    def _run(self):
+        while True:
+            events = self._epoll.poll()
+            for fd, _ in events:
+                with self._lock:
+                    output_reader = self._fd_reader_map.get(fd)
+                    if (output_reader is None):
+                        continue
+                    self._read_fd(fd, output_reader)
+
+    def _read_fd(self, fd: int, output_reader: _OutputReader):
+        # drain the pipe until EAGAIN, so one wakeup serves a whole burst
+        while True:
+            try:
+                data = os.read(fd, _g_read_chunk_size)
+            except BlockingIOError:
+                return None
+            except OSError:
+                data = b""
+            if (len(data) == 0):
+                del self._fd_reader_map[fd]
+                self._epoll.unregister(fd)
+                output_reader.on_eof(fd)
+                return None
+            output_reader.on_data(fd, data)
+
+    def reset_after_fork(self):
+        # the reactor thread does not exist in a forked child
+        self._lock = threading.Lock()
+        self._epoll = None
+        self._thd = None
+        self._fd_reader_map = {}
+
+
+_g_io_reactor = _IOReactor()
+os.register_at_fork(after_in_child=_g_io_reactor.reset_after_fork)
+
+
+def _new_process_group_kwargs():
+    """Popen kwargs to start the child in its own process group, so the
+    whole group can be stopped, the child stays in the terminal session
+    """
+    if (sys.version_info >= (3, 11)):
+        return {"process_group": 0}
+    return {"preexec_fn": os.setpgrp}
+
+
+if (hasattr(asyncio, "AbstractChildWatcher")):
+    class _PidfdChildWatcher(asyncio.AbstractChildWatcher):
+        """reap each child from the loop it was started in through its pidfd,
+        no thread per child; the asyncio.PidfdChildWatcher of 3.9-3.11 is
+        bound to a single loop, this one works like the one of 3.12
+        """
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_value, exc_traceback):
+            pass
+
+        def is_active(self):
+            return True
+
+        def close(self):
+            pass
+
+        def attach_loop(self, loop):
+            pass
+
+        def add_child_handler(self, pid, callback, *args):
+            loop = asyncio.get_running_loop()
+            pidfd = os.pidfd_open(pid)
+            loop.add_reader(pidfd, self._do_wait, loop, pid, pidfd, callback, args)
+
+        def remove_child_handler(self, pid):
+            # never called by asyncio
+            return True
+
+        def _do_wait(self, loop, pid, pidfd, callback, args):
+            loop.remove_reader(pidfd)
+            try:
+                _, status = os.waitpid(pid, 0)
+                ret_code = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                # reaped elsewhere
+                ret_code = 255
+            os.close(pidfd)
+            callback(pid, ret_code, *args)
+
+
+def _set_pidfd_child_watcher():
+    """asyncio before 3.12 waits each child in a thread of its own
+    (ThreadedChildWatcher), watch the pidfd of each child in the event loop
+    instead when the kernel supports it, a watcher set by the user is kept
+    """
+    global _g_is_child_watcher_set
+    with _g_child_watcher_lock:
+        if (_g_is_child_watcher_set):
+            return None
+        _g_is_child_watcher_set = True
+        # 3.12+ uses pidfds by itself
+        if (sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open")):
+            return None
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+        except OSError:
+            return None
+        if (type(asyncio.get_child_watcher()) is asyncio.ThreadedChildWatcher):
+            asyncio.set_child_watcher(_PidfdChildWatcher())
+    return None
+
+
+def _wait_process(process: subprocess.Popen, timeout: float):
+    """wait a process to exit without polling, the caller reaps it
 
     Args:
         process (subprocess.Popen): input process
-        stdout_buf (bytearray): buffer of stdout
-        stderr_buf (bytearray): buffer of stderr
+        timeout (float): timeout val
 
     Returns:
-        None
+        True: exited
+        False: timeout
     """
-    local_selector = selectors.DefaultSelector()
-    local_selector.register(process.stdout, selectors.EVENT_READ)
-    local_selector.register(process.stderr, selectors.EVENT_READ)
-
-    while True:
-        events = local_selector.select()
-        for key, _ in events:
-            if (key.fileobj == process.stdout):
-                data = process.stdout.read()
-                if (len(data.strip()) != 0):
-                    if (is_verbose):
-                        print(data.strip())
-                    stdout_buf.extend("{}".format(data.strip()).encode(
-                        common_tool._g_encode_fmt))
-            if (key.fileobj == process.stderr):
-                data = process.stderr.read()
-                if (len(data.strip()) != 0):
-                    if (is_verbose):
-                        print(data.strip())
-                    stderr_buf.extend("{}".format(data.strip()).encode(
-                        common_tool._g_encode_fmt))
-        if (process.poll() is not None):
-            break
+    if (process.returncode is not None):
+        return True
+    pidfd = -1
+    if (hasattr(os, "pidfd_open")):
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError as os_err:
+            if (os_err.errno == errno.ESRCH):
+                return True
+    if (pidfd >= 0):
+        # pidfd becomes readable when the process exits
+        try:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            return len(poller.poll(max(timeout, 0) * 1000)) != 0
+        finally:
+            os.close(pidfd)
+
+    # no pidfd (old kernel or python), fall back to a waiter thread
+    waiter = threading.Thread(target=process.wait, daemon=True)
+    waiter.start()
+    waiter.join(timeout=timeout)
+    return not waiter.is_alive()
+
+
+def _signal_process_group(process, cur_signal):
+    """signal the process group when the process leads it, else the process
+
+    Args:
+        process (subprocess.Popen): input process, or asyncio.subprocess.Process
+        cur_signal (signal): signal to send
+    """
+    try:
+        if (os.getpgid(process.pid) == process.pid):
+            os.killpg(process.pid, cur_signal)
+        else:
+            process.send_signal(cur_signal)
+    except ProcessLookupError:
+        pass
+    return None
+
+
+def _stop_process(process: subprocess.Popen, cmd_logger=_g_logger):
+    """terminate a process, then kill it and whatever is left of its group,
+    after at most _g_terminate_timeout_second, the whole process group is
+    signaled when the process leads its own group
+
+    Args:
+        process (subprocess.Popen): input process
+        cmd_logger (logging.Logger, optional): logger. Defaults to _g_logger.
+    """
+    if (process.returncode is not None):
+        return None
+    _signal_process_group(process, signal.SIGTERM)
+    if (not _wait_process(process, _g_terminate_timeout_second)):
+        cmd_logger.warning("terminate time expired {}s, start to kill".format(
+            _g_terminate_timeout_second))
+    if (process.returncode is None):
+        # not reaped yet, so its pid still names the group: kill what is
+        # left of the group, e.g. the children of a shell that already exited
+        _signal_process_group(process, signal.SIGKILL)
+    process.wait()
+    return None
+
+
+def _log_cmd_result(cmd_logger, cmd: str, stdout_str: str, stderr_str: str,
+                    ret_code: int, is_debug=False):
+    """log the result of a finished command
+
+    Args:
+        cmd_logger (logging.Logger): logger of the handler
+        cmd (str): shell command
+        stdout_str (str): decoded stdout
+        stderr_str (str): decoded stderr
+        ret_code (int): return code
+        is_debug (bool, optional): print the output. Defaults to False.
+    """
+    if ret_code == 0:
+        if (is_debug and len(stdout_str) != 0):
+            cmd_logger.info("run successful: {}\noutput: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                stdout_str))
+        else:
+            cmd_logger.info("run successful: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+    else:
+        # if error, print the error info
+        if (len(stderr_str) == 0):
+            cmd_logger.error("run failed: {}\nret: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                ret_code))
+        else:
+            cmd_logger.error("run failed: {}\nerror: {}\nret: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                stderr_str, ret_code))
     return None
 
+
 def set_stdout_stderr_non_block(process: subprocess.Popen):
         """set stdout and stderr of a process
 
@@ -135,6 +577,361 @@ def set_stdout_stderr_non_block(process: subprocess.Popen):
         return None
 
 
+class CapturedOutput():
+    def __init__(self, max_mem_size=_g_capture_mem_size,
+                 preview_size=_g_capture_preview_size):
+        """output buffer of a command, keep at most max_mem_size bytes in memory,
+        spill the whole output to a temp file beyond that and only keep a
+        head/tail preview in memory
+
+        Args:
+            max_mem_size (int, optional): max in-memory size. Defaults to _g_capture_mem_size.
+            preview_size (int, optional): size of head/tail preview. Defaults to _g_capture_preview_size.
+        """
+        self._max_mem_size = max_mem_size
+        self._preview_size = preview_size
+        self._mem_buf = bytearray()
+        self._spill_file = None
+        self._mmap = None
+        self._head = b""
+        self._tail = bytearray()
+        self._text = None
+        self.size = 0
+
+    def extend(self, data: bytes):
+        self.size += len(data)
+        if (self._spill_file is None):
+            if (len(self._mem_buf) + len(data) <= self._max_mem_size):
+                self._mem_buf.extend(data)
+                return None
+            self._spill_file = tempfile.TemporaryFile(prefix="cmd_spill_",
+                                                      dir=_g_spill_dir)
+            self._spill_file.write(self._mem_buf)
+            self._head = bytes(self._mem_buf[:self._preview_size])
+            self._tail = self._mem_buf
+            self._mem_buf = bytearray()
+        self._spill_file.write(data)
+        self._tail.extend(data[-self._preview_size:])
+        del self._tail[:-self._preview_size]
+        return None
+
+    @property
+    def is_spilled(self):
+        return self._spill_file is not None
+
+    @property
+    def head(self):
+        if (self._spill_file is None):
+            return bytes(self._mem_buf[:self._preview_size])
+        return self._head
+
+    @property
+    def tail(self):
+        if (self._spill_file is None):
+            return bytes(self._mem_buf[-self._preview_size:])
+        return bytes(self._tail)
+
+    def view(self):
+        """raw output without copy
+
+        Returns:
+            view: memoryview of the memory buffer or mmap of the spilled file
+        """
+        if (self._spill_file is None):
+            return memoryview(self._mem_buf)
+        if (self._mmap is None):
+            self._spill_file.flush()
+            self._mmap = mmap.mmap(self._spill_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @property
+    def text(self):
+        """decoded and stripped output, decoded once on first access"""
+        if (self._text is None):
+            self._text = str(self.view(), common_tool._g_encode_fmt,
+                             errors="replace").strip()
+        return self._text
+
+    def iter_lines(self):
+        """iterate the output line by line without decoding it all
+
+        Yields:
+            line: decoded line without the line break
+        """
+        raw_view = self.view()
+        start_pos = 0
+        while start_pos < self.size:
+            end_pos = raw_view.find(b"\n", start_pos) if self.is_spilled else \
+                self._mem_buf.find(b"\n", start_pos)
+            if (end_pos == -1):
+                end_pos = self.size
+            yield str(raw_view[start_pos:end_pos], common_tool._g_encode_fmt,
+                      errors="replace")
+            start_pos = end_pos + 1
+
+    def preview(self):
+        """short text for logging, the omitted part is not decoded"""
+        if (self._spill_file is None):
+            return self.text
+        return "{}\n... ({} bytes omitted) ...\n{}".format(
+            self._head.decode(common_tool._g_encode_fmt, errors="replace"),
+            self.size - len(self._head) - len(self._tail),
+            self._tail.decode(common_tool._g_encode_fmt, errors="replace"))
+
+    def close(self):
+        if (self._mmap is not None):
+            self._mmap.close()
+            self._mmap = None
+        if (self._spill_file is not None):
+            self._spill_file.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+
+class CmdOutputStream():
+    STDOUT = "stdout"
+    STDERR = "stderr"
+
+    def __init__(self, handler: "CmdHandler", cmd: str,
+                 process: subprocess.Popen = None, timeout=0,
+                 job_id: int = 0):
+        """lines of a running command, iterate it to get (stream_name, line)
+        as they arrive, ret_code is set when the iteration finishes
+
+        Args:
+            handler (CmdHandler): handler of the command
+            cmd (str): shell command
+            process (subprocess.Popen, optional): running process, None for dry run. Defaults to None.
+            timeout (int, optional): timeout val, > timeout, exit. Defaults to 0.
+            job_id (int, optional): job id of the process in the registry. Defaults to 0.
+        """
+        self._handler = handler
+        self._cmd = cmd
+        self._process = process
+        self._timeout = timeout
+        self._job_id = job_id
+        self.ret_code = 0 if process is None else None
+
+    def __iter__(self):
+        if (self._process is None):
+            return
+        process = self._process
+        fd_name_map = {
+            process.stdout.fileno(): CmdOutputStream.STDOUT,
+            process.stderr.fileno(): CmdOutputStream.STDERR
+        }
+        partial_map = {fd: bytearray() for fd in fd_name_map}
+        poller = select.poll()
+        for fd in fd_name_map:
+            poller.register(fd, select.POLLIN)
+        deadline = time.monotonic() + self._timeout if self._timeout > 0 else None
+
+        try:
+            # read in the caller thread, a slow consumer throttles the command
+            # through the pipe instead of growing a buffer
+            while len(partial_map) != 0:
+                wait_ms = None
+                if (deadline is not None):
+                    wait_ms = max(0, int((deadline - time.monotonic()) * 1000))
+                events = poller.poll(wait_ms)
+                # checked whatever poll returned, a chatty command never idles
+                if (deadline is not None and time.monotonic() >= deadline):
+                    self._handler.logger.error("command execution timed out")
+                    self.ret_code = errno.ETIMEDOUT
+                    _stop_process(process, self._handler.logger)
+                    return
+                for fd, _ in events:
+                    data = os.read(fd, _g_read_chunk_size)
+                    partial_buf = partial_map[fd]
+                    if (len(data) == 0):
+                        poller.unregister(fd)
+                        del partial_map[fd]
+                        if (len(partial_buf) != 0):
+                            yield fd_name_map[fd], partial_buf.decode(
+                                common_tool._g_encode_fmt, errors="replace")
+                        continue
+                    partial_buf.extend(data)
+                    line_list = partial_buf.split(b"\n")
+                    partial_buf[:] = line_list.pop()
+                    for line in line_list:
+                        yield fd_name_map[fd], line.decode(common_tool._g_encode_fmt,
+                                                          errors="replace")
+            self.ret_code = process.wait()
+            with self._handler.print_lock:
+                _log_cmd_result(self._handler.logger, self._cmd, "", "",
+                                self.ret_code)
+        finally:
+            if (process.returncode is None):
+                # the consumer stops early
+                _stop_process(process, self._handler.logger)
+                if (self.ret_code is None):
+                    self.ret_code = process.returncode
+            process.stdout.close()
+            process.stderr.close()
+            _unregister_job(self._job_id)
+
+
+class _CmdResultCache():
+    def __init__(self, max_entry=_g_cmd_cache_max_entry):
+        """LRU cache of successful command results with a per-entry TTL
+
+        Args:
+            max_entry (int, optional): max number of entries. Defaults to _g_cmd_cache_max_entry.
+        """
+        self._lock = threading.Lock()
+        self._max_entry = max_entry
+        self._entry_map = collections.OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @staticmethod
+    def make_key(cmd: str, cache_file_list: List[str] = None):
+        """key of a command, with the mtime/size of the files its output
+        depends on, so a changed file misses the cache
+        """
+        file_key_list = []
+        for file_path in (cache_file_list or []):
+            try:
+                file_stat = os.stat(file_path)
+                file_key_list.append((file_path, file_stat.st_mtime_ns, file_stat.st_size))
+            except OSError:
+                file_key_list.append((file_path, None, None))
+        return (cmd, tuple(file_key_list))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entry_map.get(key)
+            if (entry is not None and entry[0] > time.monotonic()):
+                self._entry_map.move_to_end(key)
+                self.hit_count += 1
+                return entry[1]
+            if (entry is not None):
+                del self._entry_map[key]
+            self.miss_count += 1
+        return None
+
+    def put(self, key, ret_tuple: tuple, ttl: float):
+        with self._lock:
+            self._entry_map[key] = (time.monotonic() + ttl, ret_tuple)
+            self._entry_map.move_to_end(key)
+            while len(self._entry_map) > self._max_entry:
+                self._entry_map.popitem(last=False)
+        return None
+
+    def invalidate(self, cmd: str = None):
+        with self._lock:
+            if (cmd is None):
+                self._entry_map.clear()
+                return None
+            for key in [key for key in self._entry_map if key[0] == cmd]:
+                del self._entry_map[key]
+        return None
+
+
+_g_cmd_cache = _CmdResultCache()
+
+
+def invalidate_cmd_cache(cmd: str = None):
+    """drop cached command results
+
+    Args:
+        cmd (str, optional): command to drop, None drops all. Defaults to None.
+    """
+    _g_cmd_cache.invalidate(cmd)
+    return None
+
+
+class _BatchCtx():
+    def __init__(self):
+        """state shared by all commands of one run_many/map_shell batch
+        """
+        self._lock = threading.Lock()
+        self._process_set: Set[subprocess.Popen] = set()
+        self.is_cancelled = False
+
+    def add_process(self, process: subprocess.Popen):
+        """track a started process of this batch
+
+        Args:
+            process (subprocess.Popen): started process
+
+        Returns:
+            True: tracked
+            False: batch already cancelled, caller should stop the process
+        """
+        with self._lock:
+            if (self.is_cancelled):
+                return False
+            self._process_set.add(process)
+        return True
+
+    def remove_process(self, process: subprocess.Popen):
+        """stop tracking a process, the caller may reap it after
+
+        Args:
+            process (subprocess.Popen): tracked process
+        """
+        with self._lock:
+            self._process_set.discard(process)
+
+    def reap_process(self, process: subprocess.Popen):
+        """wait a tracked process to exit, then reap and untrack it at once,
+        so cancel never signals a reaped pid, which may name another group
+
+        Args:
+            process (subprocess.Popen): tracked process
+
+        Returns:
+            ret_code: return code
+        """
+        try:
+            # WNOWAIT leaves the child unreaped until the lock is held
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            pass
+        with self._lock:
+            self._process_set.discard(process)
+            return process.wait()
+
+    def cancel(self, is_terminate=True):
+        """cancel the batch, no new command will be started
+
+        Args:
+            is_terminate (bool, optional): terminate running process of the batch. Defaults to True.
+        """
+        with self._lock:
+            self.is_cancelled = True
+            process_list = list(self._process_set)
+            if (not is_terminate):
+                return None
+            # batch commands lead their own process groups, stop the whole
+            # trees (a shell may leave its child holding the output pipes),
+            # a tracked process is unreaped while the lock is held
+            for process in process_list:
+                _signal_process_group(process, signal.SIGTERM)
+        deadline = time.monotonic() + _g_terminate_timeout_second
+        for process in process_list:
+            _wait_process(process, max(deadline - time.monotonic(), 0))
+        with self._lock:
+            for process in process_list:
+                if (process not in self._process_set or process.returncode is not None):
+                    continue
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+        return None
+
+
 class CmdHandler():
     def __init__(self, handler_name: str = "cmd",
                  log_level=logger.G_LOG_LEVEL_DEBUG,
@@ -151,26 +948,329 @@ class CmdHandler():
                                         log_file_level=log_level,
                                         is_persist=is_persist)
         self.print_lock = threading.Lock()
+        self._exec_path_cache: Dict[str, str] = {}
 
     def run_shell(self, cmd: str, timeout=0,
                   is_dry_run=False,
                   is_debug=False,
-                  is_verbose=False):
+                  is_verbose=False,
+                  cache_ttl=0,
+                  cache_file_list: List[str] = None):
         """run a shell command
 
+        Args:
+            cmd (str): shell command
+            timeout (int, optional): timeout val, > timeout, stop the process group and
+                return errno.ETIMEDOUT with the partial output. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+            cache_ttl (int, optional): > 0, reuse a successful result of the same
+                idempotent command for cache_ttl seconds. Defaults to 0.
+            cache_file_list (List[str], optional): files the output depends on, the
+                cached result is dropped once one of them changes. Defaults to None.
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+        """
+        return self._run_cached(cmd, cache_ttl, cache_file_list, is_dry_run,
+                                lambda: self._run_shell(cmd=cmd, timeout=timeout,
+                                                        is_dry_run=is_dry_run,
+                                                        is_debug=is_debug,
+                                                        is_verbose=is_verbose))
+
+    def run_exec(self, argv: List[str], timeout=0,
+                 is_dry_run=False,
+                 is_debug=False,
+                 is_verbose=False,
+                 is_close_fds=True,
+                 cache_ttl=0,
+                 cache_file_list: List[str] = None):
+        """run a command without the shell, argv is passed to the program as is,
+        so no quoting is needed. The executable path is resolved once per
+        handler. Popen spawns with vfork, or with posix_spawn when
+        is_close_fds=False and no timeout is set (see bench.py for the latency).
+
+        Args:
+            argv (List[str]): program and its arguments
+            timeout (int, optional): timeout val, > timeout, stop the process group and
+                return errno.ETIMEDOUT with the partial output. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+            is_close_fds (bool, optional): close inheritable fds in the child. Defaults to True.
+            cache_ttl (int, optional): see run_shell. Defaults to 0.
+            cache_file_list (List[str], optional): see run_shell. Defaults to None.
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+        """
+        cmd = shlex.join(argv)
+        if (len(argv) == 0):
+            self.logger.error("argv is empty")
+            return None, None, errno.EINVAL
+
+        exec_path = self._exec_path_cache.get(argv[0])
+        if (exec_path is None and not is_dry_run):
+            exec_path = shutil.which(argv[0])
+            if (exec_path is None):
+                self.logger.error("cannot find executable: {}".format(
+                    common_tool.Color.set_text(argv[0], common_tool.Color.BLUE)))
+                return None, None, errno.ENOENT
+            self._exec_path_cache[argv[0]] = exec_path
+        return self._run_cached(cmd, cache_ttl, cache_file_list, is_dry_run,
+                                lambda: self._run_shell(cmd=cmd, timeout=timeout,
+                                                        is_dry_run=is_dry_run,
+                                                        is_debug=is_debug,
+                                                        is_verbose=is_verbose,
+                                                        argv=[exec_path] + list(argv[1:]),
+                                                        is_close_fds=is_close_fds))
+
+    def run_argv(self, argv: List[str], is_exec_mode=False,
+                 path_idx_list: List[int] = None,
+                 is_dry_run=False,
+                 is_debug=False,
+                 cache_ttl=0,
+                 cache_file_list: List[str] = None):
+        """run a command given in argv, each argument quoted for the shell by
+        default, without the shell (run_exec) with is_exec_mode, so an
+        argument is never split or expanded by the shell in either mode
+
+        Args:
+            argv (List[str]): program and its arguments
+            is_exec_mode (bool, optional): run without the shell. Defaults to False.
+            path_idx_list (List[int], optional): positions of the path arguments,
+                their "~" is expanded in both modes as the shell would. Defaults to None.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            cache_ttl (int, optional): see run_shell. Defaults to 0.
+            cache_file_list (List[str], optional): see run_shell. Defaults to None.
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+        """
+        argv = list(argv)
+        for arg_idx in (path_idx_list or []):
+            argv[arg_idx] = os.path.expanduser(argv[arg_idx])
+        if (is_exec_mode):
+            return self.run_exec(argv=argv, is_dry_run=is_dry_run, is_debug=is_debug,
+                                 cache_ttl=cache_ttl, cache_file_list=cache_file_list)
+        # a path with spaces or shell characters stays one literal argument
+        return self.run_shell(cmd=shlex.join(argv), is_dry_run=is_dry_run, is_debug=is_debug,
+                              cache_ttl=cache_ttl, cache_file_list=cache_file_list)
+
+    def run_shell_capture(self, cmd: str, timeout=0,
+                          is_dry_run=False,
+                          is_debug=False,
+                          max_mem_size=_g_capture_mem_size):
+        """run a shell command with huge output, the output beyond max_mem_size
+        is spilled to a temp file
+
+        Args:
+            cmd (str): shell command
+            timeout (int, optional): timeout val, > timeout, exit. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output preview after. Defaults to False.
+            max_mem_size (int, optional): max in-memory size of each output. Defaults to _g_capture_mem_size.
+
+        Returns:
+            stdout_buf: stdout in CapturedOutput, close it after use
+            stderr_buf: stderr in CapturedOutput, close it after use
+            ret_code: return code
+        """
+        return self._run_shell(cmd=cmd, timeout=timeout,
+                               is_dry_run=is_dry_run,
+                               is_debug=is_debug,
+                               capture_size=max(max_mem_size, 1))
+
+    def run_shell_iter(self, cmd: str, timeout=0,
+                       is_dry_run=False):
+        """run a shell command and stream its output line by line
+
+        Args:
+            cmd (str): shell command
+            timeout (int, optional): timeout val, > timeout, exit. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+
+        Returns:
+            output_stream: iterate it to get (stream_name, line), ret_code is
+                set after the iteration
+        """
+        if is_dry_run:
+            self.logger.info("DRY_RUN: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return CmdOutputStream(self, cmd)
+
+        if timeout < 0:
+            self.logger.error("timeout is invalid")
+            output_stream = CmdOutputStream(self, cmd)
+            output_stream.ret_code = -1
+            return output_stream
+
+        self.logger.info("run cmd: {}".format(
+            common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        group_kwargs = _popen_group_kwargs(timeout)
+        process = subprocess.Popen(cmd, shell=True,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   **group_kwargs)
+        job_id = _register_job(cmd, process.pid, len(group_kwargs) != 0)
+        return CmdOutputStream(self, cmd, process, timeout, job_id)
+
+    def map_shell(self, cmd_list: List[str], max_workers=4,
+                  timeout=0, batch_timeout=0,
+                  is_fail_fast=False,
+                  is_dry_run=False,
+                  is_debug=False,
+                  is_verbose=False):
+        """run a batch of shell commands in parallel, yield results as completed
+
+        Args:
+            cmd_list (List[str]): shell command list
+            max_workers (int, optional): max number of concurrent commands. Defaults to 4.
+            timeout (int, optional): timeout val of each command. Defaults to 0.
+            batch_timeout (int, optional): timeout val of the whole batch. Defaults to 0.
+            is_fail_fast (bool, optional): stop the batch at the first failure. Defaults to False.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+
+        Yields:
+            cmd_idx: index of the command in cmd_list
+            ret_tuple: (stdout_buf, stderr_buf, ret_code) of the command,
+                commands not started after cancel return errno.ECANCELED,
+                commands stopped by the batch timeout return errno.ETIMEDOUT
+        """
+        if (max_workers <= 0 or timeout < 0 or batch_timeout < 0):
+            self.logger.error("max_workers or timeout is invalid")
+            for cmd_idx in range(len(cmd_list)):
+                yield cmd_idx, (None, None, -1)
+            return
+
+        batch_ctx = _BatchCtx()
+        _g_running_batch_set_lock.acquire()
+        _g_running_batch_set.add(batch_ctx)
+        _g_running_batch_set_lock.release()
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(max_workers, max(len(cmd_list), 1)),
+            thread_name_prefix=self._handler_name)
+        future_map = {}
+        try:
+            for cmd_idx, cmd in enumerate(cmd_list):
+                future = executor.submit(self._run_shell, cmd, timeout,
+                                         is_dry_run, is_debug, is_verbose,
+                                         batch_ctx)
+                future_map[future] = cmd_idx
+
+            is_batch_timeout = False
+            done_future_list = []
+            try:
+                for future in concurrent.futures.as_completed(
+                    future_map, timeout=(batch_timeout if batch_timeout > 0 else None)):
+                    ret_tuple = future.result()
+                    cmd_idx = future_map.pop(future)
+                    if (is_fail_fast and ret_tuple[2] != 0 and
+                        not batch_ctx.is_cancelled):
+                        self.logger.error("fail fast, cancel the batch: {}".format(
+                            common_tool.Color.set_text(cmd_list[cmd_idx],
+                                                       common_tool.Color.BLUE)))
+                        batch_ctx.cancel()
+                    yield cmd_idx, ret_tuple
+            except concurrent.futures.TimeoutError:
+                is_batch_timeout = True
+                # finished before the cancel, but not yielded yet
+                done_future_list = [future for future in future_map if future.done()]
+
+            if (is_batch_timeout):
+                self.logger.error("batch timed out ({}s), cancel {} command(s)".format(
+                    batch_timeout, len(future_map) - len(done_future_list)))
+                batch_ctx.cancel()
+                concurrent.futures.wait(future_map)
+                for future in done_future_list:
+                    yield future_map.pop(future), future.result()
+                for future, cmd_idx in sorted(future_map.items(), key=lambda x: x[1]):
+                    yield cmd_idx, (None, None, errno.ETIMEDOUT)
+                future_map.clear()
+        finally:
+            if (len(future_map) != 0):
+                # consumer stops early, do not leave orphan commands
+                batch_ctx.cancel()
+            executor.shutdown(wait=True)
+            _g_running_batch_set_lock.acquire()
+            _g_running_batch_set.discard(batch_ctx)
+            _g_running_batch_set_lock.release()
+
+    def run_many(self, cmd_list: List[str], max_workers=4,
+                 timeout=0, batch_timeout=0,
+                 is_fail_fast=False,
+                 is_dry_run=False,
+                 is_debug=False,
+                 is_verbose=False):
+        """run a batch of shell commands in parallel, see map_shell
+
+        Returns:
+            ret_list: list of (stdout_buf, stderr_buf, ret_code) in the order of cmd_list
+        """
+        ret_list = [None] * len(cmd_list)
+        for cmd_idx, ret_tuple in self.map_shell(cmd_list=cmd_list,
+                                                 max_workers=max_workers,
+                                                 timeout=timeout,
+                                                 batch_timeout=batch_timeout,
+                                                 is_fail_fast=is_fail_fast,
+                                                 is_dry_run=is_dry_run,
+                                                 is_debug=is_debug,
+                                                 is_verbose=is_verbose):
+            ret_list[cmd_idx] = ret_tuple
+        return ret_list
+
+    def _run_cached(self, cmd: str, cache_ttl: float, cache_file_list: List[str],
+                    is_dry_run: bool, run_func: Callable):
+        if (cache_ttl <= 0 or is_dry_run):
+            return run_func()
+        cache_key = _g_cmd_cache.make_key(cmd, cache_file_list)
+        ret_tuple = _g_cmd_cache.get(cache_key)
+        if (ret_tuple is not None):
+            self.logger.debug("cache hit: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return ret_tuple
+        ret_tuple = run_func()
+        if (ret_tuple[2] == 0):
+            _g_cmd_cache.put(cache_key, ret_tuple, cache_ttl)
+        return ret_tuple
+
+    def _run_shell(self, cmd: str, timeout=0,
+                   is_dry_run=False,
+                   is_debug=False,
+                   is_verbose=False,
+                   batch_ctx: _BatchCtx = None,
+                   capture_size=0,
+                   argv: List[str] = None,
+                   is_close_fds=True):
+        """run a shell command, optionally as a member of a batch
+
         Args:
             cmd (str): shell command
             timeout (int, optional): timeout val, > timeout, exit. Defaults to 0.
             is_dry_run (bool, optional): only print command. Defaults to False.
             is_debug (bool, optional): print the output command after. Defaults to False.
             is_verbose (bool, optional): print output in real time. Defaults to False.
+            batch_ctx (_BatchCtx, optional): batch of this command. Defaults to None.
+            capture_size (int, optional): > 0, capture output in CapturedOutput. Defaults to 0.
+            argv (List[str], optional): run argv without the shell, cmd is only for logging. Defaults to None.
+            is_close_fds (bool, optional): close inheritable fds in the child. Defaults to True.
 
         Returns:
             stdout_buf: stdout buffer
             stderr_buf: stderr buffer
             ret_code: return code
         """
-        local_is_verbose = is_verbose
         if is_dry_run:
             self.logger.info("DRY_RUN: {}".format(
                 common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
@@ -180,72 +1280,693 @@ class CmdHandler():
             self.logger.error("timeout is invalid")
             return None, None, -1
 
-        if timeout > 0:
-            local_is_verbose = True
+        if (batch_ctx is not None and batch_ctx.is_cancelled):
+            return None, None, errno.ECANCELED
 
         self.logger.info("run cmd: {}".format(
             common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
-        process = subprocess.Popen(cmd, shell=True,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   universal_newlines=True)
+        if (batch_ctx is not None):
+            # the batch stops the whole group on cancel or batch timeout
+            group_kwargs = _new_process_group_kwargs()
+        else:
+            group_kwargs = _popen_group_kwargs(timeout)
+        try:
+            process = subprocess.Popen(cmd if argv is None else argv,
+                                       shell=(argv is None),
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       close_fds=is_close_fds,
+                                       **group_kwargs)
+        except OSError as os_err:
+            self.logger.error("run failed: {}\nerror: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE), str(os_err)))
+            return None, None, os_err.errno
         set_stdout_stderr_non_block(process)
-        stdout_buf = bytearray()
-        stderr_buf = bytearray()
-        output_reader = threading.Thread(target=output_reader_thd, args=(
-            process, stdout_buf, stderr_buf, local_is_verbose
-        ))
-        output_reader.start()
-
-        _g_running_subprocess_map_lock.acquire()
-        _g_running_subprocess_map[cmd] = process
-        _g_running_subprocess_map_lock.release()
-
-        if timeout > 0:
-            # with timeout, set is_verbose to True
-            start_time = time.time()
-            while process.poll() is None:
-                elapsed_time = time.time() - start_time
-                if elapsed_time > timeout:
-                    process.terminate()
-                    process.wait()
-                    output_reader.join()
-                    self.logger.error("command execution timed out")
-                    return None, None, errno.ETIMEDOUT
-                time.sleep(0.1)
+        if (capture_size > 0):
+            stdout_buf = CapturedOutput(max_mem_size=capture_size)
+            stderr_buf = CapturedOutput(max_mem_size=capture_size)
+        else:
+            stdout_buf = bytearray()
+            stderr_buf = bytearray()
+        output_reader = _g_io_reactor.register(process, stdout_buf, stderr_buf,
+                                               is_verbose)
+
+        job_id = _register_job(cmd, process.pid, len(group_kwargs) != 0)
+        if (batch_ctx is not None and not batch_ctx.add_process(process)):
+            _stop_process(process, self.logger)
+
+        is_timeout = False
+        if (timeout > 0 and not _wait_process(process, timeout)):
+            is_timeout = True
+            if (batch_ctx is not None):
+                # stopped and reaped here, the batch must not signal it after
+                batch_ctx.remove_process(process)
+            _stop_process(process, self.logger)
+            if (not output_reader.join(timeout=_g_terminate_timeout_second)):
+                # the pipe is held by an orphan outside the process group
+                _g_io_reactor.detach(output_reader)
 
         # wait shell finishing
-        ret_code = process.wait()
+        if (batch_ctx is not None):
+            ret_code = batch_ctx.reap_process(process)
+        else:
+            ret_code = process.wait()
         output_reader.join()
+        process.stdout.close()
+        process.stderr.close()
+        if (is_timeout):
+            self.logger.error("command execution timed out ({}s): {}".format(
+                timeout, common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            ret_code = errno.ETIMEDOUT
 
-        _g_running_subprocess_map_lock.acquire()
-        if (cmd in _g_running_subprocess_map):
-            del _g_running_subprocess_map[cmd]
-        _g_running_subprocess_map_lock.release()
-
-        self.print_lock.acquire()
-        if ret_code == 0:
-            if (is_debug and
-                len(stdout_buf.decode(common_tool._g_encode_fmt).strip()) != 0):
-                self.logger.info("run successful: {}\noutput: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    stdout_buf.decode(common_tool._g_encode_fmt).strip()))
-            else:
-                self.logger.info("run successful: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        _unregister_job(job_id)
+
+        if (capture_size > 0):
+            with self.print_lock:
+                _log_cmd_result(self.logger, cmd, stdout_buf.preview(),
+                                stderr_buf.preview(), ret_code, is_debug)
+            return (stdout_buf, stderr_buf, ret_code)
+
+        stdout_str = stdout_buf.decode(common_tool._g_encode_fmt).strip()
+        stderr_str = stderr_buf.decode(common_tool._g_encode_fmt).strip()
+        with self.print_lock:
+            _log_cmd_result(self.logger, cmd, stdout_str, stderr_str,
+                            ret_code, is_debug)
+        return (stdout_str, stderr_str, ret_code)
+
+
+class AsyncCmdHandler():
+    def __init__(self, handler_name: str = "cmd",
+                 log_level=logger.G_LOG_LEVEL_DEBUG,
+                 is_persist=False):
+        """init AsyncCmdHandler, all commands are driven by the running event loop
+
+        Args:
+            handler_name (str, optional): handler name. Defaults to "cmd".
+            log_level (log_level, optional): log level. Defaults to logger.G_LOG_LEVEL_DEBUG.
+            is_persist (bool, optional): persist log or not. Defaults to False.
+        """
+        self._handler_name = handler_name
+        self.logger = logger.get_logger(name=handler_name + "_async_cmd",
+                                        log_file_level=log_level,
+                                        is_persist=is_persist)
+
+    async def run_shell(self, cmd: str, timeout=0,
+                        is_dry_run=False,
+                        is_debug=False,
+                        is_verbose=False):
+        """run a shell command in the event loop
+
+        Args:
+            cmd (str): shell command
+            timeout (int, optional): timeout val, > timeout, exit. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+        """
+        if is_dry_run:
+            self.logger.info("DRY_RUN: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return None, None, 0
+
+        if timeout < 0:
+            self.logger.error("timeout is invalid")
+            return None, None, -1
+
+        self.logger.info("run cmd: {}".format(
+            common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        _set_pidfd_child_watcher()
+        # always its own group, a cancelled task stops the whole command tree,
+        # otherwise a grandchild keeps the pipes (and process.wait()) open
+        process = await asyncio.create_subprocess_shell(
+            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            **_new_process_group_kwargs())
+        job_id = _register_job(cmd, process.pid, True)
+        stdout_buf = bytearray()
+        stderr_buf = bytearray()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(self._read_stream(process.stdout, stdout_buf, is_verbose),
+                               self._read_stream(process.stderr, stderr_buf, is_verbose),
+                               process.wait()),
+                timeout=(timeout if timeout > 0 else None))
+        except asyncio.TimeoutError:
+            # keep the partial output, with what was left in the pipes
+            stdout_data, stderr_data = await self._stop_process(process)
+            stdout_buf.extend(stdout_data)
+            stderr_buf.extend(stderr_data)
+            self.logger.error("command execution timed out ({}s): {}".format(
+                timeout, common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            ret_code = errno.ETIMEDOUT
+        except asyncio.CancelledError:
+            # e.g., ctrl+c stops the loop, do not leave the child behind
+            await self._stop_process(process)
+            raise
         else:
-            # if error, print the error info
-            if (len(stderr_buf.decode(common_tool._g_encode_fmt).strip()) == 0):
-                self.logger.error("run failed: {}\nret: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    ret_code))
+            ret_code = process.returncode
+        finally:
+            _unregister_job(job_id)
+
+        # partial output may end inside a character
+        stdout_str = stdout_buf.decode(common_tool._g_encode_fmt, errors="replace").strip()
+        stderr_str = stderr_buf.decode(common_tool._g_encode_fmt, errors="replace").strip()
+        _log_cmd_result(self.logger, cmd, stdout_str, stderr_str,
+                        ret_code, is_debug)
+        return (stdout_str, stderr_str, ret_code)
+
+    async def run_many(self, cmd_list: List[str], max_concurrency=256,
+                       timeout=0,
+                       is_dry_run=False,
+                       is_debug=False,
+                       is_verbose=False):
+        """run a batch of shell commands concurrently in the event loop
+
+        Args:
+            cmd_list (List[str]): shell command list
+            max_concurrency (int, optional): max number of running commands. Defaults to 256.
+            timeout (int, optional): timeout val of each command. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+
+        Returns:
+            ret_list: list of (stdout_buf, stderr_buf, ret_code) in the order of cmd_list
+        """
+        if (max_concurrency <= 0):
+            self.logger.error("max_concurrency is invalid")
+            return [(None, None, -1)] * len(cmd_list)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(cmd: str):
+            async with semaphore:
+                return await self.run_shell(cmd=cmd, timeout=timeout,
+                                            is_dry_run=is_dry_run,
+                                            is_debug=is_debug,
+                                            is_verbose=is_verbose)
+
+        return list(await asyncio.gather(*[run_one(cmd) for cmd in cmd_list]))
+
+    async def _read_stream(self, stream: asyncio.StreamReader, buf: bytearray,
+                           is_verbose=False):
+        while True:
+            data = await stream.read(65536)
+            if (len(data) == 0):
+                break
+            if (is_verbose):
+                print(data.decode(common_tool._g_encode_fmt, errors="replace"),
+                      end="", flush=True)
+            buf.extend(data)
+        return None
+
+    async def _stop_process(self, process: asyncio.subprocess.Process):
+        """stop the process group, then read the pipes to EOF
+
+        Returns:
+            stdout_data: bytes left in the stdout pipe
+            stderr_data: bytes left in the stderr pipe
+        """
+        if (process.returncode is not None):
+            return b"", b""
+        _signal_process_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(),
+                                   timeout=_g_terminate_timeout_second)
+        except asyncio.TimeoutError:
+            self.logger.warning("terminate time expired {}s, start to kill".format(
+                _g_terminate_timeout_second))
+            _signal_process_group(process, signal.SIGKILL)
+            await process.wait()
+        # the readers were cancelled, read the pipes to EOF so the transport
+        # is closed in this loop rather than leaked
+        try:
+            stdout_data, stderr_data = await asyncio.wait_for(
+                asyncio.gather(process.stdout.read(), process.stderr.read()),
+                timeout=_g_terminate_timeout_second)
+        except asyncio.TimeoutError:
+            self.logger.warning("output pipes still open, a child left the process group")
+            return b"", b""
+        return stdout_data, stderr_data
+
+
+class ShellSession():
+    def __init__(self, handler_name: str = "session",
+                 log_level=logger.G_LOG_LEVEL_DEBUG,
+                 is_persist=False,
+                 shell_path=_g_session_shell_path,
+                 cmd_logger=None):
+        """init ShellSession, commands are sent to one long-lived shell instead
+        of spawning a new /bin/sh per command. The shell state (cwd, env
+        vars) is kept across commands, and a command calling exit restarts
+        the session.
+
+        Args:
+            handler_name (str, optional): handler name. Defaults to "session".
+            log_level (log_level, optional): log level. Defaults to logger.G_LOG_LEVEL_DEBUG.
+            is_persist (bool, optional): persist log or not. Defaults to False.
+            shell_path (str, optional): shell of the session. Defaults to _g_session_shell_path.
+            cmd_logger (logging.Logger, optional): shared logger, e.g., of a pool. Defaults to None.
+        """
+        self._handler_name = handler_name
+        self._shell_path = shell_path
+        if (cmd_logger is None):
+            cmd_logger = logger.get_logger(name=handler_name + "_session",
+                                           log_file_level=log_level,
+                                           is_persist=is_persist)
+        self.logger = cmd_logger
+        self.print_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._process: subprocess.Popen = None
+        self._job_id = 0
+        self._sentinel = "__my_py_session_{}__".format(uuid.uuid4().hex).encode(
+            common_tool._g_encode_fmt)
+
+    def run_shell(self, cmd: str, timeout=0,
+                  is_dry_run=False,
+                  is_debug=False,
+                  is_verbose=False):
+        """run a shell command in the session
+
+        Args:
+            cmd (str): shell command
+            timeout (int, optional): timeout val, > timeout, restart the session and
+                return errno.ETIMEDOUT with the partial output. Defaults to 0.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+            is_verbose (bool, optional): print output in real time. Defaults to False.
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+        """
+        if is_dry_run:
+            self.logger.info("DRY_RUN: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return None, None, 0
+
+        if timeout < 0:
+            self.logger.error("timeout is invalid")
+            return None, None, -1
+
+        self.logger.info("run cmd: {}".format(
+            common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        with self._lock:
+            stdout_buf, stderr_buf, ret_code = self._run_in_session(cmd, timeout,
+                                                                    is_verbose)
+
+        stdout_str = stdout_buf.decode(common_tool._g_encode_fmt).strip()
+        stderr_str = stderr_buf.decode(common_tool._g_encode_fmt).strip()
+        if (ret_code == errno.ETIMEDOUT):
+            self.logger.error("command execution timed out ({}s): {}".format(
+                timeout, common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        with self.print_lock:
+            _log_cmd_result(self.logger, cmd, stdout_str, stderr_str,
+                            ret_code, is_debug)
+        return (stdout_str, stderr_str, ret_code)
+
+    def close(self):
+        """stop the session shell"""
+        with self._lock:
+            self._stop_session()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _start_session(self):
+        self._process = subprocess.Popen([self._shell_path, "--noprofile", "--norc"],
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE,
+                                         **_new_process_group_kwargs())
+        set_stdout_stderr_non_block(self._process)
+        self._job_id = _register_job("{} session".format(self._handler_name),
+                                     self._process.pid, True)
+        return None
+
+    def _stop_session(self):
+        if (self._process is None):
+            return None
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        _stop_process(self._process, self.logger)
+        self._process.stdout.close()
+        self._process.stderr.close()
+        _unregister_job(self._job_id)
+        self._process = None
+        return None
+
+    def _run_in_session(self, cmd: str, timeout=0, is_verbose=False):
+        if (self._process is None or self._process.poll() is not None):
+            self._stop_session()
+            self._start_session()
+        process = self._process
+
+        # eval keeps a syntax error inside the command, the sentinels mark the
+        # end of the output and carry the exit status
+        script = "eval {} </dev/null\nprintf '\\n%s %d\\n' {} $?\n" \
+            "printf '\\n%s\\n' {} >&2\n".format(
+                shlex.quote(cmd),
+                self._sentinel.decode(common_tool._g_encode_fmt),
+                self._sentinel.decode(common_tool._g_encode_fmt))
+        try:
+            process.stdin.write(script.encode(common_tool._g_encode_fmt))
+            process.stdin.flush()
+        except BrokenPipeError:
+            self._stop_session()
+            return bytearray(), bytearray(), errno.EPIPE
+
+        stdout_fd = process.stdout.fileno()
+        stderr_fd = process.stderr.fileno()
+        buf_map = {stdout_fd: bytearray(), stderr_fd: bytearray()}
+        done_map = {stdout_fd: False, stderr_fd: False}
+        verbose_pos_map = {stdout_fd: 0, stderr_fd: 0}
+        marker = b"\n" + self._sentinel
+        poller = select.poll()
+        poller.register(stdout_fd, select.POLLIN)
+        poller.register(stderr_fd, select.POLLIN)
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+
+        while not (done_map[stdout_fd] and done_map[stderr_fd]):
+            wait_ms = None
+            if (deadline is not None):
+                wait_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            events = poller.poll(wait_ms)
+            # checked whatever poll returned, a chatty command never idles
+            if (deadline is not None and time.monotonic() >= deadline):
+                self._stop_session()
+                return buf_map[stdout_fd], buf_map[stderr_fd], errno.ETIMEDOUT
+            for fd, _ in events:
+                try:
+                    data = os.read(fd, _g_read_chunk_size)
+                except BlockingIOError:
+                    continue
+                if (len(data) == 0):
+                    # the command exits the shell
+                    ret_code = process.wait()
+                    self._stop_session()
+                    return buf_map[stdout_fd], buf_map[stderr_fd], ret_code
+                buf = buf_map[fd]
+                buf.extend(data)
+                if (fd == stdout_fd):
+                    marker_pos = buf.find(marker)
+                    done_map[fd] = marker_pos != -1 and buf.endswith(b"\n")
+                else:
+                    marker_pos = buf.find(marker)
+                    done_map[fd] = buf.endswith(marker + b"\n")
+                if (is_verbose):
+                    # keep back a possible partial marker
+                    end_pos = marker_pos if marker_pos != -1 else \
+                        max(verbose_pos_map[fd], len(buf) - len(marker))
+                    print(buf[verbose_pos_map[fd]:end_pos].decode(
+                        common_tool._g_encode_fmt, errors="replace"), end="", flush=True)
+                    verbose_pos_map[fd] = end_pos
+
+        stdout_buf = buf_map[stdout_fd]
+        stderr_buf = buf_map[stderr_fd]
+        marker_pos = stdout_buf.find(marker)
+        ret_code = int(stdout_buf[marker_pos + len(marker):].strip())
+        del stdout_buf[marker_pos:]
+        del stderr_buf[stderr_buf.find(marker):]
+        return stdout_buf, stderr_buf, ret_code
+
+
+class ShellSessionPool():
+    def __init__(self, pool_size=4, handler_name: str = "session",
+                 log_level=logger.G_LOG_LEVEL_DEBUG,
+                 is_persist=False,
+                 shell_path=_g_session_shell_path):
+        """init ShellSessionPool, a pool of ShellSession shared across threads,
+        each command borrows one idle session
+
+        Args:
+            pool_size (int, optional): number of sessions. Defaults to 4.
+            handler_name (str, optional): handler name. Defaults to "session".
+            log_level (log_level, optional): log level. Defaults to logger.G_LOG_LEVEL_DEBUG.
+            is_persist (bool, optional): persist log or not. Defaults to False.
+            shell_path (str, optional): shell of the sessions. Defaults to _g_session_shell_path.
+        """
+        self._session_list = []
+        self._idle_queue = queue.Queue()
+        pool_logger = logger.get_logger(name=handler_name + "_session",
+                                        log_file_level=log_level,
+                                        is_persist=is_persist)
+        for _ in range(max(pool_size, 1)):
+            session = ShellSession(handler_name=handler_name,
+                                   shell_path=shell_path,
+                                   cmd_logger=pool_logger)
+            self._session_list.append(session)
+            self._idle_queue.put(session)
+
+    def run_shell(self, cmd: str, timeout=0,
+                  is_dry_run=False,
+                  is_debug=False,
+                  is_verbose=False):
+        """run a shell command in an idle session, see ShellSession.run_shell
+        """
+        session = self._idle_queue.get()
+        try:
+            return session.run_shell(cmd=cmd, timeout=timeout,
+                                     is_dry_run=is_dry_run,
+                                     is_debug=is_debug,
+                                     is_verbose=is_verbose)
+        finally:
+            self._idle_queue.put(session)
+
+    def close(self):
+        """stop all the session shells"""
+        for session in self._session_list:
+            session.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _PipelineTask():
+    def __init__(self, name: str, cmd: str, func: Callable, dep_list: List[str],
+                 timeout=0):
+        self.name = name
+        self.cmd = cmd
+        self.func = func
+        self.dep_list = dep_list
+        self.timeout = timeout
+        self.child_list: List[str] = []
+        self.start_time = 0.0
+        self.end_time = 0.0
+
+
+class Pipeline():
+    def __init__(self, handler: CmdHandler = None, max_workers=4):
+        """init Pipeline, a DAG of tasks, a task runs once all its dependencies
+        succeed, independent branches run in parallel
+
+        Args:
+            handler (CmdHandler, optional): handler to run shell tasks. Defaults to None.
+            max_workers (int, optional): max number of concurrent tasks. Defaults to 4.
+        """
+        if (handler is None):
+            handler = CmdHandler(handler_name="pipeline")
+        self._handler = handler
+        self._max_workers = max_workers
+        self._task_map: Dict[str, _PipelineTask] = {}
+
+    def add_task(self, name: str, cmd: str = None, deps: List[str] = None,
+                 func: Callable = None, timeout=0):
+        """add a task, either a shell command or a python callable
+
+        Args:
+            name (str): unique task name
+            cmd (str, optional): shell command. Defaults to None.
+            deps (List[str], optional): names of the tasks it depends on. Defaults to None.
+            func (Callable, optional): callable returning ret_code or
+                (stdout_buf, stderr_buf, ret_code). Defaults to None.
+            timeout (int, optional): timeout val of the shell command. Defaults to 0.
+
+        Returns:
+            ret_code: return code
+        """
+        if (name in self._task_map):
+            self._handler.logger.error("task already exists: {}".format(name))
+            return errno.EEXIST
+        if ((cmd is None) == (func is None)):
+            self._handler.logger.error("task needs exactly one of cmd and func: {}".format(
+                name))
+            return errno.EINVAL
+        self._task_map[name] = _PipelineTask(name, cmd, func, list(deps or []),
+                                             timeout)
+        return 0
+
+    def run(self, is_dry_run=False, is_debug=False):
+        """run all the tasks, a failed task cancels its dependent tasks only
+
+        Args:
+            is_dry_run (bool, optional): only print the tasks. Defaults to False.
+            is_debug (bool, optional): print the output command after. Defaults to False.
+
+        Returns:
+            result_map: task name --> (stdout_buf, stderr_buf, ret_code), cancelled
+                tasks return errno.ECANCELED, None if the DAG is invalid
+            report: dict of "wall_time", "task_time" (task name --> second),
+                "critical_path" (task name list) and "critical_path_time"
+        """
+        topo_order = self._check_dag()
+        if (topo_order is None):
+            return None, None
+
+        for task in self._task_map.values():
+            task.child_list = []
+        for task in self._task_map.values():
+            for dep_name in task.dep_list:
+                self._task_map[dep_name].child_list.append(task.name)
+
+        result_map = {}
+        pending_dep_map = {name: len(task.dep_list) for name, task in self._task_map.items()}
+        ready_list = [name for name in topo_order if pending_dep_map[name] == 0]
+        start_time = time.monotonic()
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(self._max_workers, 1), thread_name_prefix="pipeline")
+        future_map = {}
+        try:
+            while len(ready_list) != 0 or len(future_map) != 0:
+                for name in ready_list:
+                    future = executor.submit(self._run_task, self._task_map[name],
+                                             is_dry_run, is_debug)
+                    future_map[future] = name
+                ready_list = []
+
+                done_set, _ = concurrent.futures.wait(
+                    future_map, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done_set:
+                    name = future_map.pop(future)
+                    result_map[name] = future.result()
+                    if (result_map[name][2] != 0):
+                        self._cancel_descendant(name, result_map)
+                        continue
+                    for child_name in self._task_map[name].child_list:
+                        pending_dep_map[child_name] -= 1
+                        if (pending_dep_map[child_name] == 0 and
+                            child_name not in result_map):
+                            ready_list.append(child_name)
+        finally:
+            executor.shutdown(wait=True)
+
+        report = self._build_report(topo_order, result_map,
+                                    time.monotonic() - start_time)
+        self._handler.logger.info("pipeline done in {:.3f}s, critical path ({:.3f}s): {}".format(
+            report["wall_time"], report["critical_path_time"],
+            " -> ".join(report["critical_path"])))
+        return result_map, report
+
+    def _check_dag(self):
+        """topological order of the tasks, None with unknown deps or a cycle"""
+        for task in self._task_map.values():
+            for dep_name in task.dep_list:
+                if (dep_name not in self._task_map):
+                    self._handler.logger.error("task {} depends on unknown task: {}".format(
+                        task.name, dep_name))
+                    return None
+
+        topo_order = []
+        pending_dep_map = {name: len(task.dep_list) for name, task in self._task_map.items()}
+        child_map = {name: [] for name in self._task_map}
+        for task in self._task_map.values():
+            for dep_name in task.dep_list:
+                child_map[dep_name].append(task.name)
+        ready_list = [name for name, dep_num in pending_dep_map.items() if dep_num == 0]
+        while len(ready_list) != 0:
+            name = ready_list.pop()
+            topo_order.append(name)
+            for child_name in child_map[name]:
+                pending_dep_map[child_name] -= 1
+                if (pending_dep_map[child_name] == 0):
+                    ready_list.append(child_name)
+        if (len(topo_order) != len(self._task_map)):
+            self._handler.logger.error("pipeline has a dependency cycle")
+            return None
+        return topo_order
+
+    def _run_task(self, task: _PipelineTask, is_dry_run: bool, is_debug: bool):
+        task.start_time = time.monotonic()
+        if (task.cmd is not None):
+            ret_tuple = self._handler.run_shell(cmd=task.cmd, timeout=task.timeout,
+                                                is_dry_run=is_dry_run,
+                                                is_debug=is_debug)
+        elif (is_dry_run):
+            self._handler.logger.info("DRY_RUN: {}".format(
+                common_tool.Color.set_text(task.name, common_tool.Color.BLUE)))
+            ret_tuple = (None, None, 0)
+        else:
+            try:
+                ret_val = task.func()
+            except Exception as e:
+                self._handler.logger.error("task {} raised: {}".format(task.name, str(e)))
+                ret_val = errno.EIO
+            if (isinstance(ret_val, tuple)):
+                ret_tuple = ret_val
             else:
-                self.logger.error("run failed: {}\nerror: {}\nret: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    stderr_buf.decode(common_tool._g_encode_fmt).strip(),
-                    ret_code))
-        self.print_lock.release()
-
-        return (stdout_buf.decode(common_tool._g_encode_fmt).strip(),
-                stderr_buf.decode(common_tool._g_encode_fmt).strip(),
-                ret_code)
\ No newline at end of file
+                ret_tuple = (None, None, ret_val if ret_val is not None else 0)
+        task.end_time = time.monotonic()
+        return ret_tuple
+
+    def _cancel_descendant(self, name: str, result_map: dict):
+        stack = list(self._task_map[name].child_list)
+        while len(stack) != 0:
+            child_name = stack.pop()
+            if (child_name in result_map):
+                continue
+            self._handler.logger.warning("cancel task {}, dependency {} failed".format(
+                child_name, name))
+            result_map[child_name] = (None, None, errno.ECANCELED)
+            self._task_map[child_name].start_time = 0.0
+            self._task_map[child_name].end_time = 0.0
+            stack.extend(self._task_map[child_name].child_list)
+        return None
+
+    def _build_report(self, topo_order: List[str], result_map: dict,
+                      wall_time: float):
+        # longest path weighted by the real task time, over the tasks that ran
+        task_time_map = {}
+        path_time_map = {}
+        prev_map = {}
+        for name in topo_order:
+            task = self._task_map[name]
+            task_time_map[name] = max(task.end_time - task.start_time, 0.0)
+            prev_name = None
+            for dep_name in task.dep_list:
+                if (prev_name is None or path_time_map[dep_name] > path_time_map[prev_name]):
+                    prev_name = dep_name
+            prev_map[name] = prev_name
+            path_time_map[name] = task_time_map[name] + \
+                (path_time_map[prev_name] if prev_name is not None else 0.0)
+
+        critical_path = []
+        if (len(path_time_map) != 0):
+            name = max(path_time_map, key=path_time_map.get)
+            critical_path_time = path_time_map[name]
+            while name is not None:
+                critical_path.append(name)
+                name = prev_map[name]
+            critical_path.reverse()
+        else:
+            critical_path_time = 0.0
+        return {
+            "wall_time": wall_time,
+            "task_time": task_time_map,
+            "critical_path": critical_path,
+            "critical_path_time": critical_path_time
+        }
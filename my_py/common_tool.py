@@ -4,7 +4,7 @@
 common tool library (native python3 lib)
 """
 
-import importlib
+import importlib.util
 
 from my_py import logger
 
@@ -28,7 +28,11 @@ class Color:
         return ("%s%s%s" % (color_opt, message, Color.RESET))
 
 def is_module_exist(module_name: str):
-    module_loader = importlib.find_loader(module_name)
-    if (module_loader is not None):
+    # find_spec does not import the module, find_loader is gone in 3.12
+    try:
+        module_spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return False
+    if (module_spec is not None):
         return True
     return False
\ No newline at end of file
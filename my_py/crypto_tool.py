@@ -6,33 +6,489 @@ simple crypto tool for encryption, decryption, and hashing
 
 from my_py import logger
 from my_py import cmd_handler
+from my_py import common_tool
 from my_py import os_util
 
 import errno
 import hashlib
+import os
+import mmap
+import concurrent.futures
+import sqlite3
+import stat
+import threading
+import time
+
+_g_has_aes_backend = common_tool.is_module_exist("cryptography")
+if (_g_has_aes_backend):
+    from cryptography.hazmat.primitives import ciphers as aes_cipher
+    from cryptography.hazmat.primitives import padding as aes_padding
 
 _g_mod_name = "crypto_tool"
 _g_is_dry_run = False
 _g_is_debug = False
+_g_is_exec_mode = False
 
 _g_logger = logger.get_logger(name=_g_mod_name)
 _g_cmd_handler = cmd_handler.CmdHandler(handler_name=_g_mod_name)
 
 _g_tmp_path = "/tmp"
+_g_hash_chunk_size = 1024 * 1024
+_g_hash_block_size = 64 * 1024 * 1024
+_g_hash_max_workers = 8
+_g_hash_cache = None
+_g_hash_cache_max_entry = 1000000
+_g_hash_cache_busy_timeout_ms = 10000
+# a file changed within this window may change again with the same mtime
+_g_hash_cache_racy_second = 2
+_g_hash_cache_touch_batch_size = 1024
+_g_aes_chunk_size = 1024 * 1024
+_g_aes_tree_batch_size = 64
+
+_G_AES_SALT_MAGIC = b"Salted__"
+_G_AES_SALT_SIZE = 8
+_G_AES_KEY_SIZE = 32
+_G_AES_IV_SIZE = 16
+
+_G_HASH_ALGO_LIST = [
+    "sha256",
+    "blake2b",
+    "sha1"
+]
+
+
+class HashCache:
+    '''
+    persistent digest cache keyed by (dev, inode, size, mtime_ns, algo) in
+    sqlite (WAL mode), shared by threads and processes, LRU eviction by the
+    last access time (written in batches, not per hit), the size is checked
+    every 1024 puts
+    '''
+    def __init__(self, db_path: str, max_entry=_g_hash_cache_max_entry):
+        self._db_path = os.path.expanduser(db_path)
+        self._max_entry = max_entry
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._put_count = 0
+        # cache key --> access time of the hits not written yet
+        self._touch_map = {}
+        self.hit_count = 0
+        self.miss_count = 0
+        db_conn = self._get_conn()
+        db_conn.execute("PRAGMA journal_mode=WAL")
+        db_conn.execute(
+            "CREATE TABLE IF NOT EXISTS hash_cache ("
+            "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, algo TEXT, "
+            "digest BLOB, access_time REAL, "
+            "PRIMARY KEY (dev, ino, size, mtime_ns, algo)) WITHOUT ROWID")
+        db_conn.execute("CREATE INDEX IF NOT EXISTS hash_cache_access "
+                        "ON hash_cache (access_time)")
+        db_conn.commit()
+
+    def _get_conn(self):
+        # one connection per thread, sqlite handles the cross-process locking
+        db_conn = getattr(self._local, "db_conn", None)
+        if (db_conn is None):
+            db_conn = sqlite3.connect(self._db_path,
+                                      timeout=_g_hash_cache_busy_timeout_ms / 1000)
+            db_conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.db_conn = db_conn
+        return db_conn
+
+    @staticmethod
+    def _make_key(file_stat: os.stat_result, algo: str):
+        return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+                file_stat.st_mtime_ns, algo)
+
+    def get(self, file_stat: os.stat_result, algo: str):
+        '''
+        Returns:
+            digest: raw digest bytes, None if missed
+        '''
+        db_conn = self._get_conn()
+        cache_key = HashCache._make_key(file_stat, algo)
+        row = db_conn.execute(
+            "SELECT digest FROM hash_cache WHERE dev=? AND ino=? AND size=? "
+            "AND mtime_ns=? AND algo=?", cache_key).fetchone()
+        with self._lock:
+            if (row is None):
+                self.miss_count += 1
+                return None
+            self.hit_count += 1
+            # no write per hit, the access times are updated in batches
+            self._touch_map[cache_key] = time.time()
+            is_flush = len(self._touch_map) >= _g_hash_cache_touch_batch_size
+        if (is_flush):
+            self.flush_access_time()
+        return row[0]
+
+    def flush_access_time(self):
+        '''
+        write the pending access times of the hits (used by the LRU eviction)
+        '''
+        with self._lock:
+            touch_map = self._touch_map
+            self._touch_map = {}
+        if (len(touch_map) == 0):
+            return None
+        db_conn = self._get_conn()
+        db_conn.executemany(
+            "UPDATE hash_cache SET access_time=? WHERE dev=? AND ino=? AND size=? "
+            "AND mtime_ns=? AND algo=?",
+            [(access_time,) + cache_key for cache_key, access_time in touch_map.items()])
+        db_conn.commit()
+        return None
+
+    def put(self, file_stat: os.stat_result, algo: str, digest: bytes):
+        if (time.time() - file_stat.st_mtime_ns / 1e9 < _g_hash_cache_racy_second):
+            return None
+        db_conn = self._get_conn()
+        db_conn.execute("INSERT OR REPLACE INTO hash_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        HashCache._make_key(file_stat, algo) + (digest, time.time()))
+        db_conn.commit()
+        with self._lock:
+            self._put_count += 1
+            is_check_size = self._put_count % 1024 == 0
+        if (is_check_size):
+            self.evict()
+        return None
+
+    def evict(self):
+        '''
+        drop the least recently used entries beyond max_entry
+        '''
+        self.flush_access_time()
+        db_conn = self._get_conn()
+        entry_num = db_conn.execute("SELECT COUNT(*) FROM hash_cache").fetchone()[0]
+        if (entry_num > self._max_entry):
+            db_conn.execute(
+                "DELETE FROM hash_cache WHERE (dev, ino, size, mtime_ns, algo) IN "
+                "(SELECT dev, ino, size, mtime_ns, algo FROM hash_cache "
+                "ORDER BY access_time LIMIT ?)", (entry_num - self._max_entry,))
+            db_conn.commit()
+        return None
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats: dict of "hit", "miss" (of this process) and "entry_num"
+        '''
+        entry_num = self._get_conn().execute(
+            "SELECT COUNT(*) FROM hash_cache").fetchone()[0]
+        return {"hit": self.hit_count, "miss": self.miss_count, "entry_num": entry_num}
+
+    def close(self):
+        try:
+            self.flush_access_time()
+        except sqlite3.Error as db_err:
+            _g_logger.warning("flush hash cache access time failed: {}".format(str(db_err)))
+        db_conn = getattr(self._local, "db_conn", None)
+        if (db_conn is not None):
+            db_conn.close()
+            self._local.db_conn = None
+        return None
 
 
 class Hasher:
     '''
-    Hasher sha256
+    Hasher sha256, blake2b, sha1 of in-memory data and files
     '''
     def cal_sha256_hash(in_data: str):
         sha256_hash = hashlib.sha256(in_data.encode()).hexdigest()
         return sha256_hash.encode()
 
+    @staticmethod
+    def hash_data(in_data, algo="sha256", is_hex=True):
+        '''
+        hash a bytes-like object (bytes, memoryview, mmap) without copying it
+
+        Args:
+            in_data: input data
+            algo: one of _G_HASH_ALGO_LIST
+            is_hex: return the hex str, else the raw digest bytes
+
+        Returns:
+            digest: hex str or bytes, None if failed
+        '''
+        if (algo not in _G_HASH_ALGO_LIST):
+            _g_logger.error("unsupported hash algo: {}".format(algo))
+            return None
+        hasher = hashlib.new(algo, in_data)
+        return hasher.hexdigest() if is_hex else hasher.digest()
+
+    @staticmethod
+    def set_hash_cache(hash_cache: HashCache):
+        '''
+        set the HashCache consulted by hash_file, None to disable it
+        '''
+        global _g_hash_cache
+        _g_hash_cache = hash_cache
+
+    @staticmethod
+    def hash_file(file_path: str, algo="sha256", is_hex=True, is_mmap=False,
+                  chunk_size=_g_hash_chunk_size, is_use_cache=True):
+        '''
+        hash a file without loading it into memory
+
+        Args:
+            file_path: input file path
+            algo: one of _G_HASH_ALGO_LIST
+            is_hex: return the hex str, else the raw digest bytes
+            is_mmap: hash a mmap of the file instead of reading chunks
+            chunk_size: read size of each chunk
+            is_use_cache: consult the HashCache set by set_hash_cache
+
+        Returns:
+            digest: hex str or bytes, None if failed
+        '''
+        if (algo not in _G_HASH_ALGO_LIST):
+            _g_logger.error("unsupported hash algo: {}".format(algo))
+            return None
+        hash_cache = _g_hash_cache if is_use_cache else None
+        hasher = hashlib.new(algo)
+        try:
+            with open(file_path, "rb", buffering=0) as in_file:
+                file_stat = os.fstat(in_file.fileno())
+                if (hash_cache is not None):
+                    try:
+                        digest = hash_cache.get(file_stat, algo)
+                    except sqlite3.Error as db_err:
+                        # a locked or broken cache is a miss
+                        _g_logger.warning("hash cache get failed: {}".format(str(db_err)))
+                        digest = None
+                    if (digest is not None):
+                        return digest.hex() if is_hex else digest
+                if (is_mmap and file_stat.st_size != 0):
+                    with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as in_map:
+                        in_map.madvise(mmap.MADV_SEQUENTIAL)
+                        hasher.update(in_map)
+                else:
+                    # reuse one buffer, hashlib releases the GIL on large updates
+                    read_buf = bytearray(chunk_size)
+                    read_view = memoryview(read_buf)
+                    while True:
+                        read_size = in_file.readinto(read_buf)
+                        if (not read_size):
+                            break
+                        hasher.update(read_view[:read_size])
+                # do not cache a file modified while being hashed
+                if (hash_cache is not None and
+                    HashCache._make_key(os.fstat(in_file.fileno()), algo) ==
+                    HashCache._make_key(file_stat, algo)):
+                    try:
+                        hash_cache.put(file_stat, algo, hasher.digest())
+                    except sqlite3.Error as db_err:
+                        _g_logger.warning("hash cache put failed: {}".format(str(db_err)))
+        except OSError as os_err:
+            _g_logger.error("hash file ({}) failed: {}".format(file_path, str(os_err)))
+            return None
+        return hasher.hexdigest() if is_hex else hasher.digest()
+
+    @staticmethod
+    def hash_files(file_path_list: list, algo="sha256", is_hex=True,
+                   max_workers=_g_hash_max_workers):
+        '''
+        hash many files in a thread pool
+
+        Args:
+            file_path_list: input file path list
+            algo: one of _G_HASH_ALGO_LIST
+            is_hex: return the hex str, else the raw digest bytes
+            max_workers: number of hash threads
+
+        Returns:
+            digest_map: file path --> digest, None for the failed files
+        '''
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            digest_list = executor.map(
+                lambda file_path: Hasher.hash_file(file_path, algo=algo, is_hex=is_hex),
+                file_path_list)
+            return dict(zip(file_path_list, digest_list))
+
+    @staticmethod
+    def hash_file_blocks(file_path: str, block_size=_g_hash_block_size,
+                         algo="sha256", is_hex=True,
+                         max_workers=_g_hash_max_workers):
+        '''
+        hash the fixed-size blocks of a huge file in parallel
+
+        Args:
+            file_path: input file path
+            block_size: size of each block, the last one may be shorter
+            algo: one of _G_HASH_ALGO_LIST
+            is_hex: return the hex str, else the raw digest bytes
+            max_workers: number of hash threads
+
+        Returns:
+            digest_list: digest of each block in file order, None if failed
+        '''
+        if (algo not in _G_HASH_ALGO_LIST or block_size <= 0):
+            _g_logger.error("unsupported hash algo ({}) or block size ({})".format(
+                algo, block_size))
+            return None
+
+        def hash_block(in_fd: int, offset: int):
+            hasher = hashlib.new(algo)
+            end_offset = offset + block_size
+            while offset < end_offset:
+                data = os.pread(in_fd, min(_g_hash_chunk_size, end_offset - offset),
+                                offset)
+                if (len(data) == 0):
+                    break
+                hasher.update(data)
+                offset += len(data)
+            return hasher.hexdigest() if is_hex else hasher.digest()
+
+        try:
+            in_fd = os.open(file_path, os.O_RDONLY)
+        except OSError as os_err:
+            _g_logger.error("hash file ({}) failed: {}".format(
+                file_path, os_util.translate_linux_err_code(os_err.errno)))
+            return None
+        try:
+            file_size = os.fstat(in_fd).st_size
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(lambda offset: hash_block(in_fd, offset),
+                                         range(0, max(file_size, 1), block_size)))
+        except OSError as os_err:
+            _g_logger.error("hash file ({}) failed: {}".format(
+                file_path, os_util.translate_linux_err_code(os_err.errno)))
+            return None
+        finally:
+            os.close(in_fd)
+
+
+class _AESEngine:
+    '''
+    in-process AES-256-CBC compatible with "openssl enc -aes-256-cbc -salt -k"
+    (openssl >= 1.1.0): "Salted__" + 8-byte salt + ciphertext, key and iv
+    from EVP_BytesToKey(sha256, 1 round), PKCS#7 padding
+    '''
+    @staticmethod
+    def derive_key_iv(key_data: bytes, salt: bytes):
+        derived_data = b""
+        prev_block = b""
+        while len(derived_data) < _G_AES_KEY_SIZE + _G_AES_IV_SIZE:
+            prev_block = hashlib.sha256(prev_block + key_data + salt).digest()
+            derived_data += prev_block
+        return (derived_data[:_G_AES_KEY_SIZE],
+                derived_data[_G_AES_KEY_SIZE:_G_AES_KEY_SIZE + _G_AES_IV_SIZE])
+
+    @staticmethod
+    def crypt_file(in_file_path: str, key_data: bytes, out_file_path: str,
+                   is_encrypt: bool, is_hash_plain=False):
+        '''
+        encrypt/decrypt a file in fixed-size chunks
+
+        Returns:
+            ret_code: return code
+            plain_digest: sha256 hex of the plaintext if is_hash_plain, else None
+        '''
+        plain_hasher = hashlib.sha256() if is_hash_plain else None
+        # write a temp file next to a regular (or new) output and rename it on
+        # success, the existing output is untouched when the crypt fails,
+        # others (symlinks, devices) are written in place
+        tmp_file_path = None
+        try:
+            out_stat = os.lstat(out_file_path)
+        except OSError:
+            out_stat = None
+        try:
+            in_file = open(in_file_path, "rb")
+        except OSError as os_err:
+            _g_logger.error("crypt file ({}) failed: {}".format(in_file_path, str(os_err)))
+            return os_err.errno, None
+        try:
+            if (out_stat is None or stat.S_ISREG(out_stat.st_mode)):
+                tmp_file_path = "{}.tmp-{}-{}".format(out_file_path, os.getpid(),
+                                                      threading.get_ident())
+                # created with 0o666 & ~umask like the output of openssl
+                out_fd = os.open(tmp_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                out_file = os.fdopen(out_fd, "wb")
+            else:
+                out_file = open(out_file_path, "wb")
+            with in_file, out_file:
+                if (is_encrypt):
+                    salt = os.urandom(_G_AES_SALT_SIZE)
+                    out_file.write(_G_AES_SALT_MAGIC + salt)
+                else:
+                    header = in_file.read(len(_G_AES_SALT_MAGIC) + _G_AES_SALT_SIZE)
+                    if (len(header) != len(_G_AES_SALT_MAGIC) + _G_AES_SALT_SIZE or
+                        not header.startswith(_G_AES_SALT_MAGIC)):
+                        raise ValueError("bad magic number")
+                    salt = header[len(_G_AES_SALT_MAGIC):]
+                key, iv = _AESEngine.derive_key_iv(key_data, salt)
+                cipher = aes_cipher.Cipher(aes_cipher.algorithms.AES(key),
+                                           aes_cipher.modes.CBC(iv))
+                if (is_encrypt):
+                    crypt_ctx = cipher.encryptor()
+                    pad_ctx = aes_padding.PKCS7(aes_cipher.algorithms.AES.block_size).padder()
+                else:
+                    crypt_ctx = cipher.decryptor()
+                    pad_ctx = aes_padding.PKCS7(aes_cipher.algorithms.AES.block_size).unpadder()
+
+                while True:
+                    data = in_file.read(_g_aes_chunk_size)
+                    if (len(data) == 0):
+                        break
+                    if (is_encrypt):
+                        if (plain_hasher is not None):
+                            plain_hasher.update(data)
+                        out_file.write(crypt_ctx.update(pad_ctx.update(data)))
+                    else:
+                        data = pad_ctx.update(crypt_ctx.update(data))
+                        if (plain_hasher is not None):
+                            plain_hasher.update(data)
+                        out_file.write(data)
+                if (is_encrypt):
+                    out_file.write(crypt_ctx.update(pad_ctx.finalize()) +
+                                   crypt_ctx.finalize())
+                else:
+                    data = pad_ctx.update(crypt_ctx.finalize()) + pad_ctx.finalize()
+                    if (plain_hasher is not None):
+                        plain_hasher.update(data)
+                    out_file.write(data)
+        except (OSError, ValueError) as crypt_err:
+            # ValueError: wrong key or corrupted input, like "bad decrypt" of openssl
+            ret = crypt_err.errno if isinstance(crypt_err, OSError) else errno.EBADMSG
+            _g_logger.error("crypt file ({}) failed: {}".format(in_file_path, str(crypt_err)))
+            if (tmp_file_path is not None and os.path.exists(tmp_file_path)):
+                os.unlink(tmp_file_path)
+            return ret, None
+        finally:
+            in_file.close()
+        if (tmp_file_path is not None):
+            try:
+                if (out_stat is not None):
+                    os.chmod(tmp_file_path, stat.S_IMODE(out_stat.st_mode))
+                os.replace(tmp_file_path, out_file_path)
+            except OSError as os_err:
+                _g_logger.error("crypt file ({}) failed: {}".format(in_file_path, str(os_err)))
+                os.unlink(tmp_file_path)
+                return os_err.errno, None
+        return 0, (plain_hasher.hexdigest() if plain_hasher is not None else None)
+
+
+def _crypt_file_list(job_list: list, key_data: bytes, is_encrypt: bool,
+                     is_hash_plain: bool):
+    '''
+    worker of AESCipher.encrypt_tree/decrypt_tree, run in a child process
+
+    Returns:
+        ret_list: list of (rel_path, ret_code, plain_digest)
+    '''
+    ret_list = []
+    for rel_path, in_file_path, out_file_path in job_list:
+        ret, plain_digest = AESCipher.crypt_file(in_file_path, key_data, out_file_path,
+                                                 is_encrypt, is_hash_plain)
+        ret_list.append((rel_path, ret, plain_digest))
+    return ret_list
+
 
 class AESCipher:
     '''
-    AES cipher for encryption/decryption
+    AES cipher for encryption/decryption, in-process when the cryptography
+    package is installed, else through openssl
     '''
     def encrypt_with_key(in_file_path: str, key_data: bytes, out_file_path: str):
         _g_logger.info("encrypt file: {}".format(in_file_path))
@@ -40,14 +496,8 @@ class AESCipher:
             _g_logger.error("input file cannot find")
             return errno.EEXIST
 
-        ret = 0
-        cmd = "openssl enc -aes-256-cbc" + " " + "-salt" + " " + \
-            "-in" + " " + in_file_path + " " + \
-            "-out" + " " + out_file_path + " " + \
-            "-k" + " " + key_data.decode()
-        _, _, ret = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
+        ret, _ = AESCipher.crypt_file(in_file_path, key_data, out_file_path,
+                                      is_encrypt=True)
         if (ret != 0):
             _g_logger.error("enc file ({}) failed: {}".format(
                 in_file_path, os_util.translate_linux_err_code(ret)))
@@ -60,16 +510,119 @@ class AESCipher:
             _g_logger.error("input file cannot find")
             return errno.EEXIST
 
-        ret = 0
-        cmd = "openssl enc -aes-256-cbc" + " " + "-d" + " " + \
-            "-in" + " " + in_file_path + " " + \
-            "-out" + " " + out_file_path + " " + \
-            "-k" + " " + key_data.decode()
-        _, _, ret = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
+        ret, _ = AESCipher.crypt_file(in_file_path, key_data, out_file_path,
+                                      is_encrypt=False)
         if (ret != 0):
             _g_logger.error("dec file ({}) failed: {}".format(
                 in_file_path, os_util.translate_linux_err_code(ret)))
             return ret
         return 0
+
+    @staticmethod
+    def crypt_file(in_file_path: str, key_data: bytes, out_file_path: str,
+                   is_encrypt: bool, is_hash_plain=False):
+        '''
+        encrypt/decrypt one file with the in-process engine or openssl
+
+        Args:
+            in_file_path: input file path
+            key_data: password
+            out_file_path: output file path
+            is_encrypt: encrypt or decrypt
+            is_hash_plain: also compute the sha256 of the plaintext
+
+        Returns:
+            ret_code: return code
+            plain_digest: sha256 hex of the plaintext if is_hash_plain, else None
+        '''
+        if (_g_has_aes_backend and not _g_is_dry_run):
+            return _AESEngine.crypt_file(os.path.expanduser(in_file_path), key_data,
+                                         os.path.expanduser(out_file_path),
+                                         is_encrypt, is_hash_plain)
+
+        argv = ["openssl", "enc", "-aes-256-cbc", "-salt" if is_encrypt else "-d",
+                "-in", in_file_path,
+                "-out", out_file_path,
+                "-k", key_data.decode()]
+        # only the paths get "~" expanded in exec mode, never the key
+        _, _, ret = _g_cmd_handler.run_argv(argv, is_exec_mode=_g_is_exec_mode,
+                                            path_idx_list=[5, 7],
+                                            is_dry_run=_g_is_dry_run,
+                                            is_debug=_g_is_debug)
+        if (ret != 0 or not is_hash_plain or _g_is_dry_run):
+            return ret, None
+        # no engine, read the plaintext once more
+        plain_digest = Hasher.hash_file(os.path.expanduser(
+            in_file_path if is_encrypt else out_file_path), is_use_cache=False)
+        return (0, plain_digest) if plain_digest is not None else (errno.EIO, None)
+
+    @staticmethod
+    def encrypt_tree(in_dir_path: str, key_data: bytes, out_dir_path: str,
+                     max_workers=None, is_hash_plain=False):
+        '''
+        encrypt all the files of a dir into out_dir_path (same layout) with a
+        process pool
+
+        Args:
+            in_dir_path: input dir
+            key_data: password
+            out_dir_path: output dir
+            max_workers: number of processes, None for the cpu number
+            is_hash_plain: compute the sha256 of each plaintext in the same read
+
+        Returns:
+            ret_code: 0, or the error code of the last failed file
+            digest_map: relative path --> plaintext sha256 hex (is_hash_plain)
+        '''
+        return AESCipher._crypt_tree(in_dir_path, key_data, out_dir_path, True,
+                                     max_workers, is_hash_plain)
+
+    @staticmethod
+    def decrypt_tree(in_dir_path: str, key_data: bytes, out_dir_path: str,
+                     max_workers=None, is_hash_plain=False):
+        '''
+        decrypt all the files of a dir into out_dir_path, see encrypt_tree
+        '''
+        return AESCipher._crypt_tree(in_dir_path, key_data, out_dir_path, False,
+                                     max_workers, is_hash_plain)
+
+    @staticmethod
+    def _crypt_tree(in_dir_path: str, key_data: bytes, out_dir_path: str,
+                    is_encrypt: bool, max_workers, is_hash_plain: bool):
+        in_dir_path = os.path.abspath(os.path.expanduser(in_dir_path))
+        out_dir_path = os.path.abspath(os.path.expanduser(out_dir_path))
+        _g_logger.info("{} tree: {} --> {}".format(
+            "encrypt" if is_encrypt else "decrypt", in_dir_path, out_dir_path))
+        if (not os.path.isdir(in_dir_path)):
+            _g_logger.error("input dir cannot find")
+            return errno.ENOENT, {}
+
+        # files are sent in batches, small files are dominated by the IPC
+        job_list = []
+        for dir_path, _, file_name_list in os.walk(in_dir_path):
+            out_sub_dir = os.path.join(out_dir_path, os.path.relpath(dir_path, in_dir_path))
+            if (not _g_is_dry_run):
+                os.makedirs(out_sub_dir, exist_ok=True)
+            for file_name in file_name_list:
+                in_file_path = os.path.join(dir_path, file_name)
+                job_list.append((os.path.relpath(in_file_path, in_dir_path),
+                                 in_file_path, os.path.join(out_sub_dir, file_name)))
+        batch_list = [job_list[start_idx:start_idx + _g_aes_tree_batch_size]
+                      for start_idx in range(0, len(job_list), _g_aes_tree_batch_size)]
+
+        ret_code = 0
+        digest_map = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            future_list = [executor.submit(_crypt_file_list, batch, key_data,
+                                           is_encrypt, is_hash_plain)
+                           for batch in batch_list]
+            for future in concurrent.futures.as_completed(future_list):
+                for rel_path, ret, plain_digest in future.result():
+                    if (ret != 0):
+                        _g_logger.error("{} file ({}) failed: {}".format(
+                            "enc" if is_encrypt else "dec", rel_path,
+                            os_util.translate_linux_err_code(ret)))
+                        ret_code = ret
+                    elif (is_hash_plain):
+                        digest_map[rel_path] = plain_digest
+        return ret_code, digest_map
@@ -39,9 +39,11 @@ def get_logger(name: str, level=G_LOG_LEVEL_DEBUG, is_persist: bool = False,
                log_file_level=G_LOG_LEVEL_DEBUG):
     ret_logger = logging.getLogger(name=name)
     ret_logger.setLevel(level=level)
-    colored_handler = ColorHandler()
-    colored_handler.setFormatter(logging.Formatter(_G_FMT_FULL))
-    ret_logger.addHandler(colored_handler)
+    # the same name may be asked for many times (e.g. one SSHCmd per command)
+    if (not any(isinstance(handler, ColorHandler) for handler in ret_logger.handlers)):
+        colored_handler = ColorHandler()
+        colored_handler.setFormatter(logging.Formatter(_G_FMT_FULL))
+        ret_logger.addHandler(colored_handler)
 
     if (is_persist):
         file_handler = logging.FileHandler(name + ".log", encoding="utf-8", mode="w")
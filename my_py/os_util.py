@@ -7,14 +7,37 @@ import errno
 import socket
 import json
 import sys
-from threading import Thread
+import glob
+import shutil
+import stat
+import tempfile
+import types
+import copy
+import concurrent.futures
+from threading import Event, Lock, Thread
 
 from my_py import cmd_handler
+from my_py import common_tool
 from my_py import logger
 
 _g_mod_name = "os_util"
 _g_is_dry_run = False
 _g_is_debug = False
+_g_is_exec_mode = False
+_g_probe_cache_ttl = 300
+_g_fs_argv_chunk_size = 512
+_g_fs_max_workers = 8
+_g_fs_copy_batch_size = 256
+_g_fs_copy_chunk_size = 64 * 1024 * 1024
+# stat interval of the config watcher, also its wakeup with inotify
+_g_config_poll_second = 1.0
+
+_g_has_orjson = common_tool.is_module_exist("orjson")
+if (_g_has_orjson):
+    import orjson
+_g_has_inotify = common_tool.is_module_exist("inotify_simple")
+if (_g_has_inotify):
+    import inotify_simple
 
 _G_MY_PLATFORM_OS_ID_LIST = [
     "ubuntu",
@@ -44,10 +67,11 @@ def get_current_os_release():
             centos: 8
         err with None
     '''
-    cmd = "cat /etc/os-release"
-    output, error_output, returncode = _g_cmd_handler.run_shell(cmd=cmd,
-                                                                is_debug=_g_is_debug,
-                                                                is_dry_run=False)
+    # cached until the file changes, the probe is called in hot loops
+    output, error_output, returncode = _g_cmd_handler.run_argv(
+        ["cat", "/etc/os-release"], is_exec_mode=_g_is_exec_mode, path_idx_list=[1],
+        is_debug=_g_is_debug, cache_ttl=_g_probe_cache_ttl,
+        cache_file_list=["/etc/os-release"])
     os_info = {}
 
     if (returncode == 0):
@@ -97,6 +121,194 @@ class Network:
         return ip_address
 
 
+def _is_atomic_replace_ok(path: str):
+    '''
+    a rename over path keeps what the file was: an existing regular file
+    (not a symlink), one link, owned by us, no xattrs (ACLs), in a dir we
+    can write
+    '''
+    try:
+        path_stat = os.lstat(path)
+        if (not stat.S_ISREG(path_stat.st_mode) or path_stat.st_nlink != 1 or
+            path_stat.st_uid != os.geteuid() or path_stat.st_gid != os.getegid()):
+            return False
+        if (hasattr(os, "listxattr") and len(os.listxattr(path)) != 0):
+            return False
+    except OSError:
+        return False
+    return os.access(os.path.dirname(os.path.abspath(path)), os.W_OK | os.X_OK)
+
+
+def _expand_path(path: str):
+    '''
+    expand "~" and glob patterns like the shell, a pattern without matches
+    is kept as is
+    '''
+    path = os.path.expanduser(path)
+    if (any(magic_char in path for magic_char in "*?[")):
+        match_list = sorted(glob.glob(path))
+        if (len(match_list) != 0):
+            return match_list
+    return [path]
+
+
+def _fs_apply(op_name: str, path_list: list, op_func):
+    '''
+    apply a native file operation to a list of paths
+
+    Args:
+        op_name: operation name for logging
+        path_list: path list, "~" and glob patterns are expanded
+        op_func: func(path), raise OSError when failed
+
+    Returns:
+        ret_code: 0, or the error code of the last failed path
+    '''
+    if (_g_is_dry_run):
+        _g_logger.info("DRY_RUN: {} {}".format(op_name, " ".join(path_list)))
+        return 0
+    ret_code = 0
+    for path in path_list:
+        for match_path in _expand_path(path):
+            try:
+                op_func(match_path)
+            except OSError as os_err:
+                ret_code = os_err.errno if os_err.errno is not None else errno.EIO
+                _g_logger.error("{} ({}) failed: {}".format(
+                    op_name, match_path, translate_linux_err_code(ret_code)))
+    return ret_code
+
+
+def _scan_dir(dir_path: str, is_follow_link: bool, is_need_stat: bool):
+    '''
+    scan one dir, run in a worker thread (the syscalls release the GIL)
+
+    Returns:
+        dir_path: the scanned dir
+        entry_list: list of (name, is_dir, stat_result or None)
+        err: OSError, or None
+    '''
+    entry_list = []
+    try:
+        with os.scandir(dir_path) as dir_iter:
+            for dir_entry in dir_iter:
+                is_dir = dir_entry.is_dir(follow_symlinks=is_follow_link)
+                entry_stat = None
+                if (is_need_stat):
+                    entry_stat = dir_entry.stat(follow_symlinks=is_follow_link)
+                entry_list.append((dir_entry.name, is_dir, entry_stat))
+    except OSError as os_err:
+        return dir_path, entry_list, os_err
+    return dir_path, entry_list, None
+
+
+def _iter_tree(root_path: str, max_workers: int, is_follow_link=False,
+               is_need_stat=False):
+    '''
+    scan a tree with a thread pool, each dir is scanned by one task, the
+    sub-dirs are submitted as soon as their parent is scanned
+
+    Yields:
+        dir_path, entry_list, err of _scan_dir, in no particular order
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_set = {executor.submit(_scan_dir, root_path, is_follow_link,
+                                      is_need_stat)}
+        while len(future_set) != 0:
+            done_set, future_set = concurrent.futures.wait(
+                future_set, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done_set:
+                dir_path, entry_list, err = future.result()
+                for name, is_dir, _ in entry_list:
+                    if (is_dir):
+                        future_set.add(executor.submit(
+                            _scan_dir, os.path.join(dir_path, name),
+                            is_follow_link, is_need_stat))
+                yield dir_path, entry_list, err
+
+
+def _copy_file_data(src_fd: int, dst_fd: int, file_size: int):
+    '''
+    copy file data in the kernel, copy_file_range first (reflink on some fs),
+    then sendfile, then a buffered copy
+    '''
+    copied_size = 0
+    if (hasattr(os, "copy_file_range")):
+        try:
+            # stop at the stat size, saves the final zero-length call
+            while copied_size < file_size:
+                cur_size = os.copy_file_range(src_fd, dst_fd, _g_fs_copy_chunk_size)
+                if (cur_size == 0):
+                    return None
+                copied_size += cur_size
+            return None
+        except OSError as os_err:
+            if (copied_size != 0 or
+                os_err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                     errno.EOPNOTSUPP, errno.EPERM)):
+                raise
+    try:
+        while copied_size < file_size:
+            cur_size = os.sendfile(dst_fd, src_fd, copied_size,
+                                   _g_fs_copy_chunk_size)
+            if (cur_size == 0):
+                return None
+            copied_size += cur_size
+        return None
+    except OSError as os_err:
+        if (copied_size != 0 or os_err.errno not in (errno.EINVAL, errno.ENOSYS)):
+            raise
+    while True:
+        data = os.read(src_fd, 1024 * 1024)
+        if (len(data) == 0):
+            return None
+        os.write(dst_fd, data)
+
+
+def _copy_file_list(src_dir: str, dst_dir: str, entry_list: list):
+    '''
+    copy the files of one dir, keep the mode and the mtime, recreate symlinks
+
+    Returns:
+        file_num: number of copied files
+        byte_num: number of copied bytes
+        err_list: list of (path, OSError)
+    '''
+    file_num = 0
+    byte_num = 0
+    err_list = []
+    for name, entry_stat in entry_list:
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+        try:
+            if (stat.S_ISLNK(entry_stat.st_mode)):
+                if (os.path.lexists(dst_path)):
+                    os.unlink(dst_path)
+                os.symlink(os.readlink(src_path), dst_path)
+            elif (stat.S_ISREG(entry_stat.st_mode)):
+                src_fd = os.open(src_path, os.O_RDONLY)
+                try:
+                    dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                                     0o600)
+                    try:
+                        _copy_file_data(src_fd, dst_fd, entry_stat.st_size)
+                        os.fchmod(dst_fd, stat.S_IMODE(entry_stat.st_mode))
+                        os.utime(dst_fd, ns=(entry_stat.st_atime_ns,
+                                             entry_stat.st_mtime_ns))
+                    finally:
+                        os.close(dst_fd)
+                finally:
+                    os.close(src_fd)
+                byte_num += entry_stat.st_size
+            else:
+                # skip fifo, socket and device files
+                continue
+            file_num += 1
+        except OSError as os_err:
+            err_list.append((src_path, os_err))
+    return file_num, byte_num, err_list
+
+
 class FS:
     @staticmethod
     def check_if_file_exist(path: str):
@@ -128,15 +340,35 @@ class FS:
         Returns:
             ret_code: return code, handle outside func
         """
-        ret_code = 0
+        return FS.mkdir_many([path], is_root=is_root)
+
+    @staticmethod
+    def mkdir_many(path_list: list, is_root=False):
+        """mkdir_p for a list of paths in one call
+
+        Args:
+            path_list (list): dir path list
+            is_root (bool, optional): need to use root?. Defaults to False.
+
+        Returns:
+            ret_code: 0, or the error code of the last failed path
+        """
         if (is_root):
-            cmd = "sudo mkdir -p" + " " + path
-        else:
-            cmd = "mkdir -p" + " " + path
-        _, _, ret_code = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
-        return ret_code
+            # only sudo needs the shell, one command per chunk of paths
+            ret_code = 0
+            for start_idx in range(0, len(path_list), _g_fs_argv_chunk_size):
+                argv = ["sudo", "mkdir", "-p"] + list(
+                    path_list[start_idx:start_idx + _g_fs_argv_chunk_size])
+                _, _, cur_ret = _g_cmd_handler.run_argv(
+                    argv, is_exec_mode=_g_is_exec_mode, path_idx_list=range(3, len(argv)),
+                    is_dry_run=_g_is_dry_run, is_debug=_g_is_debug)
+                if (cur_ret != 0):
+                    ret_code = cur_ret
+            return ret_code
+
+        def mkdir_one(path: str):
+            os.makedirs(path, exist_ok=True)
+        return _fs_apply("mkdir -p", path_list, mkdir_one)
 
     @staticmethod
     def change_file_mode(file_path: str, mode: str):
@@ -147,51 +379,262 @@ class FS:
             file_path: input file path
             mode: mode in str e.g., "600"
         '''
-        cmd = "chmod" + " " + mode + " " + file_path
-        _, _, ret = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
-        if (ret != 0):
-            _g_logger.error("change file ({}) mode failed: {}".format(
-                file_path,
-                translate_linux_err_code(ret)
-            ))
-            return ret
-        return ret
+        return FS.chmod_many([file_path], mode)
+
+    @staticmethod
+    def chmod_many(path_list: list, mode: str):
+        '''
+        change the mode of a list of files in one call
+
+        Args:
+            path_list: input file path list
+            mode: mode in str e.g., "600", a symbolic mode (e.g., "u+x") goes
+                through chmod
+
+        Returns:
+            ret_code: 0, or the error code of the last failed path
+        '''
+        try:
+            mode_val = int(mode, 8)
+        except ValueError:
+            ret_code = 0
+            for start_idx in range(0, len(path_list), _g_fs_argv_chunk_size):
+                argv = ["chmod", mode] + list(
+                    path_list[start_idx:start_idx + _g_fs_argv_chunk_size])
+                _, _, cur_ret = _g_cmd_handler.run_argv(
+                    argv, is_exec_mode=_g_is_exec_mode, path_idx_list=range(2, len(argv)),
+                    is_dry_run=_g_is_dry_run, is_debug=_g_is_debug)
+                if (cur_ret != 0):
+                    _g_logger.error("change file mode failed: {}".format(
+                        translate_linux_err_code(cur_ret)))
+                    ret_code = cur_ret
+            return ret_code
+
+        def chmod_one(path: str):
+            os.chmod(path, mode_val)
+        return _fs_apply("chmod " + mode, path_list, chmod_one)
 
     @staticmethod
     def rm_file(file_path: str):
-        cmd = "rm" + " " + "-rf" + " " + file_path
-        _, _, ret = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
-        if (ret != 0):
-            _g_logger.error("remove file ({}) failed: {}".format(
-                file_path,
-                translate_linux_err_code(ret)
-            ))
-            return ret
-        return ret
+        return FS.rm_many([file_path])
+
+    @staticmethod
+    def rm_many(path_list: list):
+        '''
+        rm -rf a list of paths in one call, missing paths are ignored
+
+        Args:
+            path_list: path list
+
+        Returns:
+            ret_code: 0, or the error code of the last failed path
+        '''
+        def rm_one(path: str):
+            try:
+                if (os.path.isdir(path) and not os.path.islink(path)):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return _fs_apply("rm -rf", path_list, rm_one)
 
     @staticmethod
     def write_str_to_file(input_data: str, file_path: str, is_append: bool):
-        ret = 0
-        if (is_append):
-            cmd = "echo" + " " + input_data + " " + ">>" + " " + \
-                file_path
-        else:
-            cmd = "echo" + " " + input_data + " " + ">" + " " + \
-                file_path
-        _, _, ret = _g_cmd_handler.run_shell(cmd=cmd,
-                                             is_dry_run=_g_is_dry_run,
-                                             is_debug=_g_is_debug)
-        if (ret != 0):
-            _g_logger.error("write str to file ({}) failed: {}".format(
-                file_path,
-                translate_linux_err_code(ret)
-            ))
-            return ret
-        return ret
+        '''
+        write a line to file (input_data + "\\n", as echo did), the data is
+        written as is. A rewrite of an existing regular file that a rename
+        keeps intact (see _is_atomic_replace_ok) replaces it atomically, other
+        targets (new files, symlinks, hardlinks, /proc, /sys, devices, fifos)
+        are truncated and written in place like "echo >" did
+
+        Args:
+            input_data: data to write
+            file_path: output file path
+            is_append: append to the file or rewrite it
+
+        Returns:
+            ret_code: return code
+        '''
+        def write_one(path: str):
+            out_data = (input_data + "\n").encode(common_tool._g_encode_fmt)
+            if (is_append or not _is_atomic_replace_ok(path)):
+                with open(path, "ab" if is_append else "wb") as out_file:
+                    out_file.write(out_data)
+                return None
+            # write a temp file in the same dir, then rename it over the target
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                                prefix=".tmp_")
+            try:
+                with os.fdopen(tmp_fd, "wb") as out_file:
+                    out_file.write(out_data)
+                shutil.copymode(path, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            return None
+        return _fs_apply("write" if not is_append else "append", [file_path], write_one)
+
+    @staticmethod
+    def walk(root_path: str, max_workers=_g_fs_max_workers, is_follow_link=False):
+        '''
+        walk a tree like os.walk, dirs are scanned in parallel
+
+        Args:
+            root_path: root dir
+            max_workers: number of scan threads
+            is_follow_link: follow symlinks to dirs
+
+        Yields:
+            dir_path, dir_name_list, file_name_list, in no particular order
+        '''
+        root_path = os.path.expanduser(root_path)
+        for dir_path, entry_list, err in _iter_tree(root_path, max_workers,
+                                                    is_follow_link):
+            if (err is not None):
+                _g_logger.error("scan dir ({}) failed: {}".format(
+                    dir_path, translate_linux_err_code(err.errno)))
+            yield (dir_path,
+                   [name for name, is_dir, _ in entry_list if is_dir],
+                   [name for name, is_dir, _ in entry_list if not is_dir])
+
+    @staticmethod
+    def disk_usage(path: str, max_workers=_g_fs_max_workers):
+        '''
+        disk usage of a tree like du, hard links are counted once
+
+        Args:
+            path: root dir or file
+            max_workers: number of scan threads
+
+        Returns:
+            usage_dict: "size" (apparent bytes), "disk_size" (allocated bytes),
+                "file_num", "dir_num", None if path cannot be accessed
+        '''
+        path = os.path.expanduser(path)
+        try:
+            root_stat = os.lstat(path)
+        except OSError as os_err:
+            _g_logger.error("stat ({}) failed: {}".format(
+                path, translate_linux_err_code(os_err.errno)))
+            return None
+        usage_dict = {
+            "size": root_stat.st_size,
+            "disk_size": root_stat.st_blocks * 512,
+            "file_num": 0 if stat.S_ISDIR(root_stat.st_mode) else 1,
+            "dir_num": 1 if stat.S_ISDIR(root_stat.st_mode) else 0
+        }
+        if (not stat.S_ISDIR(root_stat.st_mode)):
+            return usage_dict
+
+        seen_inode_set = set()
+        for dir_path, entry_list, err in _iter_tree(path, max_workers,
+                                                    is_need_stat=True):
+            if (err is not None):
+                _g_logger.error("scan dir ({}) failed: {}".format(
+                    dir_path, translate_linux_err_code(err.errno)))
+            for _, is_dir, entry_stat in entry_list:
+                if (entry_stat.st_nlink > 1 and not is_dir):
+                    inode_key = (entry_stat.st_dev, entry_stat.st_ino)
+                    if (inode_key in seen_inode_set):
+                        continue
+                    seen_inode_set.add(inode_key)
+                usage_dict["size"] += entry_stat.st_size
+                usage_dict["disk_size"] += entry_stat.st_blocks * 512
+                usage_dict["dir_num" if is_dir else "file_num"] += 1
+        return usage_dict
+
+    @staticmethod
+    def copy_tree(src_path: str, dst_path: str, max_workers=_g_fs_max_workers,
+                  progress_callback=None):
+        '''
+        copy a tree like cp -rp, dirs are scanned and files are copied in
+        parallel, file data is copied in the kernel when possible
+
+        Args:
+            src_path: source dir
+            dst_path: destination dir, created when missing
+            max_workers: number of worker threads
+            progress_callback: func(file_num, byte_num), called with the
+                running totals after each batch of files
+
+        Returns:
+            ret_code: 0, or the error code of the last failed path
+        '''
+        src_path = os.path.abspath(os.path.expanduser(src_path))
+        dst_path = os.path.abspath(os.path.expanduser(dst_path))
+        if (_g_is_dry_run):
+            _g_logger.info("DRY_RUN: copy tree {} {}".format(src_path, dst_path))
+            return 0
+        if (not os.path.isdir(src_path)):
+            _g_logger.error("source dir not found: {}".format(src_path))
+            return errno.ENOENT
+
+        ret_code = 0
+        file_num = 0
+        byte_num = 0
+        dir_stat_list = []
+        future_set = set()
+
+        def collect(done_set):
+            nonlocal ret_code, file_num, byte_num
+            for future in done_set:
+                cur_file_num, cur_byte_num, err_list = future.result()
+                file_num += cur_file_num
+                byte_num += cur_byte_num
+                for err_path, os_err in err_list:
+                    ret_code = os_err.errno
+                    _g_logger.error("copy ({}) failed: {}".format(
+                        err_path, translate_linux_err_code(os_err.errno)))
+            if (progress_callback is not None and len(done_set) != 0):
+                progress_callback(file_num, byte_num)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for src_dir, entry_list, err in _iter_tree(src_path, max_workers,
+                                                       is_need_stat=True):
+                if (err is not None):
+                    ret_code = err.errno
+                    _g_logger.error("scan dir ({}) failed: {}".format(
+                        src_dir, translate_linux_err_code(err.errno)))
+                # a parent dir is always scanned (and created) before its children
+                dst_dir = os.path.join(dst_path, os.path.relpath(src_dir, src_path))
+                try:
+                    src_dir_stat = os.stat(src_dir)
+                    os.makedirs(dst_dir, exist_ok=True)
+                except OSError as os_err:
+                    # e.g., the source dir is removed during the copy
+                    ret_code = os_err.errno
+                    _g_logger.error("copy dir ({}) failed: {}".format(
+                        src_dir, translate_linux_err_code(os_err.errno)))
+                    continue
+                dir_stat_list.append((dst_dir, src_dir_stat))
+
+                file_list = [(name, entry_stat) for name, is_dir, entry_stat in entry_list
+                             if not is_dir]
+                for start_idx in range(0, len(file_list), _g_fs_copy_batch_size):
+                    future_set.add(executor.submit(
+                        _copy_file_list, src_dir, dst_dir,
+                        file_list[start_idx:start_idx + _g_fs_copy_batch_size]))
+                # bound the pending batches
+                if (len(future_set) > max_workers * 4):
+                    done_set, future_set = concurrent.futures.wait(
+                        future_set, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done_set)
+            done_set, _ = concurrent.futures.wait(future_set)
+            collect(done_set)
+
+        # set the dir modes and times last, children first: a read-only dir
+        # would block its own copy and each copy into a dir changes its mtime
+        for dst_dir, src_dir_stat in reversed(dir_stat_list):
+            try:
+                os.chmod(dst_dir, stat.S_IMODE(src_dir_stat.st_mode))
+                os.utime(dst_dir, ns=(src_dir_stat.st_atime_ns, src_dir_stat.st_mtime_ns))
+            except OSError as os_err:
+                ret_code = os_err.errno
+                _g_logger.error("set dir stat ({}) failed: {}".format(
+                    dst_dir, translate_linux_err_code(os_err.errno)))
+        return ret_code
 
     @staticmethod
     def is_folder_mount(mount_point: str):
@@ -222,28 +665,233 @@ class ThreadWithRet(Thread):
         super().join()
         return self._return
 
+def _freeze_json(json_data):
+    '''
+    read-only view of parsed json: dicts become MappingProxyType, lists tuples
+    '''
+    if (isinstance(json_data, dict)):
+        return types.MappingProxyType({key: _freeze_json(value)
+                                       for key, value in json_data.items()})
+    if (isinstance(json_data, list)):
+        return tuple(_freeze_json(value) for value in json_data)
+    return json_data
+
+
+def _parse_json_file(config_path: str):
+    with open(config_path, "rb") as json_file:
+        file_data = json_file.read()
+    if (_g_has_orjson):
+        return orjson.loads(file_data)
+    return json.loads(file_data)
+
+
+class _ConfigEntry:
+    def __init__(self, stat_key: tuple, json_data):
+        # (st_mtime_ns, st_size, st_ino) of the parsed file
+        self.stat_key = stat_key
+        # never modified, a reload replaces it
+        self.json_data = json_data
+        # read-only view of json_data, built on first use
+        self.json_view = None
+        # list of (callback, is_frozen)
+        self.callback_list = []
+
+    def get_view(self):
+        # the caller holds _g_config_lock
+        if (self.json_view is None):
+            self.json_view = _freeze_json(self.json_data)
+        return self.json_view
+
+
+class _ConfigWatcher(Thread):
+    '''
+    revalidate the watched configs every _g_config_poll_second, right away
+    on an inotify event of their dir when inotify_simple is installed
+    '''
+    def __init__(self):
+        super().__init__(name="config_watcher", daemon=True)
+        self.path_set = set()
+        self._stop_event = Event()
+        self._inotify = inotify_simple.INotify() if _g_has_inotify else None
+        # dir --> watch descriptor
+        self._dir_wd_map = {}
+
+    def add_path(self, config_path: str):
+        self.path_set.add(config_path)
+        config_dir = os.path.dirname(config_path)
+        if (self._inotify is not None and config_dir not in self._dir_wd_map):
+            # watch the dir, an atomic rename replaces the file's inode
+            self._dir_wd_map[config_dir] = self._inotify.add_watch(
+                config_dir, inotify_simple.flags.CLOSE_WRITE |
+                inotify_simple.flags.MOVED_TO | inotify_simple.flags.CREATE)
+
+    def remove_path(self, config_path: str):
+        self.path_set.discard(config_path)
+        config_dir = os.path.dirname(config_path)
+        if (config_dir in self._dir_wd_map and
+            all(os.path.dirname(path) != config_dir for path in self.path_set)):
+            self._inotify.rm_watch(self._dir_wd_map.pop(config_dir))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while (not self._stop_event.is_set()):
+            if (self._inotify is not None):
+                self._inotify.read(timeout=int(_g_config_poll_second * 1000))
+            else:
+                self._stop_event.wait(_g_config_poll_second)
+            for config_path in list(self.path_set):
+                if (os.path.exists(config_path)):
+                    Config._revalidate(config_path)
+
+
+# abs config path --> _ConfigEntry
+_g_config_cache = {}
+_g_config_lock = Lock()
+_g_config_watcher = None
+
+
 class Config:
-    def load_json_config(config_path: str):
-        """load json config and return dict
+    @staticmethod
+    def load_json_config(config_path: str, is_use_cache=True, is_frozen=False):
+        """load json config, parsed by orjson when it is installed
+
+        With the cache (default) the file is parsed once and revalidated by
+        an os.stat (mtime_ns, size, inode) per call. The result is a deep
+        copy of the cached dict, or with is_frozen a shared read-only view
+        (MappingProxyType for dicts, tuples for lists) that costs no copy but
+        must not be modified. A reload that fails keeps the last good config,
+        a changed config is passed to the callbacks of add_config_callback.
 
         Args:
             config_path (str): path of config file
+            is_use_cache (bool, optional): False to always parse the file. Defaults to True.
+            is_frozen (bool, optional): return the shared read-only view. Defaults to False.
+
+        Returns:
+            json_data: json data, a read-only view with is_frozen and the cache
+        """
+        if (not is_use_cache):
+            return Config._read_json_config(config_path)
+        config_path = os.path.abspath(config_path)
+        json_data = Config._revalidate(config_path)
+        if (is_frozen):
+            with _g_config_lock:
+                config_entry = _g_config_cache[config_path]
+                if (config_entry.json_data is json_data):
+                    return config_entry.get_view()
+            return _freeze_json(json_data)
+        return copy.deepcopy(json_data)
+
+    @staticmethod
+    def _revalidate(config_path: str):
+        """stat the config, reload it and run the callbacks if it changed
 
         Returns:
-            json_data: json data in dict
+            json_data: the cached json data, must not be modified
         """
+        try:
+            config_stat = os.stat(config_path)
+            stat_key = (config_stat.st_mtime_ns, config_stat.st_size, config_stat.st_ino)
+        except OSError:
+            stat_key = None
+        with _g_config_lock:
+            config_entry = _g_config_cache.get(config_path)
+            if (config_entry is not None and
+                (config_entry.stat_key == stat_key or stat_key is None)):
+                if (stat_key is None):
+                    _g_logger.error("json file not found, keep the loaded one: {}".format(
+                        config_path))
+                return config_entry.json_data
+            if (config_entry is None):
+                json_data = Config._read_json_config(config_path)
+                _g_config_cache[config_path] = _ConfigEntry(stat_key, json_data)
+                return json_data
+
+            _g_logger.info("start to reload json file: {}".format(config_path))
+            # not retried until the file changes again
+            config_entry.stat_key = stat_key
+            try:
+                json_data = _parse_json_file(config_path)
+            except (OSError, ValueError) as load_err:
+                _g_logger.error("reload json file failed, keep the loaded one: {}".format(
+                    str(load_err)))
+                return config_entry.json_data
+            if (json_data == config_entry.json_data):
+                return config_entry.json_data
+            config_entry.json_data = json_data
+            config_entry.json_view = None
+            callback_list = list(config_entry.callback_list)
+            json_view = config_entry.get_view() if any(
+                is_frozen for _, is_frozen in callback_list) else None
+        _g_logger.info("reload json file done: {}".format(config_path))
+        for callback, is_frozen in callback_list:
+            try:
+                callback(config_path, json_view if is_frozen else copy.deepcopy(json_data))
+            except Exception as e:
+                _g_logger.error("config callback with exception: {}".format(str(e)))
+        return json_data
+
+    @staticmethod
+    def add_config_callback(config_path: str, callback, is_frozen=False):
+        """call callback(abs config path, new json data) after each reload
+        that changes the config, the config is loaded if not yet
+
+        Args:
+            config_path (str): path of config file
+            callback (Callable): callback
+            is_frozen (bool, optional): pass the shared read-only view instead
+                of a deep copy. Defaults to False.
+        """
+        config_path = os.path.abspath(config_path)
+        Config._revalidate(config_path)
+        with _g_config_lock:
+            _g_config_cache[config_path].callback_list.append((callback, is_frozen))
+
+    @staticmethod
+    def remove_config_callback(config_path: str, callback):
+        with _g_config_lock:
+            config_entry = _g_config_cache.get(os.path.abspath(config_path))
+            if (config_entry is not None):
+                config_entry.callback_list = [
+                    (cur_callback, is_frozen)
+                    for cur_callback, is_frozen in config_entry.callback_list
+                    if cur_callback != callback]
+
+    @staticmethod
+    def watch_config(config_path: str):
+        """reload the config in a background thread when it changes, on an
+        inotify event (inotify_simple installed) or else by polling its stat
+        every _g_config_poll_second, so the callbacks run without a load call
+        """
+        global _g_config_watcher
+        Config._revalidate(os.path.abspath(config_path))
+        with _g_config_lock:
+            if (_g_config_watcher is None):
+                _g_config_watcher = _ConfigWatcher()
+                _g_config_watcher.start()
+            _g_config_watcher.add_path(os.path.abspath(config_path))
+
+    @staticmethod
+    def unwatch_config(config_path: str):
+        with _g_config_lock:
+            if (_g_config_watcher is not None):
+                _g_config_watcher.remove_path(os.path.abspath(config_path))
+
+    @staticmethod
+    def _read_json_config(config_path: str):
         json_data = {}
         _g_logger.info("start to load json file: {}".format(config_path))
         try:
-            with open(config_path, "r") as json_file:
-                json_data = json.load(json_file)
+            json_data = _parse_json_file(config_path)
         except FileNotFoundError:
             _g_logger.error("json file not found: {}".format(config_path))
             sys.exit(errno.EEXIST)
         except PermissionError:
             _g_logger.error("json file permission error: {}".format(config_path))
             sys.exit(errno.EPERM)
-        except json.JSONDecoder:
+        except ValueError:
             _g_logger.error("json file decode failed: {}".format(config_path))
             sys.exit(errno.EIO)
         except Exception as e:
@@ -251,4 +899,4 @@ class Config:
             sys.exit(errno.EIO)
 
         _g_logger.info("load json file done: {}".format(config_path))
-        return json_data
\ No newline at end of file
+        return json_data
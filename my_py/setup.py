@@ -10,4 +10,8 @@ def init_dry_run_debug_flag(is_dry_run: bool, is_debug: bool):
     os_util._g_is_debug = is_debug
 
     crypto_tool._g_is_dry_run = is_dry_run
-    crypto_tool._g_is_debug = is_debug
\ No newline at end of file
+    crypto_tool._g_is_debug = is_debug
+
+def init_exec_mode(is_exec_mode: bool):
+    os_util._g_is_exec_mode = is_exec_mode
+    crypto_tool._g_is_exec_mode = is_exec_mode
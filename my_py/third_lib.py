@@ -4,9 +4,26 @@
 import paramiko
 import psutil
 import errno
+import atexit
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import queue
+import re
+import select
+import shlex
+import stat
+import tarfile
+import struct
+import threading
+import time
+import zlib
 
 from my_py import logger
+from my_py import cmd_handler
 from my_py import common_tool
+from my_py import crypto_tool
 
 _g_mod_name = "third_lib"
 _g_is_dry_run = False
@@ -14,22 +31,110 @@ _g_is_debug = False
 
 _g_logger = logger.get_logger(name=_g_mod_name)
 
+_g_has_numpy = common_tool.is_module_exist("numpy")
+if (_g_has_numpy):
+    import numpy
+
+_g_ssh_max_conn_per_host = 4
+_g_ssh_connect_timeout_second = 10
+_g_ssh_keepalive_second = 30
+# idle connections are probed with a channel open before being reused
+_g_ssh_health_check_second = 10
+_g_ssh_idle_timeout_second = 300
+_g_ssh_max_channels = 8
+_g_ssh_read_chunk_size = 65536
+# output kept in memory per stream, the rest is spilled to a temp file
+_g_ssh_capture_mem_size = 4 * 1024 * 1024
+# files larger than this are split into ranges sent over parallel channels
+_g_sftp_part_size = 16 * 1024 * 1024
+# size of each pipelined sftp read/write request
+_g_sftp_req_size = 32 * 1024
+_g_sftp_io_size = 1024 * 1024
+# files up to this size are batched into tar streams by put_tree
+_g_sftp_small_file_size = 256 * 1024
+_g_sftp_tar_batch_size = 16 * 1024 * 1024
+# paths per remote sha256sum/mkdir command
+_g_sftp_argv_chunk_size = 256
+# block size of sync_file, also the min length of a reused range
+_g_sync_block_size = 64 * 1024
+# positions whose rolling checksum is computed per numpy pass
+_g_sync_scan_size = 4 * 1024 * 1024
+_g_sync_literal_frame_size = 1024 * 1024
+_g_cluster_max_workers = 32
+# hosts listed per output group in the summary log
+_g_cluster_summary_host_num = 8
+
+_G_ADLER_MOD = 65521
+# remote helper of sync_file: "<adler32> <sha256>" of each block of argv[1]
+_G_SYNC_SIG_SCRIPT = """
+import hashlib, sys, zlib
+with open(sys.argv[1], "rb") as in_file:
+    for block in iter(lambda: in_file.read(int(sys.argv[2])), b""):
+        sys.stdout.write("%08x %s\\n" % (zlib.adler32(block), hashlib.sha256(block).hexdigest()))
+"""
+# remote helper of sync_file: rebuild argv[1] from its own blocks and the
+# literal data on stdin into a temp file, check the sha256 and rename
+# frames: b"C" + (start block, block count), b"L" + length + data, b"E"
+_G_SYNC_PATCH_SCRIPT = """
+import hashlib, os, struct, sys
+target_path, block_size, digest = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+tmp_path = "%s.tmp-%d" % (target_path, os.getpid())
+in_stream = sys.stdin.buffer
+hasher = hashlib.sha256()
+try:
+    with open(target_path, "rb") as basis_file, open(tmp_path, "wb") as out_file:
+        while True:
+            op = in_stream.read(1)
+            if op == b"C":
+                start_block, block_num = struct.unpack(">QQ", in_stream.read(16))
+                basis_file.seek(start_block * block_size)
+                in_file, left_size = basis_file, block_num * block_size
+            elif op == b"L":
+                in_file, left_size = in_stream, struct.unpack(">Q", in_stream.read(8))[0]
+            else:
+                break
+            while left_size > 0:
+                data = in_file.read(min(left_size, 1 << 20))
+                if not data:
+                    break
+                hasher.update(data)
+                out_file.write(data)
+                left_size -= len(data)
+            if op == b"L" and left_size > 0:
+                break
+        out_file.flush()
+        os.fsync(out_file.fileno())
+        os.chmod(tmp_path, os.stat(target_path).st_mode & 0o7777)
+    if op != b"E":
+        sys.exit(5)  # EIO, truncated stream
+    if hasher.hexdigest() != digest:
+        sys.exit(74)  # EBADMSG
+    os.replace(tmp_path, target_path)
+finally:
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+"""
+
 def setup(is_dry_run: bool, is_debug: bool):
     _g_is_dry_run = is_dry_run
     _g_is_debug = is_debug
 
 class Util:
     @staticmethod
-    def find_process_with_keyword(keyword: str, is_exact_match=False):
+    def find_process_with_keyword(keyword: str, is_exact_match=False, process_index=None):
         """find the pid with keyword
 
         Args:
             keyword (str): input keyword
             is_exact_match (bool, optional): exact match the keyword. Defaults to False.
+            process_index (ProcessIndex, optional): query this snapshot instead
+                of walking all the processes. Defaults to None.
 
         Returns:
             pid_list: the pid of the input keyword
         """
+        if (process_index is not None):
+            return process_index.find(keyword, is_exact_match=is_exact_match)
         pid_list = []
         for cur_process in psutil.process_iter():
             if (is_exact_match):
@@ -40,9 +145,506 @@ class Util:
                     pid_list.append(cur_process.pid)
         return pid_list
 
+class ProcessIndex:
+    """snapshot of the processes (name, cmdline) for many queries
+
+    The processes are read once (psutil oneshot) into parallel lists, with
+    maps from each distinct name, distinct cmdline and cmdline token to the
+    pids, so a query scans the distinct names (or cmdlines) rather than the
+    processes. refresh() diffs the pid list of /proc and only reads the new
+    processes, a pid kept across refreshes is not read again unless its
+    create time changed (the pid was reused), so a process that exec'd
+    keeps its old name, refresh(is_full=True) reads all. The create time of
+    a kept pid is only read when the inode of its /proc entry changed (a
+    reused pid gets a new one), the inodes come with the directory listing;
+    without them (no /proc) each refresh reads the create time of every pid.
+    Names are matched case-insensitively, regexes as given.
+    """
+    def __init__(self, is_with_cmdline=True):
+        self.is_with_cmdline = is_with_cmdline
+        self._pid_list = []
+        self._name_list = []
+        self._cmdline_list = []
+        self._create_time_list = []
+        # pid --> position in the lists
+        self._pos_map = {}
+        # name / cmdline / lower-cased cmdline token --> set of pids
+        self._name_pid_map = {}
+        self._cmdline_pid_map = {}
+        self._token_pid_map = {}
+        # pid --> inode of /proc/<pid> at the last refresh, None if unknown
+        self._ino_map = {}
+        self.refresh(is_full=True)
+
+    def __len__(self):
+        return len(self._pid_list)
+
+    @staticmethod
+    def _map_add(pid_map: dict, key: str, pid: int):
+        pid_map.setdefault(key, set()).add(pid)
+
+    @staticmethod
+    def _map_remove(pid_map: dict, key: str, pid: int):
+        pid_set = pid_map[key]
+        pid_set.discard(pid)
+        if (len(pid_set) == 0):
+            del pid_map[key]
+
+    def _add(self, pid: int):
+        try:
+            cur_process = psutil.Process(pid)
+            with cur_process.oneshot():
+                create_time = cur_process.create_time()
+                name = cur_process.name()
+                cmdline = ""
+                if (self.is_with_cmdline):
+                    try:
+                        cmdline = " ".join(cur_process.cmdline())
+                    except (psutil.AccessDenied, psutil.ZombieProcess):
+                        pass
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return
+        self._pos_map[pid] = len(self._pid_list)
+        self._pid_list.append(pid)
+        self._name_list.append(name)
+        self._cmdline_list.append(cmdline)
+        self._create_time_list.append(create_time)
+        ProcessIndex._map_add(self._name_pid_map, name, pid)
+        if (self.is_with_cmdline):
+            ProcessIndex._map_add(self._cmdline_pid_map, cmdline, pid)
+            for token in set(cmdline.lower().split()):
+                ProcessIndex._map_add(self._token_pid_map, token, pid)
+
+    def _remove(self, pid: int):
+        pos = self._pos_map.pop(pid)
+        name = self._name_list[pos]
+        cmdline = self._cmdline_list[pos]
+        ProcessIndex._map_remove(self._name_pid_map, name, pid)
+        if (self.is_with_cmdline):
+            ProcessIndex._map_remove(self._cmdline_pid_map, cmdline, pid)
+            for token in set(cmdline.lower().split()):
+                ProcessIndex._map_remove(self._token_pid_map, token, pid)
+        # move the last entry into the hole
+        last_pos = len(self._pid_list) - 1
+        if (pos != last_pos):
+            self._pid_list[pos] = self._pid_list[last_pos]
+            self._name_list[pos] = self._name_list[last_pos]
+            self._cmdline_list[pos] = self._cmdline_list[last_pos]
+            self._create_time_list[pos] = self._create_time_list[last_pos]
+            self._pos_map[self._pid_list[pos]] = pos
+        self._pid_list.pop()
+        self._name_list.pop()
+        self._cmdline_list.pop()
+        self._create_time_list.pop()
+
+    @staticmethod
+    def _scan_pid_map():
+        # pid --> inode, readdir returns the inodes without a stat per pid
+        try:
+            return {int(entry.name): entry.inode() for entry in os.scandir("/proc")
+                    if entry.name.isdigit()}
+        except OSError:
+            return dict.fromkeys(psutil.pids())
+
+    def _is_reused(self, pid: int):
+        # a pid whose process is gone or was replaced since it was read
+        try:
+            create_time = psutil.Process(pid).create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return True
+        return create_time != self._create_time_list[self._pos_map[pid]]
+
+    def refresh(self, is_full=False):
+        """update the snapshot
+
+        Args:
+            is_full (bool, optional): re-read all the processes. Defaults to False.
+
+        Returns:
+            new_num: number of processes read
+            gone_num: number of processes removed, a reused pid counts in both
+        """
+        pid_ino_map = ProcessIndex._scan_pid_map()
+        if (is_full):
+            gone_pid_list = list(self._pos_map)
+            new_pid_list = sorted(pid_ino_map)
+        else:
+            gone_pid_list = [pid for pid in self._pos_map if pid not in pid_ino_map]
+            # only a pid whose /proc entry changed (or is unknown) may be reused
+            reused_pid_list = [pid for pid in self._pos_map
+                               if pid in pid_ino_map and
+                               (pid_ino_map[pid] is None or
+                                pid_ino_map[pid] != self._ino_map.get(pid)) and
+                               self._is_reused(pid)]
+            gone_pid_list += reused_pid_list
+            new_pid_list = sorted(set(pid_ino_map).difference(self._pos_map).union(
+                reused_pid_list))
+        for pid in gone_pid_list:
+            self._remove(pid)
+        for pid in new_pid_list:
+            self._add(pid)
+        self._ino_map = pid_ino_map
+        return len(new_pid_list), len(gone_pid_list)
+
+    def _match_key_list(self, pid_map: dict, pattern: str, is_exact_match: bool,
+                        is_regex: bool):
+        if (is_regex):
+            regex = re.compile(pattern)
+            return [key for key in pid_map if regex.search(key)]
+        pattern = pattern.lower()
+        if (is_exact_match):
+            return [key for key in pid_map if key.lower() == pattern]
+        return [key for key in pid_map if pattern in key.lower()]
+
+    def find(self, pattern: str, is_exact_match=False, is_regex=False, is_cmdline=False):
+        """find the pids whose name (or cmdline) matches
+
+        Args:
+            pattern (str): keyword (substring), exact name, or regex
+            is_exact_match (bool, optional): the whole name (or a cmdline token)
+                equals pattern. Defaults to False.
+            is_regex (bool, optional): pattern is a regex, searched with
+                re.search. Defaults to False.
+            is_cmdline (bool, optional): match the cmdline instead of the name,
+                needs is_with_cmdline. Defaults to False.
+
+        Returns:
+            pid_list: sorted matching pids
+        """
+        if (not is_cmdline):
+            pid_map = self._name_pid_map
+        elif (is_exact_match and not is_regex):
+            return sorted(self._token_pid_map.get(pattern.lower(), ()))
+        else:
+            pid_map = self._cmdline_pid_map
+        pid_set = set()
+        for key in self._match_key_list(pid_map, pattern, is_exact_match, is_regex):
+            pid_set.update(pid_map[key])
+        return sorted(pid_set)
+
+    def find_many(self, pattern_list: list, is_exact_match=False, is_regex=False,
+                  is_cmdline=False):
+        """find for each pattern, see find
+
+        Returns:
+            pid_map: pattern --> sorted matching pids
+        """
+        return {pattern: self.find(pattern, is_exact_match=is_exact_match,
+                                   is_regex=is_regex, is_cmdline=is_cmdline)
+                for pattern in pattern_list}
+
+    def get_info(self, pid: int):
+        """
+        Returns:
+            (name, cmdline) of pid in the snapshot, None if not in it
+        """
+        pos = self._pos_map.get(pid)
+        if (pos is None):
+            return None
+        return self._name_list[pos], self._cmdline_list[pos]
+
+
+class _SSHConn:
+    """one pooled authenticated connection"""
+    def __init__(self, pool_key: tuple, pwd_digest: bytes, is_compress=False):
+        self.pool_key = pool_key
+        # a connection is only reused with the password it was opened with
+        self.pwd_digest = pwd_digest
+        self.is_compress = is_compress
+        self.ssh_client: paramiko.SSHClient = None
+        self.is_in_use = True
+        self.last_used_time = time.monotonic()
+
+
+class SSHPool:
+    """pool of authenticated ssh connections keyed by (usr_name, hostname, port)
+
+    A connection is borrowed exclusively by acquire() and given back by
+    release(). Pooled transports send keepalives, a connection idle for
+    more than health_check_second is probed (one channel open) before it is
+    handed out and replaced if dead, connections idle for more than
+    idle_timeout_second are closed by a reaper thread, which runs while the
+    pool holds connections. At most max_conn_per_host connections are opened
+    per key, acquire() waits for a release beyond that.
+    """
+    def __init__(self, max_conn_per_host=_g_ssh_max_conn_per_host,
+                 connect_timeout=_g_ssh_connect_timeout_second,
+                 keepalive_second=_g_ssh_keepalive_second,
+                 health_check_second=_g_ssh_health_check_second,
+                 idle_timeout_second=_g_ssh_idle_timeout_second):
+        self._max_conn_per_host = max_conn_per_host
+        self._connect_timeout = connect_timeout
+        self._keepalive_second = keepalive_second
+        self._health_check_second = health_check_second
+        self._idle_timeout_second = idle_timeout_second
+        self._conn_map = {}
+        self._cond = threading.Condition()
+        # own event, a reaper waiting on _cond could take the notify of a release
+        self._reap_event = threading.Event()
+        self._reaper_thread: threading.Thread = None
+        self.connect_count = 0
+        self.reuse_count = 0
+        self.reconnect_count = 0
+
+    @staticmethod
+    def make_key(hostname: str, port, usr_name: str):
+        return (usr_name, hostname, int(port))
+
+    def _connect(self, pool_key: tuple, pwd: str, cmd_logger, is_compress=False):
+        usr_name, hostname, port = pool_key
+        ssh_client = paramiko.SSHClient()
+        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh_client.connect(hostname=hostname,
+                               port=port,
+                               username=usr_name,
+                               password=pwd,
+                               compress=is_compress,
+                               timeout=self._connect_timeout,
+                               banner_timeout=self._connect_timeout,
+                               auth_timeout=self._connect_timeout)
+        except paramiko.AuthenticationException:
+            cmd_logger.error("authentication failed")
+            ssh_client.close()
+            return None, errno.EINVAL
+        except paramiko.SSHException as ssh_exception:
+            cmd_logger.error("ssh connection failed: {}".format(str(ssh_exception)))
+            ssh_client.close()
+            return None, errno.EIO
+        except OSError as os_err:
+            cmd_logger.error("ssh connection failed: {}".format(str(os_err)))
+            ssh_client.close()
+            # NoValidConnectionsError keeps the errno of each address
+            err_list = list(getattr(os_err, "errors", {}).values())
+            err_code = err_list[0].errno if len(err_list) != 0 else os_err.errno
+            return None, (err_code if err_code else errno.EHOSTUNREACH)
+        ssh_client.get_transport().set_keepalive(self._keepalive_second)
+        return ssh_client, 0
+
+    def _is_healthy(self, conn: _SSHConn):
+        transport = conn.ssh_client.get_transport()
+        if (transport is None or not transport.is_active()):
+            return False
+        if (time.monotonic() - conn.last_used_time < self._health_check_second):
+            return True
+        try:
+            transport.open_session(timeout=self._connect_timeout).close()
+        except (paramiko.SSHException, OSError, EOFError):
+            return False
+        return True
+
+    def _pop_idle_list(self, conn_list: list, now_time: float):
+        # called with the lock held, unlinks the conns idle for too long
+        idle_list = [conn for conn in conn_list
+                     if (not conn.is_in_use and
+                         now_time - conn.last_used_time > self._idle_timeout_second)]
+        for conn in idle_list:
+            conn_list.remove(conn)
+        return idle_list
+
+    def _start_reaper(self):
+        # called with the lock held
+        if (self._reaper_thread is not None):
+            return
+        self._reap_event.clear()
+        self._reaper_thread = threading.Thread(target=self._reap_loop, name="ssh_pool_reaper",
+                                               daemon=True)
+        self._reaper_thread.start()
+
+    def _reap_loop(self):
+        """close the idle connections, exit once the pool is empty"""
+        reap_interval = max(self._idle_timeout_second / 2, 0.05)
+        while True:
+            self._reap_event.wait(reap_interval)
+            with self._cond:
+                if (self._reaper_thread is not threading.current_thread()):
+                    # replaced after close_all
+                    return
+                idle_list = []
+                now_time = time.monotonic()
+                for conn_list in self._conn_map.values():
+                    idle_list += self._pop_idle_list(conn_list, now_time)
+                if (len(idle_list) != 0):
+                    self._cond.notify_all()
+                is_done = not any(self._conn_map.values())
+                if (is_done):
+                    self._reaper_thread = None
+            for conn in idle_list:
+                conn.ssh_client.close()
+            if (len(idle_list) != 0):
+                _g_logger.debug("closed {} idle ssh connections".format(len(idle_list)))
+            if (is_done):
+                return
+
+    def _pick_conn(self, pool_key: tuple, pwd_digest: bytes, is_compress: bool):
+        # called with the lock held, returns an idle conn or a new slot
+        conn_list = self._conn_map.setdefault(pool_key, [])
+        for conn in self._pop_idle_list(conn_list, time.monotonic()):
+            conn.ssh_client.close()
+        for conn in conn_list:
+            if (not conn.is_in_use and conn.pwd_digest == pwd_digest and
+                conn.is_compress == is_compress):
+                conn.is_in_use = True
+                return conn
+        if (len(conn_list) >= self._max_conn_per_host):
+            # make room with an idle conn opened with another password
+            for conn in conn_list:
+                if (not conn.is_in_use):
+                    conn_list.remove(conn)
+                    conn.ssh_client.close()
+                    break
+        if (len(conn_list) < self._max_conn_per_host):
+            conn = _SSHConn(pool_key, pwd_digest, is_compress)
+            conn_list.append(conn)
+            return conn
+        return None
+
+    def _drop_conn(self, conn: _SSHConn):
+        with self._cond:
+            conn_list = self._conn_map.get(conn.pool_key, [])
+            if (conn in conn_list):
+                conn_list.remove(conn)
+            self._cond.notify()
+        if (conn.ssh_client is not None):
+            conn.ssh_client.close()
+
+    def acquire(self, hostname: str, port, usr_name: str, pwd: str,
+                timeout=None, cmd_logger=None, is_compress=False):
+        """borrow a connection, connect if no idle one is left
+
+        Args:
+            hostname (str): remote host
+            port: remote port
+            usr_name (str): user name
+            pwd (str): password, used when a new connection is needed
+            timeout (float, optional): max wait for a free slot. Defaults to None.
+            cmd_logger (optional): logger of the caller. Defaults to None.
+            is_compress (bool, optional): zlib compressed transport. Defaults to False.
+
+        Returns:
+            conn: pooled connection (conn.ssh_client), None if failed
+            ret_code: return code
+        """
+        cmd_logger = _g_logger if cmd_logger is None else cmd_logger
+        pool_key = SSHPool.make_key(hostname, port, usr_name)
+        pwd_digest = hashlib.sha256(str(pwd).encode()).digest()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                conn = self._pick_conn(pool_key, pwd_digest, is_compress)
+                while conn is None:
+                    wait_time = None if deadline is None else deadline - time.monotonic()
+                    if (wait_time is not None and wait_time <= 0):
+                        cmd_logger.error("no free connection to {}@{}:{}".format(*pool_key))
+                        return None, errno.EBUSY
+                    self._cond.wait(wait_time)
+                    conn = self._pick_conn(pool_key, pwd_digest, is_compress)
+            if (conn.ssh_client is None):
+                # new slot, connect without the lock
+                ssh_client, ret = self._connect(pool_key, pwd, cmd_logger, is_compress)
+                if (ret != 0):
+                    self._drop_conn(conn)
+                    return None, ret
+                conn.ssh_client = ssh_client
+                with self._cond:
+                    self.connect_count += 1
+                    self._start_reaper()
+                return conn, 0
+            if (self._is_healthy(conn)):
+                self.reuse_count += 1
+                return conn, 0
+            cmd_logger.warning("pooled connection to {}@{}:{} is dead, reconnect".format(
+                *pool_key))
+            self.reconnect_count += 1
+            self._drop_conn(conn)
+
+    def release(self, conn: _SSHConn, is_broken=False):
+        """give back a connection
+
+        Args:
+            conn (_SSHConn): connection from acquire
+            is_broken (bool, optional): close it instead of pooling. Defaults to False.
+        """
+        with self._cond:
+            # dropped by close_all while borrowed
+            is_pooled = conn in self._conn_map.get(conn.pool_key, [])
+            if (is_pooled and not is_broken):
+                conn.is_in_use = False
+                conn.last_used_time = time.monotonic()
+                self._cond.notify()
+                return
+        self._drop_conn(conn)
+
+    def get_stats(self):
+        """
+        Returns:
+            stats: dict of connection counters and (usr_name, hostname, port) --> open connections
+        """
+        with self._cond:
+            conn_num_map = {pool_key: len(conn_list)
+                            for pool_key, conn_list in self._conn_map.items() if conn_list}
+        return {
+            "connect_count": self.connect_count,
+            "reuse_count": self.reuse_count,
+            "reconnect_count": self.reconnect_count,
+            "conn_num_map": conn_num_map,
+        }
+
+    def close_all(self):
+        """close the idle connections, the borrowed ones are closed on release"""
+        with self._cond:
+            conn_list = [conn for conn_list in self._conn_map.values()
+                         for conn in conn_list]
+            self._conn_map = {}
+            self._reaper_thread = None
+            self._reap_event.set()
+            self._cond.notify_all()
+        for conn in conn_list:
+            if (not conn.is_in_use):
+                conn.ssh_client.close()
+
+
+_g_ssh_pool = SSHPool()
+# transports are closed before the interpreter tears down their threads
+atexit.register(_g_ssh_pool.close_all)
+
+
+class _SFTPChannelPool:
+    """sftp sessions (one channel each) on one transport, opened on demand
+    up to max_channels, shared by the transfer threads
+    """
+    def __init__(self, transport: paramiko.Transport, max_channels: int):
+        self._transport = transport
+        self._max_channels = max_channels
+        self._idle_queue = queue.Queue()
+        self._sftp_list = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._idle_queue.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if (len(self._sftp_list) < self._max_channels):
+                sftp = paramiko.SFTPClient.from_transport(self._transport)
+                self._sftp_list.append(sftp)
+                return sftp
+        return self._idle_queue.get()
+
+    def put(self, sftp: paramiko.SFTPClient):
+        self._idle_queue.put(sftp)
+
+    def close(self):
+        for sftp in self._sftp_list:
+            sftp.close()
+        self._sftp_list = []
+
+
 class SSHCmd:
     def __init__(self, port: str, hostname: str, usr_name: str, pwd: str,
-                 log_level=logger.G_LOG_LEVEL_DEBUG, is_persist=False):
+                 log_level=logger.G_LOG_LEVEL_DEBUG, is_persist=False,
+                 ssh_pool: SSHPool = None, is_use_pool=True):
         self._hostname: str = hostname
         self._port: str = port
         self._usr_name: str = usr_name
@@ -51,16 +653,35 @@ class SSHCmd:
             self._usr_name, self._hostname, self._port),
             log_file_level=log_level,
             is_persist=is_persist)
-        self._ssh_client = paramiko.SSHClient()
+        # pooled by default (module-wide _g_ssh_pool), else one own client
+        self._ssh_pool = None
+        self._ssh_client = None
+        # pooled connections borrowed by running commands or open iterators
+        self._borrowed_set = set()
+        self._borrow_lock = threading.Lock()
+        if (is_use_pool):
+            self._ssh_pool = _g_ssh_pool if ssh_pool is None else ssh_pool
+        else:
+            self._ssh_client = paramiko.SSHClient()
 
     def connect(self):
-        """connect to remote host
+        """connect to remote host, with a pool the connection is checked and
+        kept in the pool for the next commands
 
         Returns:
             ret_code: return code
         """
-        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self._logger.info("start to setup connection")
+        if (self._ssh_pool is not None):
+            conn, ret = self._ssh_pool.acquire(self._hostname, self._port, self._usr_name,
+                                               self._pwd, cmd_logger=self._logger)
+            if (ret != 0):
+                return ret
+            self._ssh_pool.release(conn)
+            self._logger.info("connection to host done")
+            return 0
+
+        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
             self._ssh_client.connect(hostname=self._hostname,
                                      port=self._port,
@@ -76,6 +697,156 @@ class SSHCmd:
         self._logger.info("connection to host done")
         return 0
 
+    def _borrow_client(self, is_compress=False):
+        """
+        Returns:
+            conn: pooled connection, None without a pool
+            ssh_client: client to use, None if failed
+            ret_code: return code
+        """
+        if (self._ssh_pool is None):
+            return None, self._ssh_client, 0
+        conn, ret = self._ssh_pool.acquire(self._hostname, self._port, self._usr_name,
+                                           self._pwd, cmd_logger=self._logger,
+                                           is_compress=is_compress)
+        if (ret != 0):
+            return None, None, ret
+        with self._borrow_lock:
+            self._borrowed_set.add(conn)
+        return conn, conn.ssh_client, 0
+
+    def _return_client(self, conn: _SSHConn, is_broken=False):
+        if (conn is None):
+            return
+        with self._borrow_lock:
+            if (conn not in self._borrowed_set):
+                # already given back by close()
+                return
+            self._borrowed_set.remove(conn)
+        self._ssh_pool.release(conn, is_broken=is_broken)
+
+    def _open_channel(self, ssh_client: paramiko.SSHClient, cmd: str):
+        """open a session channel and start the command
+
+        Returns:
+            channel: running channel, None if failed
+            ret_code: return code
+            is_broken: the transport failed
+        """
+        try:
+            channel = ssh_client.get_transport().open_session(
+                timeout=_g_ssh_connect_timeout_second)
+            channel.exec_command(cmd)
+        except paramiko.ChannelException as channel_exception:
+            # the transport is fine, the server refused one more session
+            self._logger.error("run failed: {}\nerror: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE), str(channel_exception)))
+            return None, errno.EAGAIN, False
+        except (paramiko.SSHException, OSError, EOFError, AttributeError) as ssh_exception:
+            self._logger.error("run failed: {}\nerror: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE), str(ssh_exception)))
+            return None, errno.EIO, True
+        return channel, 0, False
+
+    def _iter_channel(self, channel: paramiko.Channel, cmd: str, timeout):
+        """read stdout and stderr of a running channel as the data arrives,
+        a slow consumer throttles the remote command through the channel window
+
+        Yields:
+            (stream_name, data): stream_name is SSHOutputStream.STDOUT/STDERR
+
+        Returns:
+            ret_code: exit status, ETIMEDOUT (the channel is closed) or EIO
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # readable on stdout data, stderr data and eof
+        poll_fd = channel.fileno()
+        try:
+            while True:
+                # checked before the reads, a chatty command never idles
+                wait_time = None if deadline is None else deadline - time.monotonic()
+                if (wait_time is not None and wait_time <= 0):
+                    break
+                is_read = False
+                if (channel.recv_ready()):
+                    data = channel.recv(_g_ssh_read_chunk_size)
+                    if (len(data) != 0):
+                        is_read = True
+                        yield SSHOutputStream.STDOUT, data
+                if (channel.recv_stderr_ready()):
+                    data = channel.recv_stderr(_g_ssh_read_chunk_size)
+                    if (len(data) != 0):
+                        is_read = True
+                        yield SSHOutputStream.STDERR, data
+                if (is_read):
+                    continue
+                if (channel.eof_received or channel.closed):
+                    # all the output is read, the exit status may come later
+                    if (channel.status_event.wait(wait_time)):
+                        return channel.recv_exit_status()
+                    continue
+                select.select([poll_fd], [], [], wait_time)
+        except (paramiko.SSHException, OSError, EOFError) as ssh_exception:
+            self._logger.error("run failed: {}\nerror: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE), str(ssh_exception)))
+            return errno.EIO
+        finally:
+            channel.close()
+        self._logger.error("run timeout ({}s): {}".format(
+            timeout, common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        return errno.ETIMEDOUT
+
+    def _run_channel(self, ssh_client: paramiko.SSHClient, cmd: str, timeout):
+        """run a command on a new channel of the client, the output is drained
+        while the command runs, beyond _g_ssh_capture_mem_size it is spilled
+        to a temp file (cmd_handler.CapturedOutput)
+
+        Returns:
+            stdout_buf: stdout buffer
+            stderr_buf: stderr buffer
+            ret_code: return code
+            is_broken: the transport failed
+        """
+        channel, ret_code, is_broken = self._open_channel(ssh_client, cmd)
+        if (channel is None):
+            return None, None, ret_code, is_broken
+        with cmd_handler.CapturedOutput(max_mem_size=_g_ssh_capture_mem_size) as stdout_out, \
+                cmd_handler.CapturedOutput(max_mem_size=_g_ssh_capture_mem_size) as stderr_out:
+            output_map = {SSHOutputStream.STDOUT: stdout_out, SSHOutputStream.STDERR: stderr_out}
+            channel_iter = self._iter_channel(channel, cmd, timeout)
+            while True:
+                try:
+                    stream_name, data = next(channel_iter)
+                except StopIteration as stop_iteration:
+                    ret_code = stop_iteration.value
+                    break
+                output_map[stream_name].extend(data)
+            if (ret_code == errno.EIO):
+                return None, None, ret_code, True
+            return stdout_out.text, stderr_out.text, ret_code, False
+
+    def _log_cmd_result(self, cmd: str, stdout_buf: str, stderr_buf: str, ret_code: int,
+                        is_debug: bool):
+        if (ret_code == 0):
+            if (is_debug and
+                len(stdout_buf) != 0):
+                self._logger.info("run successful: {}\noutput: {}".format(
+                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                    stdout_buf))
+            else:
+                self._logger.info("run successful: {}".format(
+                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        else:
+            # if error, print the error info
+            if (not stderr_buf):
+                self._logger.error("run failed: {}\nret: {}".format(
+                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                    ret_code))
+            else:
+                self._logger.error("run failed: {}\nerror: {}\nret: {}".format(
+                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
+                    stderr_buf, ret_code))
+
     def run_shell(self, cmd: str,
                   timeout=None,
                   is_debug=False,
@@ -84,7 +855,8 @@ class SSHCmd:
 
         Args:
             cmd (str): shell command
-            timeout (float, optional): timeout setting. Defaults to None.
+            timeout (float, optional): max run time, the channel is closed and
+                ETIMEDOUT returned with the partial output after it. Defaults to None.
             is_debug (bool, optional): only print command. Defaults to False.
             is_dry_run (bool, optional): print the output command after. Defaults to False.
 
@@ -102,37 +874,774 @@ class SSHCmd:
         self._logger.info("run cmd: {}".format(
             common_tool.Color.set_text(cmd, common_tool.Color.BLUE)
         ))
-        _, stdout, stderr = self._ssh_client.exec_command(command=cmd,
-                                                       timeout=timeout)
-        ret_code = stdout.channel.recv_exit_status()
-        stdout_buf = stdout.read().decode(common_tool._g_encode_fmt).strip()
-        stderr_buf = stderr.read().decode(common_tool._g_encode_fmt).strip()
+        conn, ssh_client, ret_code = self._borrow_client()
+        if (ret_code != 0):
+            return None, None, ret_code
+        stdout_buf, stderr_buf, ret_code, is_broken = self._run_channel(ssh_client, cmd, timeout)
+        self._return_client(conn, is_broken=is_broken)
+        if (stdout_buf is None):
+            return None, None, ret_code
+        self._log_cmd_result(cmd, stdout_buf, stderr_buf, ret_code, is_debug)
+        return (stdout_buf, stderr_buf, ret_code)
 
-        if (ret_code == 0):
-            if (is_debug and
-                len(stdout_buf) != 0):
-                self._logger.info("run successful: {}\noutput: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    stdout_buf))
-            else:
-                self._logger.info("run successful: {}".format(
+    def run_many(self, cmd_list: list, max_channels=_g_ssh_max_channels,
+                 timeout=None, is_debug=False, is_dry_run=False):
+        """run independent shell commands concurrently, each on its own
+        channel of one authenticated connection (no extra handshake)
+
+        Args:
+            cmd_list (list): shell commands
+            max_channels (int, optional): channels open at the same time, keep
+                it under the MaxSessions of sshd (10 by default).
+            timeout (float, optional): max run time of each command. Defaults to None.
+            is_debug (bool, optional): print the output of each command. Defaults to False.
+            is_dry_run (bool, optional): only print the commands. Defaults to False.
+
+        Returns:
+            result_list: (stdout_buf, stderr_buf, ret_code) of each command, in input order
+        """
+        if (is_dry_run):
+            for cmd in cmd_list:
+                self._logger.info("DRY_RUN: {}".format(
                     common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
-        else:
-            # if error, print the error info
-            if (len(stderr_buf) == 0):
-                self._logger.error("run failed: {}\nret: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    ret_code))
+            return [(None, None, 0)] * len(cmd_list)
+
+        self._logger.info("run {} cmds on {} channels".format(len(cmd_list), max_channels))
+        conn, ssh_client, ret_code = self._borrow_client()
+        if (ret_code != 0):
+            return [(None, None, ret_code)] * len(cmd_list)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_channels) as executor:
+            run_result_list = list(executor.map(
+                lambda cmd: self._run_channel(ssh_client, cmd, timeout), cmd_list))
+        self._return_client(conn, is_broken=any(result[3] for result in run_result_list))
+
+        result_list = []
+        for cmd, (stdout_buf, stderr_buf, ret_code, _) in zip(cmd_list, run_result_list):
+            if (stdout_buf is not None):
+                self._log_cmd_result(cmd, stdout_buf, stderr_buf, ret_code, is_debug)
+            result_list.append((stdout_buf, stderr_buf, ret_code))
+        return result_list
+
+    def run_shell_iter(self, cmd: str, timeout=None, is_dry_run=False):
+        """run a shell command in remote host and stream its output line by line
+
+        Args:
+            cmd (str): shell command
+            timeout (float, optional): max run time. Defaults to None.
+            is_dry_run (bool, optional): only print command. Defaults to False.
+
+        Returns:
+            output_stream: iterate it to get (stream_name, line), ret_code is
+                set after the iteration
+        """
+        if (is_dry_run):
+            self._logger.info("DRY_RUN: {}".format(
+                common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return SSHOutputStream(self, cmd, timeout, is_dry_run=True)
+        return SSHOutputStream(self, cmd, timeout)
+
+    @staticmethod
+    def _part_list(file_size: int, part_size: int):
+        return [(offset, min(part_size, file_size - offset))
+                for offset in range(0, max(file_size, 1), part_size)]
+
+    @staticmethod
+    def _sftp_err_code(err: Exception):
+        return err.errno if isinstance(err, OSError) and err.errno else errno.EIO
+
+    def _sftp_replace(self, sftp: paramiko.SFTPClient, tmp_path: str, remote_path: str):
+        try:
+            sftp.posix_rename(tmp_path, remote_path)
+        except IOError:
+            # no posix-rename extension, rename fails on an existing target
+            try:
+                sftp.remove(remote_path)
+            except IOError:
+                pass
+            sftp.rename(tmp_path, remote_path)
+
+    def _put_range(self, sftp_pool: _SFTPChannelPool, local_fd: int, remote_path: str,
+                   offset: int, length: int, open_mode: str):
+        sftp = sftp_pool.get()
+        try:
+            with sftp.open(remote_path, open_mode) as remote_file:
+                # do not wait for the ack of each write, close() collects them
+                remote_file.set_pipelined(True)
+                remote_file.seek(offset)
+                end_offset = offset + length
+                while offset < end_offset:
+                    data = os.pread(local_fd, min(_g_sftp_io_size, end_offset - offset), offset)
+                    if (len(data) == 0):
+                        break
+                    remote_file.write(data)
+                    offset += len(data)
+        finally:
+            sftp_pool.put(sftp)
+
+    def _get_range(self, sftp_pool: _SFTPChannelPool, remote_path: str, local_fd: int,
+                   offset: int, length: int):
+        sftp = sftp_pool.get()
+        try:
+            with sftp.open(remote_path, "rb") as remote_file:
+                # readv sends all the requests before reading the replies
+                req_list = [(req_offset, min(_g_sftp_req_size, offset + length - req_offset))
+                            for req_offset in range(offset, offset + length, _g_sftp_req_size)]
+                for data in remote_file.readv(req_list):
+                    os.pwrite(local_fd, data, offset)
+                    offset += len(data)
+        finally:
+            sftp_pool.put(sftp)
+
+    def _remote_digest_map(self, ssh_client: paramiko.SSHClient, remote_dir: str,
+                           rel_path_list: list):
+        """sha256 of remote files, a sha256sum command per chunk of paths
+
+        Returns:
+            digest_map: relative path --> hex digest, missing if failed
+        """
+        digest_map = {}
+        for start_idx in range(0, len(rel_path_list), _g_sftp_argv_chunk_size):
+            cmd = "cd {} && sha256sum -- {}".format(shlex.quote(remote_dir), " ".join(
+                shlex.quote(rel_path)
+                for rel_path in rel_path_list[start_idx:start_idx + _g_sftp_argv_chunk_size]))
+            stdout_buf, _, _, _ = self._run_channel(ssh_client, cmd, None)
+            for line in (stdout_buf or "").splitlines():
+                digest, _, rel_path = line.partition("  ")
+                digest_map[rel_path] = digest
+        return digest_map
+
+    def _verify_files(self, ssh_client: paramiko.SSHClient, remote_dir: str,
+                      path_pair_list: list):
+        """compare crypto_tool.Hasher digests of local files with sha256sum
+        of the remote ones
+
+        Args:
+            path_pair_list: list of (local_path, remote path relative to remote_dir)
+
+        Returns:
+            ret_code: 0, or EBADMSG if a digest differs
+        """
+        local_digest_map = crypto_tool.Hasher.hash_files(
+            [local_path for local_path, _ in path_pair_list])
+        remote_digest_map = self._remote_digest_map(
+            ssh_client, remote_dir, [rel_path for _, rel_path in path_pair_list])
+        ret_code = 0
+        for local_path, rel_path in path_pair_list:
+            if (local_digest_map[local_path] is None or
+                local_digest_map[local_path] != remote_digest_map.get(rel_path)):
+                self._logger.error("digest mismatch: {} --> {}/{}".format(
+                    local_path, remote_dir, rel_path))
+                ret_code = errno.EBADMSG
+        return ret_code
+
+    def _put_file_list(self, ssh_client: paramiko.SSHClient, file_list: list,
+                       max_channels: int, part_size: int):
+        """send files over parallel sftp channels, each file is written to a
+        temp name and renamed, large files are split into ranges
+
+        Args:
+            file_list: list of (local_path, remote_path, file_size, file_mode)
+
+        Returns:
+            ret_code: 0, or the error code of the last failed file
+            part_num: number of transferred ranges
+        """
+        if (len(file_list) == 0):
+            return 0, 0
+        sftp_pool = _SFTPChannelPool(ssh_client.get_transport(), max_channels)
+        ret_code = 0
+        part_num = 0
+        fd_list = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_channels) as executor:
+                future_map = {}
+                for local_path, remote_path, file_size, file_mode in file_list:
+                    tmp_path = "{}.tmp-{}".format(remote_path, os.getpid())
+                    local_fd = os.open(local_path, os.O_RDONLY)
+                    fd_list.append(local_fd)
+                    part_list = SSHCmd._part_list(file_size, part_size)
+                    if (len(part_list) > 1):
+                        sftp = sftp_pool.get()
+                        try:
+                            sftp.open(tmp_path, "wb").close()
+                        finally:
+                            sftp_pool.put(sftp)
+                    for offset, length in part_list:
+                        future = executor.submit(self._put_range, sftp_pool, local_fd, tmp_path,
+                                                 offset, length,
+                                                 "wb" if len(part_list) == 1 else "r+b")
+                        future_map[future] = (local_path, remote_path, tmp_path, file_mode)
+                    part_num += len(part_list)
+
+                failed_path_set = set()
+                for future, (local_path, _, _, _) in future_map.items():
+                    try:
+                        future.result()
+                    except (IOError, OSError, paramiko.SSHException) as sftp_err:
+                        self._logger.error("put file ({}) failed: {}".format(
+                            local_path, str(sftp_err)))
+                        ret_code = SSHCmd._sftp_err_code(sftp_err)
+                        failed_path_set.add(local_path)
+
+                # rename the complete files
+                sftp = sftp_pool.get()
+                try:
+                    for local_path, remote_path, tmp_path, file_mode in \
+                            dict.fromkeys(future_map.values()):
+                        if (local_path in failed_path_set):
+                            continue
+                        try:
+                            sftp.chmod(tmp_path, stat.S_IMODE(file_mode))
+                            self._sftp_replace(sftp, tmp_path, remote_path)
+                        except IOError as sftp_err:
+                            self._logger.error("put file ({}) failed: {}".format(
+                                local_path, str(sftp_err)))
+                            ret_code = SSHCmd._sftp_err_code(sftp_err)
+                finally:
+                    sftp_pool.put(sftp)
+        except (IOError, OSError, paramiko.SSHException) as sftp_err:
+            self._logger.error("put files failed: {}".format(str(sftp_err)))
+            ret_code = SSHCmd._sftp_err_code(sftp_err)
+        finally:
+            for local_fd in fd_list:
+                os.close(local_fd)
+            sftp_pool.close()
+        return ret_code, part_num
+
+    def _put_tar_batch(self, ssh_client: paramiko.SSHClient, remote_dir: str,
+                       batch_list: list):
+        """send many small files as one tar stream extracted by the remote tar
+
+        Args:
+            batch_list: list of (local_path, path relative to remote_dir)
+
+        Returns:
+            ret_code: return code
+        """
+        cmd = "tar -xf - -C {}".format(shlex.quote(remote_dir))
+        channel, ret_code, _ = self._open_channel(ssh_client, cmd)
+        if (channel is None):
+            return ret_code
+        try:
+            with channel.makefile("wb") as channel_file, \
+                    tarfile.open(fileobj=channel_file, mode="w|") as tar_file:
+                for local_path, rel_path in batch_list:
+                    tar_file.add(local_path, arcname=rel_path, recursive=False)
+            channel.shutdown_write()
+        except (OSError, paramiko.SSHException) as sftp_err:
+            self._logger.error("put tar batch failed: {}".format(str(sftp_err)))
+            channel.close()
+            return SSHCmd._sftp_err_code(sftp_err)
+        channel_iter = self._iter_channel(channel, cmd, None)
+        while True:
+            try:
+                next(channel_iter)
+            except StopIteration as stop_iteration:
+                return stop_iteration.value
+
+    def put(self, local_path: str, remote_path: str, max_channels=_g_ssh_max_channels,
+            part_size=_g_sftp_part_size, is_compress=False, is_verify=True,
+            is_dry_run=False):
+        """upload a file over sftp, pipelined, large files in parallel ranges
+
+        Args:
+            local_path (str): local file
+            remote_path (str): remote file, replaced atomically
+            max_channels (int, optional): parallel sftp channels.
+            part_size (int, optional): size of the ranges of a large file.
+            is_compress (bool, optional): zlib compressed transport (pooled
+                connections only). Defaults to False.
+            is_verify (bool, optional): compare the sha256 of both sides. Defaults to True.
+            is_dry_run (bool, optional): only print. Defaults to False.
+
+        Returns:
+            ret_code: return code
+        """
+        local_path = os.path.expanduser(local_path)
+        self._logger.info("{}put {} --> {}".format("DRY_RUN: " if is_dry_run else "",
+                                                   local_path, remote_path))
+        if (is_dry_run):
+            return 0
+        try:
+            local_stat = os.stat(local_path)
+        except OSError as os_err:
+            self._logger.error("put file ({}) failed: {}".format(local_path, str(os_err)))
+            return os_err.errno
+        conn, ssh_client, ret_code = self._borrow_client(is_compress)
+        if (ret_code != 0):
+            return ret_code
+        ret_code, _ = self._put_file_list(
+            ssh_client, [(local_path, remote_path, local_stat.st_size, local_stat.st_mode)],
+            max_channels, part_size)
+        if (ret_code == 0 and is_verify):
+            remote_dir, remote_name = os.path.split(remote_path)
+            ret_code = self._verify_files(ssh_client, remote_dir if remote_dir else ".",
+                                          [(local_path, remote_name)])
+        self._return_client(conn, is_broken=(ret_code == errno.EIO))
+        return ret_code
+
+    def get(self, remote_path: str, local_path: str, max_channels=_g_ssh_max_channels,
+            part_size=_g_sftp_part_size, is_compress=False, is_verify=True,
+            is_dry_run=False):
+        """download a file over sftp, pipelined, large files in parallel ranges
+
+        Args:
+            remote_path (str): remote file
+            local_path (str): local file, replaced atomically
+            max_channels (int, optional): parallel sftp channels.
+            part_size (int, optional): size of the ranges of a large file.
+            is_compress (bool, optional): zlib compressed transport (pooled
+                connections only). Defaults to False.
+            is_verify (bool, optional): compare the sha256 of both sides. Defaults to True.
+            is_dry_run (bool, optional): only print. Defaults to False.
+
+        Returns:
+            ret_code: return code
+        """
+        local_path = os.path.expanduser(local_path)
+        self._logger.info("{}get {} --> {}".format("DRY_RUN: " if is_dry_run else "",
+                                                   remote_path, local_path))
+        if (is_dry_run):
+            return 0
+        conn, ssh_client, ret_code = self._borrow_client(is_compress)
+        if (ret_code != 0):
+            return ret_code
+        sftp_pool = _SFTPChannelPool(ssh_client.get_transport(), max_channels)
+        tmp_path = "{}.tmp-{}".format(local_path, os.getpid())
+        local_fd = None
+        try:
+            sftp = sftp_pool.get()
+            try:
+                remote_stat = sftp.stat(remote_path)
+            finally:
+                sftp_pool.put(sftp)
+            local_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.ftruncate(local_fd, remote_stat.st_size)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_channels) as executor:
+                future_list = [executor.submit(self._get_range, sftp_pool, remote_path, local_fd,
+                                               offset, length)
+                               for offset, length in
+                               SSHCmd._part_list(remote_stat.st_size, part_size)]
+                for future in future_list:
+                    future.result()
+            os.fchmod(local_fd, stat.S_IMODE(remote_stat.st_mode))
+            os.close(local_fd)
+            local_fd = None
+            os.replace(tmp_path, local_path)
+        except (IOError, OSError, paramiko.SSHException) as sftp_err:
+            self._logger.error("get file ({}) failed: {}".format(remote_path, str(sftp_err)))
+            ret_code = SSHCmd._sftp_err_code(sftp_err)
+            if (local_fd is not None):
+                os.close(local_fd)
+            if (os.path.exists(tmp_path)):
+                os.unlink(tmp_path)
+        finally:
+            sftp_pool.close()
+        if (ret_code == 0 and is_verify):
+            remote_dir, remote_name = os.path.split(remote_path)
+            ret_code = self._verify_files(ssh_client, remote_dir if remote_dir else ".",
+                                          [(local_path, remote_name)])
+        self._return_client(conn, is_broken=(ret_code == errno.EIO))
+        return ret_code
+
+    def put_tree(self, local_dir: str, remote_dir: str, max_channels=_g_ssh_max_channels,
+                 part_size=_g_sftp_part_size, is_compress=False, is_verify=True,
+                 is_dry_run=False):
+        """upload a dir, small files are batched into tar streams (the remote
+        needs tar, else they go over sftp), the others go over parallel sftp
+        channels like put
+
+        Args:
+            local_dir (str): local dir
+            remote_dir (str): remote dir, created if missing
+            max_channels (int, optional): parallel channels, tar and sftp together.
+            part_size (int, optional): size of the ranges of a large file.
+            is_compress (bool, optional): zlib compressed transport (pooled
+                connections only). Defaults to False.
+            is_verify (bool, optional): compare the sha256 of all the files. Defaults to True.
+            is_dry_run (bool, optional): only print. Defaults to False.
+
+        Returns:
+            ret_code: return code
+            stats: dict of file_num, byte_num, batch_num, part_num, elapsed, mb_per_second
+        """
+        start_time = time.monotonic()
+        local_dir = os.path.abspath(os.path.expanduser(local_dir))
+        self._logger.info("{}put tree {} --> {}".format("DRY_RUN: " if is_dry_run else "",
+                                                        local_dir, remote_dir))
+        stats = {"file_num": 0, "byte_num": 0, "batch_num": 0, "part_num": 0}
+        rel_dir_list = []
+        small_file_list = []
+        large_file_list = []
+        for dir_path, _, file_name_list in os.walk(local_dir):
+            rel_dir = os.path.relpath(dir_path, local_dir)
+            rel_dir_list.append(rel_dir)
+            for file_name in file_name_list:
+                local_path = os.path.join(dir_path, file_name)
+                rel_path = os.path.normpath(os.path.join(rel_dir, file_name))
+                file_stat = os.lstat(local_path)
+                if (not stat.S_ISREG(file_stat.st_mode)):
+                    self._logger.warning("skip non-regular file: {}".format(local_path))
+                    continue
+                stats["file_num"] += 1
+                stats["byte_num"] += file_stat.st_size
+                if (file_stat.st_size <= _g_sftp_small_file_size):
+                    small_file_list.append((local_path, rel_path, file_stat.st_size))
+                else:
+                    large_file_list.append((local_path, rel_path, file_stat))
+        if (is_dry_run):
+            return 0, stats
+
+        conn, ssh_client, ret_code = self._borrow_client(is_compress)
+        if (ret_code != 0):
+            return ret_code, stats
+        for start_idx in range(0, len(rel_dir_list), _g_sftp_argv_chunk_size):
+            cmd = "mkdir -p -- {}".format(" ".join(
+                shlex.quote(os.path.normpath(os.path.join(remote_dir, rel_dir)))
+                for rel_dir in rel_dir_list[start_idx:start_idx + _g_sftp_argv_chunk_size]))
+            _, _, ret_code, _ = self._run_channel(ssh_client, cmd, None)
+            if (ret_code != 0):
+                self._logger.error("create remote dirs failed: {}".format(ret_code))
+                self._return_client(conn)
+                return ret_code, stats
+
+        batch_list = [[]]
+        batch_size = 0
+        for local_path, rel_path, file_size in small_file_list:
+            if (batch_size + file_size > _g_sftp_tar_batch_size and len(batch_list[-1]) != 0):
+                batch_list.append([])
+                batch_size = 0
+            batch_list[-1].append((local_path, rel_path))
+            batch_size += file_size
+        batch_list = [batch for batch in batch_list if len(batch) != 0]
+        stats["batch_num"] = len(batch_list)
+        # the tar and sftp channels share max_channels sessions of the
+        # transport, sshd refuses the ones beyond its MaxSessions
+        tar_channels = min(len(batch_list), max_channels)
+        if (len(large_file_list) != 0):
+            tar_channels = min(tar_channels, max_channels // 2)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(tar_channels, 1)) as executor:
+            batch_future_list = []
+            if (tar_channels != 0):
+                batch_future_list = [
+                    executor.submit(self._put_tar_batch, ssh_client, remote_dir, batch)
+                    for batch in batch_list]
+            ret_code, stats["part_num"] = self._put_file_list(
+                ssh_client, [(local_path, os.path.join(remote_dir, rel_path), file_stat.st_size,
+                              file_stat.st_mode)
+                             for local_path, rel_path, file_stat in large_file_list],
+                max_channels - tar_channels, part_size)
+            if (tar_channels == 0):
+                # no channel left for tar (max_channels 1), the batches go after
+                batch_future_list = [
+                    executor.submit(self._put_tar_batch, ssh_client, remote_dir, batch)
+                    for batch in batch_list]
+            fallback_file_list = []
+            for batch, future in zip(batch_list, batch_future_list):
+                if (future.result() != 0):
+                    self._logger.warning("tar batch failed, send its files over sftp")
+                    fallback_file_list.extend(
+                        (local_path, os.path.join(remote_dir, rel_path),
+                         os.stat(local_path).st_size, os.stat(local_path).st_mode)
+                        for local_path, rel_path in batch)
+        if (len(fallback_file_list) != 0):
+            fallback_ret, fallback_part_num = self._put_file_list(
+                ssh_client, fallback_file_list, max_channels, part_size)
+            stats["part_num"] += fallback_part_num
+            ret_code = fallback_ret if fallback_ret != 0 else ret_code
+
+        if (ret_code == 0 and is_verify):
+            ret_code = self._verify_files(
+                ssh_client, remote_dir,
+                [(local_path, rel_path) for local_path, rel_path, _ in small_file_list] +
+                [(local_path, rel_path) for local_path, rel_path, _ in large_file_list])
+        self._return_client(conn, is_broken=(ret_code == errno.EIO))
+        stats["elapsed"] = time.monotonic() - start_time
+        stats["mb_per_second"] = stats["byte_num"] / 1024 / 1024 / max(stats["elapsed"], 1e-9)
+        self._logger.info("put tree done: {} files, {} bytes in {:.3f}s ({:.1f} MB/s)".format(
+            stats["file_num"], stats["byte_num"], stats["elapsed"], stats["mb_per_second"]))
+        return ret_code, stats
+
+    @staticmethod
+    def _rolling_checksum_array(byte_array, block_size: int, pos_num: int):
+        """adler32 of the block_size windows starting at the first pos_num
+        positions of byte_array, from two prefix sums
+        """
+        value_array = byte_array.astype(numpy.int64)
+        sum_array = numpy.zeros(len(value_array) + 1, dtype=numpy.int64)
+        numpy.cumsum(value_array, out=sum_array[1:])
+        weight_sum_array = numpy.zeros(len(value_array) + 1, dtype=numpy.int64)
+        numpy.cumsum(value_array * numpy.arange(len(value_array), dtype=numpy.int64),
+                     out=weight_sum_array[1:])
+        pos_array = numpy.arange(pos_num, dtype=numpy.int64)
+        window_sum_array = sum_array[block_size:block_size + pos_num] - sum_array[:pos_num]
+        weight_array = (pos_array + block_size) * window_sum_array - (
+            weight_sum_array[block_size:block_size + pos_num] - weight_sum_array[:pos_num])
+        return (((block_size + weight_array) % _G_ADLER_MOD) << 16) | (
+            (1 + window_sum_array) % _G_ADLER_MOD)
+
+    @staticmethod
+    def _match_blocks(in_data, block_size: int, block_map: dict, is_use_numpy: bool):
+        """find the blocks of the remote file in the local data, greedy from
+        the start like rsync. After a match the next block is checked in
+        place, after a miss the adler32 is rolled forward (with numpy over
+        windows doubling up to _g_sync_scan_size) until the next match
+
+        Args:
+            in_data: local data (bytes or mmap)
+            block_map: adler32 --> {sha256: remote block index}
+
+        Yields:
+            (offset, block index) of each match, increasing and not overlapping
+        """
+        def _check(offset: int, weak_sum: int):
+            strong_map = block_map.get(weak_sum)
+            if (strong_map is None):
+                return None
+            return strong_map.get(hashlib.sha256(in_data[offset:offset + block_size]).hexdigest())
+
+        data_size = len(in_data)
+        if (is_use_numpy):
+            # a position is a candidate if both 16-bit halves of its adler32
+            # are the halves of some block's, a table lookup each
+            weak_key_array = numpy.fromiter(block_map.keys(), dtype=numpy.int64)
+            low_flag_array = numpy.zeros(1 << 16, dtype=numpy.bool_)
+            low_flag_array[weak_key_array & 0xffff] = True
+            high_flag_array = numpy.zeros(1 << 16, dtype=numpy.bool_)
+            high_flag_array[weak_key_array >> 16] = True
+            byte_array = numpy.frombuffer(in_data, dtype=numpy.uint8)
+        scan_size = block_size
+        pos = 0
+        while pos + block_size <= data_size:
+            weak_sum = zlib.adler32(in_data[pos:pos + block_size])
+            block_idx = _check(pos, weak_sum)
+            if (block_idx is not None):
+                yield pos, block_idx
+                pos += block_size
+                scan_size = block_size
+                continue
+
+            if (is_use_numpy):
+                scan_start = pos + 1
+                scan_end = min(scan_start + scan_size, data_size - block_size + 1)
+                if (scan_start >= scan_end):
+                    return
+                weak_array = SSHCmd._rolling_checksum_array(
+                    byte_array[scan_start:scan_end + block_size - 1], block_size,
+                    scan_end - scan_start)
+                for cand_idx in numpy.flatnonzero(low_flag_array[weak_array & 0xffff] &
+                                                  high_flag_array[weak_array >> 16]):
+                    block_idx = _check(scan_start + int(cand_idx), int(weak_array[cand_idx]))
+                    if (block_idx is not None):
+                        pos = scan_start + int(cand_idx)
+                        break
+                if (block_idx is None):
+                    # scan_end itself is checked by the next round
+                    pos = scan_end
+                    scan_size = min(scan_size * 2, _g_sync_scan_size)
+                    continue
+                yield pos, block_idx
+                pos += block_size
+                scan_size = block_size
+                continue
+
+            while pos + block_size < data_size:
+                out_byte = in_data[pos]
+                in_byte = in_data[pos + block_size]
+                sum_a = ((weak_sum & 0xffff) - out_byte + in_byte) % _G_ADLER_MOD
+                sum_b = ((weak_sum >> 16) - block_size * out_byte + sum_a - 1) % _G_ADLER_MOD
+                weak_sum = (sum_b << 16) | sum_a
+                pos += 1
+                block_idx = _check(pos, weak_sum)
+                if (block_idx is not None):
+                    break
+            if (block_idx is None):
+                return
+            yield pos, block_idx
+            pos += block_size
+
+    def _remote_block_map(self, ssh_client: paramiko.SSHClient, remote_path: str,
+                          block_size: int):
+        """run _G_SYNC_SIG_SCRIPT on the remote file
+
+        Returns:
+            block_map: adler32 --> {sha256: block index}, None if failed
+            block_num: number of remote blocks
+            sig_size: bytes of signatures received
+        """
+        cmd = "python3 -c {} {} {}".format(shlex.quote(_G_SYNC_SIG_SCRIPT),
+                                          shlex.quote(remote_path), block_size)
+        stdout_buf, stderr_buf, ret_code, _ = self._run_channel(ssh_client, cmd, None)
+        if (ret_code != 0):
+            self._logger.warning("remote block checksums failed ({}): {}".format(
+                ret_code, (stderr_buf or "").strip().splitlines()[-1:]))
+            return None, 0, 0
+        block_map = {}
+        block_num = 0
+        for line in stdout_buf.splitlines():
+            weak_hex, _, strong_hex = line.partition(" ")
+            block_map.setdefault(int(weak_hex, 16), {}).setdefault(strong_hex, block_num)
+            block_num += 1
+        return block_map, block_num, len(stdout_buf)
+
+    def sync_file(self, local_path: str, remote_path: str, block_size=_g_sync_block_size,
+                  is_compress=False, is_use_numpy=True, is_dry_run=False):
+        """update a remote file to the local one like rsync: the remote side
+        sends the adler32 + sha256 of its blocks (needs python3 there), only
+        the local data not found among them is sent, and the remote side
+        rebuilds the file into a temp one, checks its sha256 and renames it.
+        A missing remote file (or python3) falls back to put
+
+        Args:
+            local_path (str): local file
+            remote_path (str): remote file
+            block_size (int, optional): block size, smaller finds more reuse
+                but costs more checksums.
+            is_compress (bool, optional): zlib compressed transport (pooled
+                connections only). Defaults to False.
+            is_use_numpy (bool, optional): compute the rolling checksums with
+                numpy when it is installed. Defaults to True.
+            is_dry_run (bool, optional): only print. Defaults to False.
+
+        Returns:
+            ret_code: return code
+            stats: dict of file_size, block_num, matched_block_num, literal_size,
+                sent_size, sig_size, saved_size, is_full_copy, elapsed
+        """
+        start_time = time.monotonic()
+        local_path = os.path.expanduser(local_path)
+        self._logger.info("{}sync {} --> {}".format("DRY_RUN: " if is_dry_run else "",
+                                                    local_path, remote_path))
+        stats = {"file_size": 0, "block_num": 0, "matched_block_num": 0, "literal_size": 0,
+                 "sent_size": 0, "sig_size": 0, "saved_size": 0, "is_full_copy": False}
+        if (is_dry_run):
+            return 0, stats
+        try:
+            stats["file_size"] = os.stat(local_path).st_size
+        except OSError as os_err:
+            self._logger.error("sync file ({}) failed: {}".format(local_path, str(os_err)))
+            return os_err.errno, stats
+        conn, ssh_client, ret_code = self._borrow_client(is_compress)
+        if (ret_code != 0):
+            return ret_code, stats
+        block_map, stats["block_num"], stats["sig_size"] = self._remote_block_map(
+            ssh_client, remote_path, block_size)
+        if (block_map is None or stats["file_size"] < block_size):
+            self._return_client(conn)
+            ret_code = self.put(local_path, remote_path, is_compress=is_compress)
+            stats["is_full_copy"] = True
+            stats["sent_size"] = stats["file_size"]
+            stats["saved_size"] = -stats["sig_size"]
+            stats["elapsed"] = time.monotonic() - start_time
+            return ret_code, stats
+
+        with open(local_path, "rb") as in_file, \
+                mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as in_data:
+            # merge the matches into copy ranges of consecutive remote blocks
+            op_list = []
+            pos = 0
+            for offset, block_idx in SSHCmd._match_blocks(
+                    in_data, block_size, block_map, is_use_numpy and _g_has_numpy):
+                if (offset > pos):
+                    op_list.append((b"L", pos, offset - pos))
+                elif (len(op_list) != 0 and op_list[-1][0] == b"C" and
+                      op_list[-1][1] + op_list[-1][2] == block_idx):
+                    op_list[-1] = (b"C", op_list[-1][1], op_list[-1][2] + 1)
+                    pos = offset + block_size
+                    stats["matched_block_num"] += 1
+                    continue
+                op_list.append((b"C", block_idx, 1))
+                pos = offset + block_size
+                stats["matched_block_num"] += 1
+            tail_data = in_data[pos:]
+            # a copy of the short last remote block covers the rest of the file
+            if (0 < len(tail_data) < block_size and
+                block_map.get(zlib.adler32(tail_data), {}).get(
+                    hashlib.sha256(tail_data).hexdigest()) == stats["block_num"] - 1):
+                if (len(op_list) != 0 and op_list[-1][0] == b"C" and
+                    op_list[-1][1] + op_list[-1][2] == stats["block_num"] - 1):
+                    op_list[-1] = (b"C", op_list[-1][1], op_list[-1][2] + 1)
+                else:
+                    op_list.append((b"C", stats["block_num"] - 1, 1))
+                stats["matched_block_num"] += 1
+            elif (len(tail_data) != 0):
+                op_list.append((b"L", pos, len(tail_data)))
+
+            if (op_list == [(b"C", 0, stats["block_num"])]):
+                self._logger.info("remote file is up to date")
+                ret_code = 0
             else:
-                self._logger.error("run failed: {}\nerror: {}\nret: {}".format(
-                    common_tool.Color.set_text(cmd, common_tool.Color.BLUE),
-                    stdout_buf, ret_code))
-        return (stdout_buf, stderr_buf, ret_code)
+                ret_code = self._send_delta(ssh_client, remote_path, block_size, in_data,
+                                            op_list, stats)
+        self._return_client(conn, is_broken=(ret_code == errno.EIO))
+        stats["saved_size"] = stats["file_size"] - stats["sent_size"] - stats["sig_size"]
+        stats["elapsed"] = time.monotonic() - start_time
+        self._logger.info("sync done ({}): {}/{} blocks reused, sent {} of {} bytes, "
+                          "saved {} bytes in {:.3f}s".format(
+                              ret_code, stats["matched_block_num"], stats["block_num"],
+                              stats["sent_size"], stats["file_size"], stats["saved_size"],
+                              stats["elapsed"]))
+        return ret_code, stats
+
+    def _send_delta(self, ssh_client: paramiko.SSHClient, remote_path: str, block_size: int,
+                    in_data, op_list: list, stats: dict):
+        """stream the copy/literal frames of op_list to _G_SYNC_PATCH_SCRIPT
+
+        Returns:
+            ret_code: return code, EBADMSG if the rebuilt file differs
+        """
+        cmd = "python3 -c {} {} {} {}".format(
+            shlex.quote(_G_SYNC_PATCH_SCRIPT), shlex.quote(remote_path), block_size,
+            crypto_tool.Hasher.hash_data(in_data))
+        channel, ret_code, _ = self._open_channel(ssh_client, cmd)
+        if (channel is None):
+            return ret_code
+        try:
+            with channel.makefile("wb") as channel_file:
+                for op, start, length in op_list:
+                    if (op == b"C"):
+                        channel_file.write(op + struct.pack(">QQ", start, length))
+                        stats["sent_size"] += 17
+                        continue
+                    channel_file.write(op + struct.pack(">Q", length))
+                    stats["sent_size"] += 9 + length
+                    stats["literal_size"] += length
+                    for frame_start in range(start, start + length,
+                                             _g_sync_literal_frame_size):
+                        channel_file.write(in_data[frame_start:min(
+                            frame_start + _g_sync_literal_frame_size, start + length)])
+                channel_file.write(b"E")
+                stats["sent_size"] += 1
+            channel.shutdown_write()
+        except (OSError, paramiko.SSHException) as ssh_err:
+            self._logger.error("send delta failed: {}".format(str(ssh_err)))
+            channel.close()
+            return SSHCmd._sftp_err_code(ssh_err)
+        channel_iter = self._iter_channel(channel, cmd, None)
+        while True:
+            try:
+                next(channel_iter)
+            except StopIteration as stop_iteration:
+                ret_code = stop_iteration.value
+                break
+        if (ret_code != 0):
+            self._logger.error("rebuild remote file failed: {}".format(ret_code))
+        return ret_code
 
     def close(self):
-        """close the connection
+        """close the connection, with a pool give back the connections still
+        borrowed (e.g. by an unfinished run_shell_iter), the idle ones stay
+        open for reuse until the pool reaps them
         """
-        self._ssh_client.close()
+        if (self._ssh_client is not None):
+            self._ssh_client.close()
+        if (self._ssh_pool is not None):
+            with self._borrow_lock:
+                conn_list = list(self._borrowed_set)
+                self._borrowed_set.clear()
+            for conn in conn_list:
+                # a channel may still run on it, do not hand it to others
+                self._ssh_pool.release(conn, is_broken=True)
         self._logger.info("close the connection done")
 
     def combine_multiple_cmd(self, cmd_list: list):
@@ -150,4 +1659,177 @@ class SSHCmd:
                 final_cmd = cur_cmd
             else:
                 final_cmd = final_cmd + "; " + cur_cmd
-        return final_cmd
\ No newline at end of file
+        return final_cmd
+
+class ClusterCmd:
+    def __init__(self, host_list: list, usr_name: str, pwd: str, port=22,
+                 max_workers=_g_cluster_max_workers, ssh_pool: SSHPool = None,
+                 host_log_level=logger.G_LOG_LEVEL_WARNING):
+        """run one command on many hosts concurrently
+
+        Args:
+            host_list (list): "host" or "host:port" entries
+            usr_name (str): user name
+            pwd (str): password
+            port (int, optional): default port. Defaults to 22.
+            max_workers (int, optional): hosts running at the same time.
+            ssh_pool (SSHPool, optional): pool of the connections, None for _g_ssh_pool.
+            host_log_level (optional): log level of the per-host SSHCmd loggers,
+                the grouped summary is logged by the third_lib logger.
+        """
+        self._max_workers = max_workers
+        self._ssh_cmd_map = {}
+        for host in host_list:
+            hostname, _, host_port = str(host).partition(":")
+            ssh_cmd = SSHCmd(host_port if host_port else str(port), hostname, usr_name, pwd,
+                             ssh_pool=ssh_pool)
+            ssh_cmd._logger.setLevel(host_log_level)
+            self._ssh_cmd_map[host] = ssh_cmd
+
+    def _run_host(self, host: str, cmd: str, timeout, deadline):
+        start_time = time.monotonic()
+        if (deadline is not None):
+            remain_time = deadline - start_time
+            if (remain_time <= 0):
+                return None, None, errno.ECANCELED, 0.0
+            timeout = remain_time if timeout is None else min(timeout, remain_time)
+        stdout_buf, stderr_buf, ret_code = self._ssh_cmd_map[host].run_shell(cmd, timeout=timeout)
+        return stdout_buf, stderr_buf, ret_code, time.monotonic() - start_time
+
+    def run_shell(self, cmd: str, timeout=None, deadline=None, is_dry_run=False):
+        """run a shell command on all the hosts
+
+        Args:
+            cmd (str): shell command
+            timeout (float, optional): max run time on each host. Defaults to None.
+            deadline (float, optional): max run time of the whole fan-out in
+                seconds, hosts not started by then get ECANCELED and the ones
+                still running ETIMEDOUT. Defaults to None.
+            is_dry_run (bool, optional): only print the command. Defaults to False.
+
+        Returns:
+            result_map: host --> (stdout_buf, stderr_buf, ret_code, elapsed_second)
+        """
+        if (is_dry_run):
+            _g_logger.info("DRY_RUN on {} hosts: {}".format(
+                len(self._ssh_cmd_map), common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+            return {host: (None, None, 0, 0.0) for host in self._ssh_cmd_map}
+
+        _g_logger.info("run cmd on {} hosts: {}".format(
+            len(self._ssh_cmd_map), common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        start_time = time.monotonic()
+        abs_deadline = None if deadline is None else start_time + deadline
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        future_map = {executor.submit(self._run_host, host, cmd, timeout, abs_deadline): host
+                      for host in self._ssh_cmd_map}
+        # a host stuck in connect must not hold the deadline, leave it behind
+        _, not_done_set = concurrent.futures.wait(
+            future_map, timeout=None if deadline is None else deadline + 1)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        result_map = {}
+        for future, host in future_map.items():
+            if (future in not_done_set):
+                result_map[host] = (None, None, errno.ETIMEDOUT if future.running()
+                                    else errno.ECANCELED, time.monotonic() - start_time)
+            else:
+                result_map[host] = future.result()
+        self.log_summary(cmd, result_map, time.monotonic() - start_time)
+        return result_map
+
+    @staticmethod
+    def group_results(result_map: dict):
+        """group the hosts with identical (stdout_buf, stderr_buf, ret_code)
+
+        Returns:
+            group_list: list of (host_list, (stdout_buf, stderr_buf, ret_code)),
+                the largest group first
+        """
+        group_map = {}
+        for host, result in result_map.items():
+            group_map.setdefault(tuple(result[:3]), []).append(host)
+        return sorted(((host_list, output) for output, host_list in group_map.items()),
+                      key=lambda group: -len(group[0]))
+
+    @staticmethod
+    def log_summary(cmd: str, result_map: dict, elapsed_time: float):
+        """log one line per output group and the failed hosts"""
+        failed_host_list = [host for host, result in result_map.items() if result[2] != 0]
+        elapsed_list = sorted(result[3] for result in result_map.values())
+        _g_logger.info("cmd done on {} hosts in {:.3f}s (max host {:.3f}s): {}".format(
+            len(result_map), elapsed_time, elapsed_list[-1] if elapsed_list else 0.0,
+            common_tool.Color.set_text(cmd, common_tool.Color.BLUE)))
+        for host_list, (stdout_buf, stderr_buf, ret_code) in ClusterCmd.group_results(result_map):
+            host_str = ", ".join(str(host) for host in host_list[:_g_cluster_summary_host_num])
+            if (len(host_list) > _g_cluster_summary_host_num):
+                host_str += ", ... (+{})".format(len(host_list) - _g_cluster_summary_host_num)
+            log_func = _g_logger.info if ret_code == 0 else _g_logger.error
+            log_func("{} hosts [{}] ret: {}\noutput: {}{}".format(
+                len(host_list), host_str, ret_code, stdout_buf,
+                "\nerror: {}".format(stderr_buf) if stderr_buf else ""))
+        if (len(failed_host_list) != 0):
+            _g_logger.error("failed on {}/{} hosts".format(len(failed_host_list),
+                                                            len(result_map)))
+
+
+class SSHOutputStream():
+    STDOUT = cmd_handler.CmdOutputStream.STDOUT
+    STDERR = cmd_handler.CmdOutputStream.STDERR
+
+    def __init__(self, ssh_cmd: SSHCmd, cmd: str, timeout=None, is_dry_run=False):
+        """lines of a remote command, iterate it to get (stream_name, line) as
+        they arrive, ret_code is set when the iteration finishes, the command
+        starts on the first iteration
+
+        Args:
+            ssh_cmd (SSHCmd): remote host
+            cmd (str): shell command
+            timeout (float, optional): max run time. Defaults to None.
+            is_dry_run (bool, optional): yield nothing. Defaults to False.
+        """
+        self._ssh_cmd = ssh_cmd
+        self._cmd = cmd
+        self._timeout = timeout
+        self._is_dry_run = is_dry_run
+        self.ret_code = 0 if is_dry_run else None
+
+    def __iter__(self):
+        if (self._is_dry_run):
+            return
+        ssh_cmd = self._ssh_cmd
+        ssh_cmd._logger.info("run cmd: {}".format(
+            common_tool.Color.set_text(self._cmd, common_tool.Color.BLUE)))
+        conn, ssh_client, self.ret_code = ssh_cmd._borrow_client()
+        if (self.ret_code != 0):
+            return
+        channel, self.ret_code, is_broken = ssh_cmd._open_channel(ssh_client, self._cmd)
+        if (channel is None):
+            ssh_cmd._return_client(conn, is_broken=is_broken)
+            return
+        partial_map = {SSHOutputStream.STDOUT: bytearray(), SSHOutputStream.STDERR: bytearray()}
+        channel_iter = ssh_cmd._iter_channel(channel, self._cmd, self._timeout)
+        self.ret_code = None
+        try:
+            while True:
+                try:
+                    stream_name, data = next(channel_iter)
+                except StopIteration as stop_iteration:
+                    self.ret_code = stop_iteration.value
+                    break
+                partial_buf = partial_map[stream_name]
+                partial_buf.extend(data)
+                line_list = partial_buf.split(b"\n")
+                partial_buf[:] = line_list.pop()
+                for line in line_list:
+                    yield stream_name, line.decode(common_tool._g_encode_fmt, errors="replace")
+            for stream_name, partial_buf in partial_map.items():
+                if (len(partial_buf) != 0):
+                    yield stream_name, partial_buf.decode(common_tool._g_encode_fmt,
+                                                          errors="replace")
+            ssh_cmd._log_cmd_result(self._cmd, "", "", self.ret_code, False)
+        finally:
+            # the consumer may stop early, close() stops the remote command
+            channel_iter.close()
+            if (self.ret_code is None):
+                self.ret_code = errno.ECANCELED
+            ssh_cmd._return_client(conn, is_broken=(self.ret_code == errno.EIO))
@@ -0,0 +1,108 @@
+import hashlib
+import io
+import os
+import random
+
+import pytest
+
+from my_py import chunk_tool
+
+FastCDC = chunk_tool.FastCDC
+_MIN, _AVG, _MAX = 256, 1024, 4096
+
+
+def _random_data(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+
+def _chunker(is_use_numpy=True, **kwargs):
+    chunker = FastCDC(min_size=_MIN, avg_size=_AVG, max_size=_MAX, **kwargs)
+    if (not is_use_numpy):
+        chunker.is_use_numpy = False
+    return chunker
+
+
+class _SlowStream:
+    # returns at most read_size bytes per read, like a pipe
+    def __init__(self, data, read_size):
+        self._in_stream = io.BytesIO(data)
+        self._read_size = read_size
+
+    def read(self, size):
+        return self._in_stream.read(min(size, self._read_size))
+
+
+@pytest.mark.skipif(not chunk_tool._g_has_numpy, reason="numpy not installed")
+@pytest.mark.parametrize("size", [0, 100, _MIN, _MAX, _MAX * 3, 200003])
+def test_numpy_and_python_cut_the_same(size):
+    data = _random_data(size)
+    assert _chunker(True).cut_points(data) == _chunker(False).cut_points(data)
+    # a tail shorter than max_size is left for the next buffer
+    assert _chunker(True).cut_points(data, is_eof=False) == \
+        _chunker(False).cut_points(data, is_eof=False)
+
+
+@pytest.mark.skipif(not chunk_tool._g_has_numpy, reason="numpy not installed")
+def test_numpy_and_python_on_low_entropy_data():
+    # long runs never match the mask, chunks are cut at max_size
+    data = bytes(50000) + b"ab" * 20000 + _random_data(30000)
+    cut_list, pos = _chunker(True).cut_points(data)
+    assert (cut_list, pos) == _chunker(False).cut_points(data)
+    assert cut_list[0] == (0, _MAX)
+
+
+@pytest.mark.parametrize("is_use_numpy", [True, False])
+def test_chunks_cover_the_data(is_use_numpy):
+    data = _random_data(300001)
+    chunk_list = list(_chunker(is_use_numpy).chunk_data(data))
+    offset = 0
+    for chunk_offset, length, fp in chunk_list:
+        assert chunk_offset == offset
+        assert length <= _MAX
+        assert fp == hashlib.sha256(data[offset:offset + length]).hexdigest()
+        offset += length
+    assert offset == len(data)
+    assert all(length >= _MIN for _, length, _ in chunk_list[:-1])
+    # the average lands near avg_size
+    assert _AVG / 2 < len(data) / len(chunk_list) < _AVG * 2
+
+
+@pytest.mark.parametrize("is_use_numpy", [True, False])
+def test_data_file_and_stream_agree(tmp_path, is_use_numpy):
+    data = _random_data(200000, seed=2)
+    file_path = os.path.join(tmp_path, "data")
+    with open(file_path, "wb") as out_file:
+        out_file.write(data)
+    chunker = _chunker(is_use_numpy, is_hex=False)
+    # small windows, so chunks cross the window and read boundaries
+    chunker._window_size = 4 * _MAX
+    chunk_list = list(chunker.chunk_data(data))
+    assert list(chunker.chunk_file(file_path)) == chunk_list
+    assert list(chunker.chunk_stream(_SlowStream(data, 3000))) == chunk_list
+    assert list(_chunker(is_use_numpy, is_hex=False).chunk_data(data)) == chunk_list
+    assert all(type(fp) is bytes for _, _, fp in chunk_list)
+
+
+def test_insert_only_moves_nearby_chunks():
+    data = _random_data(200000, seed=3)
+    chunker = _chunker()
+    fp_set = {fp for _, _, fp in chunker.chunk_data(data)}
+    new_fp_list = [fp for _, _, fp in chunker.chunk_data(data[:5000] + b"inserted" + data[5000:])]
+    assert sum(fp not in fp_set for fp in new_fp_list) <= 3
+
+
+def test_edge_inputs(tmp_path):
+    chunker = _chunker()
+    assert list(chunker.chunk_data(b"")) == []
+    assert list(chunker.chunk_stream(io.BytesIO(b""))) == []
+    assert list(chunker.chunk_data(b"x")) == [(0, 1, hashlib.sha256(b"x").hexdigest())]
+    empty_path = os.path.join(tmp_path, "empty")
+    open(empty_path, "w").close()
+    assert list(chunker.chunk_file(empty_path)) == []
+    assert list(chunker.chunk_file(os.path.join(tmp_path, "missing"))) == []
+
+
+def test_invalid_sizes_use_default():
+    chunker = FastCDC(min_size=4096, avg_size=1024, max_size=512)
+    assert (chunker.min_size, chunker.avg_size, chunker.max_size) == (
+        chunk_tool._g_cdc_min_size, chunk_tool._g_cdc_avg_size, chunk_tool._g_cdc_max_size)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+
+import pytest
+
+from my_py import chunk_tool
+
+FingerprintIndex = chunk_tool.FingerprintIndex
+_NUMPY_MODE_LIST = [True, False] if chunk_tool._g_has_numpy else [False]
+
+
+def _fp_list(start, num):
+    return [hashlib.sha256(str(idx).encode()).digest() for idx in range(start, start + num)]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return os.path.join(tmp_path, "fp.idx")
+
+
+@pytest.mark.skipif(not chunk_tool._g_has_numpy, reason="numpy not installed")
+def test_bloom_numpy_and_python_agree():
+    import numpy
+    bloom_np = chunk_tool.BloomFilter(1000)
+    bloom_py = chunk_tool.BloomFilter(1000)
+    fp_list = _fp_list(0, 500)
+    fp_array = numpy.frombuffer(b"".join(fp_list), dtype=numpy.uint8).reshape(-1, 32)
+    bloom_np.add_many(None, fp_array=fp_array)
+    bloom_py.add_many(fp_list)
+    assert bytes(bloom_np._bit_array) == bytes(bloom_py._bit_array)
+    assert all(bloom_py.contains_many(fp_list))
+    assert bloom_np.contains_many(None, fp_array=fp_array).all()
+
+
+def test_bloom_false_positive_rate():
+    bloom = chunk_tool.BloomFilter(2000, fp_rate=0.01)
+    bloom.add_many(_fp_list(0, 2000))
+    false_num = sum(bloom.contains_many(_fp_list(10000, 10000)))
+    assert false_num < 300
+
+
+@pytest.mark.parametrize("is_use_numpy", _NUMPY_MODE_LIST)
+def test_insert_and_contains(index_path, is_use_numpy):
+    with FingerprintIndex(index_path, buffer_max_entry=100,
+                          is_use_numpy=is_use_numpy) as fp_index:
+        fp_list = _fp_list(0, 250)
+        # duplicates inside one batch count once
+        assert fp_index.insert_many(fp_list + fp_list[:10]) == [True] * 250 + [False] * 10
+        assert fp_index.merge_count == 1
+        assert fp_index.insert_many(fp_list[::7]) == [False] * len(fp_list[::7])
+        assert fp_index.contains_many(fp_list) == [True] * 250
+        assert fp_index.contains_many(_fp_list(1000, 50)) == [False] * 50
+        # hex str as given by the chunker
+        assert fp_index.contains_many([fp_list[3].hex(), _fp_list(999, 1)[0].hex()]) == \
+            [True, False]
+        assert fp_index.contains_many([b"short"]) is None
+        assert fp_index.insert_many([b"x" * 31]) is None
+        assert fp_index.contains_many([]) == []
+        assert len(fp_index) == 250
+        stats = fp_index.get_stats()
+        assert stats["entry_num"] == 250
+        assert stats["store_num"] + stats["buffer_num"] == 250
+        assert stats["disk_per_entry"] > 32
+
+
+@pytest.mark.parametrize("write_numpy, read_numpy",
+                         [(w, r) for w in _NUMPY_MODE_LIST for r in _NUMPY_MODE_LIST])
+def test_persisted_store(index_path, write_numpy, read_numpy):
+    fp_list = _fp_list(0, 3000)
+    with FingerprintIndex(index_path, buffer_max_entry=1000,
+                          is_use_numpy=write_numpy) as fp_index:
+        fp_index.insert_many(fp_list[:1500])
+        fp_index.insert_many(fp_list[1500:2900])
+        fp_index.insert_many(fp_list[2900:])
+        assert fp_index.merge_count == 2
+        assert fp_index.get_stats()["buffer_num"] == 100
+    # close() merged the buffer, the store file is sorted and complete
+    with FingerprintIndex(index_path, is_use_numpy=read_numpy) as fp_index:
+        assert len(fp_index) == 3000
+        assert fp_index.contains_many(fp_list) == [True] * 3000
+        assert fp_index.contains_many(_fp_list(5000, 100)) == [False] * 100
+        assert fp_index.insert_many(fp_list[:5] + _fp_list(5000, 1)) == [False] * 5 + [True]
+    with FingerprintIndex(index_path, is_use_numpy=read_numpy) as fp_index:
+        assert len(fp_index) == 3001
+
+
+@pytest.mark.parametrize("is_use_numpy", _NUMPY_MODE_LIST)
+def test_key_prefix_collision(index_path, is_use_numpy):
+    base_fp = hashlib.sha256(b"base").digest()
+    collide_list = [base_fp[:8] + bytes([idx]) * 24 for idx in range(4)]
+    with FingerprintIndex(index_path, is_use_numpy=is_use_numpy) as fp_index:
+        fp_index.insert_many(collide_list[:3])
+        fp_index.flush()
+        assert fp_index.contains_many(collide_list) == [True, True, True, False]
+        assert fp_index.insert_many([collide_list[3]]) == [True]
+
+
+def test_bloom_grows_with_the_store(index_path):
+    with FingerprintIndex(index_path, entry_num=100, buffer_max_entry=500) as fp_index:
+        old_bloom_size = len(fp_index.bloom)
+        fp_list = _fp_list(0, 1000)
+        fp_index.insert_many(fp_list)
+        assert len(fp_index.bloom) > old_bloom_size
+        assert all(fp_index.contains_many(fp_list))
+
+
+def test_invalid_store(index_path):
+    with open(index_path, "wb") as out_file:
+        out_file.write(b"not an index")
+    with pytest.raises(ValueError):
+        FingerprintIndex(index_path)
+
+    os.unlink(index_path)
+    with FingerprintIndex(index_path) as fp_index:
+        fp_index.insert_many(_fp_list(0, 10))
+    with pytest.raises(ValueError):
+        FingerprintIndex(index_path, fp_size=20)
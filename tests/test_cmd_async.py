@@ -0,0 +1,95 @@
+import asyncio
+import errno
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from my_py import cmd_handler
+
+
+def _handler():
+    return cmd_handler.AsyncCmdHandler(handler_name="test_async")
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def test_run_shell():
+    assert asyncio.run(_handler().run_shell("echo out; echo err >&2; exit 3")) == \
+        ("out", "err", 3)
+    assert asyncio.run(_handler().run_shell("echo out", is_dry_run=True)) == (None, None, 0)
+    assert asyncio.run(_handler().run_shell("echo out", timeout=-1)) == (None, None, -1)
+
+
+def test_timeout_stops_the_group():
+    start_time = time.monotonic()
+    # the output written before the timeout is kept
+    assert asyncio.run(_handler().run_shell("echo partial; echo warn >&2; sleep 7; true",
+                                            timeout=0.3)) == ("partial", "warn", errno.ETIMEDOUT)
+    assert time.monotonic() - start_time < 2
+    time.sleep(0.2)
+    assert _count_proc("sleep 7") == 0
+    assert cmd_handler.get_running_jobs() == []
+
+
+def test_cancel_stops_the_child():
+    async def _run():
+        task = asyncio.ensure_future(_handler().run_shell("sleep 8; true"))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(_run())
+    time.sleep(0.2)
+    assert _count_proc("sleep 8") == 0
+
+
+def test_run_many_concurrent_and_ordered():
+    cmd_list = ["sleep 0.{}; echo {}".format(5 - idx, idx) for idx in range(5)]
+    start_time = time.monotonic()
+    ret_list = asyncio.run(_handler().run_many(cmd_list))
+    assert time.monotonic() - start_time < 1.5
+    assert ret_list == [(str(idx), "", 0) for idx in range(5)]
+
+
+def test_run_many_bounded():
+    start_time = time.monotonic()
+    ret_list = asyncio.run(_handler().run_many(["sleep 0.3"] * 4, max_concurrency=2))
+    assert time.monotonic() - start_time >= 0.6
+    assert [ret_tuple[2] for ret_tuple in ret_list] == [0] * 4
+    assert asyncio.run(_handler().run_many(["true"] * 2, max_concurrency=0)) == \
+        [(None, None, -1)] * 2
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"),
+                    reason="no child watcher to replace")
+def test_no_waiter_thread_per_child():
+    async def _run():
+        task = asyncio.ensure_future(_handler().run_many(["sleep 0.5"] * 10))
+        await asyncio.sleep(0.2)
+        thread_name_list = [thread.name for thread in threading.enumerate()]
+        return await task, thread_name_list
+    ret_list, thread_name_list = asyncio.run(_run())
+    assert ret_list == [("", "", 0)] * 10
+    assert isinstance(asyncio.get_child_watcher(), cmd_handler._PidfdChildWatcher)
+    assert not any(name.startswith("waitpid-") for name in thread_name_list)
+
+    # each loop reaps its own children, e.g. loops in other threads
+    result_list = []
+    thread_list = [threading.Thread(target=lambda idx=idx: result_list.append(asyncio.run(
+        _handler().run_shell("sleep 0.2; echo {}".format(idx))))) for idx in range(3)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert sorted(result_list) == [(str(idx), "", 0) for idx in range(3)]
@@ -0,0 +1,95 @@
+import errno
+import os
+import signal
+import subprocess
+import time
+
+from my_py import cmd_handler
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_batch")
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def test_run_many_keeps_order():
+    ret_list = _handler().run_many(["echo {}".format(idx) for idx in range(8)], max_workers=3)
+    assert [ret_tuple[0] for ret_tuple in ret_list] == [str(idx) for idx in range(8)]
+    assert all(ret_tuple[2] == 0 for ret_tuple in ret_list)
+
+
+def test_map_shell_yields_as_completed():
+    cmd_list = ["sleep 0.5; echo slow", "echo fast"]
+    idx_list = [cmd_idx for cmd_idx, _ in _handler().map_shell(cmd_list, max_workers=2)]
+    assert idx_list == [1, 0]
+
+
+def test_batch_timeout_kills_the_whole_tree():
+    # "; true" keeps the shell from exec'ing sleep, sleep is a grandchild
+    cmd = "sleep 5; true"
+    start_time = time.monotonic()
+    ret_list = _handler().run_many([cmd, cmd], batch_timeout=0.5)
+    assert time.monotonic() - start_time < 2
+    assert [ret_tuple[2] for ret_tuple in ret_list] == [errno.ETIMEDOUT] * 2
+    time.sleep(0.2)
+    assert _count_proc("sleep 5") == 0
+
+
+def test_batch_timeout_keeps_finished_results():
+    cmd_list = ["echo first", "sleep 0.3; echo second", "sleep 5; true"]
+    ret_map = {}
+    for cmd_idx, ret_tuple in _handler().map_shell(cmd_list, max_workers=3,
+                                                   batch_timeout=1):
+        ret_map[cmd_idx] = ret_tuple
+        # a slow consumer, the second command ends before the batch times out
+        # but is not yielded until after
+        time.sleep(1.2)
+    assert ret_map == {0: ("first", "", 0), 1: ("second", "", 0),
+                       2: (None, None, errno.ETIMEDOUT)}
+
+
+def test_cancel_skips_reaped_processes(monkeypatch):
+    batch_ctx = cmd_handler._BatchCtx()
+    done_process = subprocess.Popen(["true"], start_new_session=True)
+    live_process = subprocess.Popen(["sleep", "5"], start_new_session=True)
+    assert batch_ctx.add_process(done_process) and batch_ctx.add_process(live_process)
+    assert batch_ctx.reap_process(done_process) == 0
+
+    signal_list = []
+    real_killpg = os.killpg
+
+    def _killpg(pgid, cur_signal):
+        signal_list.append((pgid, cur_signal))
+        real_killpg(pgid, cur_signal)
+    monkeypatch.setattr(os, "killpg", _killpg)
+    # a reaped pid may be reused by another group, it is never signaled
+    batch_ctx.cancel()
+    assert {pgid for pgid, _ in signal_list} == {live_process.pid}
+    assert batch_ctx.reap_process(live_process) == -signal.SIGTERM
+    new_process = subprocess.Popen(["true"])
+    assert not batch_ctx.add_process(new_process)
+    new_process.wait()
+
+
+def test_fail_fast_cancels_running_and_pending():
+    cmd_list = ["false", "sleep 5; true", "echo never"]
+    start_time = time.monotonic()
+    ret_list = _handler().run_many(cmd_list, max_workers=2, is_fail_fast=True)
+    assert time.monotonic() - start_time < 2
+    assert ret_list[0][2] == 1
+    assert ret_list[1][2] != 0
+    # not started (ECANCELED), or started and stopped or done before the cancel
+    assert ret_list[2] is not None
+
+
+def test_invalid_args():
+    ret_list = _handler().run_many(["true"], max_workers=0)
+    assert ret_list == [(None, None, -1)]
+
+
+def test_dry_run():
+    assert _handler().run_many(["false"], is_dry_run=True) == [(None, None, 0)]
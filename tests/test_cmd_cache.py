@@ -0,0 +1,99 @@
+import os
+import time
+
+import pytest
+
+from my_py import cmd_handler
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cmd_handler.invalidate_cmd_cache()
+    yield
+    cmd_handler.invalidate_cmd_cache()
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_cache")
+
+
+def _run_count(count_path):
+    with open(count_path) as in_file:
+        return len(in_file.read().split())
+
+
+def test_hit_until_ttl(tmp_path):
+    count_path = os.path.join(tmp_path, "count")
+    cmd = "echo run >> {0}; wc -l < {0}".format(count_path)
+    handler = _handler()
+    assert handler.run_shell(cmd, cache_ttl=0.5) == ("1", "", 0)
+    assert handler.run_shell(cmd, cache_ttl=0.5) == ("1", "", 0)
+    # another handler shares the cache
+    assert _handler().run_shell(cmd, cache_ttl=0.5) == ("1", "", 0)
+    assert _run_count(count_path) == 1
+    # no cache_ttl, always run
+    assert handler.run_shell(cmd) == ("2", "", 0)
+    time.sleep(0.6)
+    assert handler.run_shell(cmd, cache_ttl=0.5) == ("3", "", 0)
+
+
+def test_failure_and_dry_run_not_cached(tmp_path):
+    count_path = os.path.join(tmp_path, "count")
+    cmd = "echo run >> {}; false".format(count_path)
+    handler = _handler()
+    handler.run_shell(cmd, cache_ttl=10)
+    assert handler.run_shell(cmd, cache_ttl=10)[2] == 1
+    assert _run_count(count_path) == 2
+    assert handler.run_shell("echo x", cache_ttl=10, is_dry_run=True) == (None, None, 0)
+    assert handler.run_shell("echo x", cache_ttl=10) == ("x", "", 0)
+
+
+def test_file_change_misses(tmp_path):
+    data_path = os.path.join(tmp_path, "data")
+    with open(data_path, "w") as out_file:
+        out_file.write("old\n")
+    cmd = "cat {}".format(data_path)
+    handler = _handler()
+    assert handler.run_shell(cmd, cache_ttl=10, cache_file_list=[data_path])[0] == "old"
+    with open(data_path, "w") as out_file:
+        out_file.write("newer\n")
+    assert handler.run_shell(cmd, cache_ttl=10, cache_file_list=[data_path])[0] == "newer"
+    os.unlink(data_path)
+    assert handler.run_shell(cmd, cache_ttl=10, cache_file_list=[data_path])[2] != 0
+
+
+def test_exec_mode_cached(tmp_path):
+    count_path = os.path.join(tmp_path, "count")
+    argv = ["sh", "-c", "echo run >> {}; echo done".format(count_path)]
+    handler = _handler()
+    assert handler.run_exec(argv, cache_ttl=10) == ("done", "", 0)
+    assert handler.run_exec(argv, cache_ttl=10) == ("done", "", 0)
+    assert _run_count(count_path) == 1
+
+
+def test_invalidate(tmp_path):
+    count_path = os.path.join(tmp_path, "count")
+    cmd_a = "echo a >> {}".format(count_path)
+    cmd_b = "echo b >> {}".format(count_path)
+    handler = _handler()
+    for cmd in (cmd_a, cmd_b, cmd_a, cmd_b):
+        handler.run_shell(cmd, cache_ttl=10)
+    assert _run_count(count_path) == 2
+    cmd_handler.invalidate_cmd_cache(cmd_a)
+    handler.run_shell(cmd_a, cache_ttl=10)
+    handler.run_shell(cmd_b, cache_ttl=10)
+    assert _run_count(count_path) == 3
+    cmd_handler.invalidate_cmd_cache()
+    handler.run_shell(cmd_b, cache_ttl=10)
+    assert _run_count(count_path) == 4
+
+
+def test_lru_eviction():
+    cmd_cache = cmd_handler._CmdResultCache(max_entry=2)
+    for cmd in ("a", "b"):
+        cmd_cache.put(cmd_cache.make_key(cmd), (cmd, "", 0), 10)
+    assert cmd_cache.get(cmd_cache.make_key("a")) == ("a", "", 0)
+    cmd_cache.put(cmd_cache.make_key("c"), ("c", "", 0), 10)
+    assert cmd_cache.get(cmd_cache.make_key("b")) is None
+    assert cmd_cache.get(cmd_cache.make_key("a")) is not None
+    assert (cmd_cache.hit_count, cmd_cache.miss_count) == (2, 1)
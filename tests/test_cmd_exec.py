@@ -0,0 +1,78 @@
+import errno
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from my_py import cmd_handler
+from my_py import crypto_tool
+from my_py import os_util
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_exec")
+
+
+def test_run_exec_passes_args_as_is(tmp_path):
+    # no shell: metacharacters are plain text
+    stdout_buf, _, ret_code = _handler().run_exec(["echo", "a; touch {}/x".format(tmp_path), "$HOME"])
+    assert ret_code == 0
+    assert stdout_buf == "a; touch {}/x $HOME".format(tmp_path)
+    assert not os.path.exists(os.path.join(tmp_path, "x"))
+
+
+def test_run_exec_missing_program():
+    assert _handler().run_exec(["no_such_program_xyz"])[2] == errno.ENOENT
+    assert _handler().run_exec([])[2] == errno.EINVAL
+
+
+def test_run_exec_posix_spawn_path():
+    assert _handler().run_exec(["true"], is_close_fds=False)[2] == 0
+    assert _handler().run_exec(["false"], is_close_fds=False)[2] == 1
+
+
+def test_run_argv_expands_only_path_args():
+    stdout_buf, _, ret_code = _handler().run_argv(["echo", "~", "~key"], is_exec_mode=True,
+                                                  path_idx_list=[1])
+    assert ret_code == 0
+    assert stdout_buf == "{} ~key".format(os.path.expanduser("~"))
+
+
+def test_run_argv_shell_mode(tmp_path):
+    stdout_buf, _, ret_code = _handler().run_argv(["echo", "a", "b"])
+    assert (stdout_buf, ret_code) == ("a b", 0)
+    # every argument reaches the program as is, only the paths get "~" expanded
+    stdout_buf, _, ret_code = _handler().run_argv(
+        ["printf", "[%s]", "~", "~key", "a  b", "$HOME", "*", "x; touch {}/pwned".format(tmp_path),
+         "$(id)", "it's"], path_idx_list=[2])
+    assert ret_code == 0
+    assert stdout_buf == "[{}][~key][a  b][$HOME][*][x; touch {}/pwned][$(id)][it's]".format(
+        os.path.expanduser("~"), tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_fs_paths_with_shell_characters(tmp_path, monkeypatch):
+    monkeypatch.setattr(os_util, "_g_is_exec_mode", False)
+    path_list = [os.path.join(tmp_path, name) for name in ("a b", "c;d", "$(e)")]
+    for path in path_list:
+        open(path, "w").close()
+    # a symbolic mode goes through the chmod command
+    assert os_util.FS.chmod_many(path_list, "u+x") == 0
+    assert all(os.stat(path).st_mode & 0o100 for path in path_list)
+    assert sorted(os.listdir(tmp_path)) == ["$(e)", "a b", "c;d"]
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="needs openssl")
+def test_openssl_fallback_keeps_tilde_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(crypto_tool, "_g_has_aes_backend", False)
+    monkeypatch.setattr(crypto_tool, "_g_is_exec_mode", True)
+    plain_path = os.path.join(tmp_path, "plain")
+    enc_path = os.path.join(tmp_path, "enc")
+    with open(plain_path, "wb") as out_file:
+        out_file.write(b"secret data")
+    assert crypto_tool.AESCipher.encrypt_with_key(plain_path, b"~key", enc_path) == 0
+    proc = subprocess.run(["openssl", "enc", "-aes-256-cbc", "-d", "-in", enc_path,
+                           "-k", "~key"], capture_output=True)
+    assert proc.returncode == 0
+    assert proc.stdout == b"secret data"
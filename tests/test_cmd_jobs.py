@@ -0,0 +1,85 @@
+import concurrent.futures
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from my_py import cmd_handler
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_jobs")
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def _wait_job_num(job_num: int):
+    deadline = time.monotonic() + 5
+    while (len(cmd_handler.get_running_jobs()) != job_num and time.monotonic() < deadline):
+        time.sleep(0.02)
+    return cmd_handler.get_running_jobs()
+
+
+@pytest.fixture
+def keyboard_interrupt(monkeypatch):
+    old_handler = signal.getsignal(signal.SIGINT)
+    monkeypatch.setattr(cmd_handler, "_g_terminate_timeout_second", 0.5)
+    cmd_handler.set_keyboard_interrupt()
+    yield
+    cmd_handler.remove_keyboard_interrupt()
+    signal.signal(signal.SIGINT, old_handler)
+
+
+def test_identical_commands_get_own_ids():
+    cmd = "sleep 0.5"
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        future_list = [executor.submit(_handler().run_shell, cmd) for _ in range(2)]
+        job_list = _wait_job_num(2)
+        assert [job["cmd"] for job in job_list] == [cmd, cmd]
+        assert len({job["job_id"] for job in job_list}) == 2
+        assert len({job["pid"] for job in job_list}) == 2
+        assert all(job["elapsed"] >= 0 and job["start_time"] <= time.time()
+                   for job in job_list)
+        assert [future.result()[2] for future in future_list] == [0, 0]
+    assert cmd_handler.get_running_jobs() == []
+
+
+def test_keyboard_interrupt_stops_all_groups(keyboard_interrupt):
+    cmd_list = ["sleep 11; true", "sleep 11; true", "trap '' TERM; sleep 12; true"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        future_list = [executor.submit(_handler().run_shell, cmd) for cmd in cmd_list]
+        assert len(_wait_job_num(3)) == 3
+        time.sleep(0.2)
+        start_time = time.monotonic()
+        os.kill(os.getpid(), signal.SIGINT)
+        ret_list = [future.result(timeout=5)[2] for future in future_list]
+    # TERM for all at once, one shared wait, then KILL for the one left
+    assert time.monotonic() - start_time < 1.5
+    assert ret_list[:2] == [-signal.SIGTERM] * 2
+    assert ret_list[2] == -signal.SIGKILL
+    time.sleep(0.2)
+    assert _count_proc("sleep 11") == _count_proc("sleep 12") == 0
+
+
+@pytest.mark.parametrize("is_pidfd", [True, False])
+def test_wait_jobs(monkeypatch, is_pidfd):
+    if (not is_pidfd):
+        monkeypatch.delattr(os, "pidfd_open", raising=False)
+    process_list = [subprocess.Popen(["sleep", sleep_time]) for sleep_time in ("0.1", "5")]
+    job_list = [cmd_handler._Job(idx, "sleep", process.pid, False)
+                for idx, process in enumerate(process_list)]
+    try:
+        start_time = time.monotonic()
+        assert cmd_handler._wait_jobs(job_list, 0.5) == [job_list[1]]
+        assert 0.5 <= time.monotonic() - start_time < 1.5
+        # not reaped by the wait, the owner still gets the status
+        assert process_list[0].wait() == 0
+    finally:
+        process_list[1].kill()
+        process_list[1].wait()
+    assert not cmd_handler._is_job_alive(job_list[1])
@@ -0,0 +1,87 @@
+import errno
+import time
+
+from my_py import cmd_handler
+
+
+def _pipeline(max_workers=4):
+    handler = cmd_handler.CmdHandler(handler_name="test_pipeline")
+    return cmd_handler.Pipeline(handler=handler, max_workers=max_workers)
+
+
+def test_diamond_runs_branches_in_parallel():
+    pipeline = _pipeline()
+    assert pipeline.add_task("a", cmd="echo a") == 0
+    assert pipeline.add_task("b", cmd="sleep 0.4; echo b", deps=["a"]) == 0
+    assert pipeline.add_task("c", cmd="sleep 0.6; echo c", deps=["a"]) == 0
+    assert pipeline.add_task("d", cmd="echo d", deps=["b", "c"]) == 0
+    start_time = time.monotonic()
+    result_map, report = pipeline.run()
+    assert time.monotonic() - start_time < 0.95
+    assert result_map == {name: (name, "", 0) for name in "abcd"}
+    assert report["critical_path"] == ["a", "c", "d"]
+    assert report["critical_path_time"] >= 0.6
+    assert report["wall_time"] >= report["task_time"]["c"] >= 0.6
+    # the tasks can be run again
+    assert pipeline.run()[0] == result_map
+
+
+def test_failure_cancels_descendants_only():
+    pipeline = _pipeline()
+    pipeline.add_task("fail", cmd="exit 5")
+    pipeline.add_task("child", cmd="echo child", deps=["fail"])
+    pipeline.add_task("grandchild", cmd="echo grandchild", deps=["child", "other"])
+    pipeline.add_task("other", cmd="echo other")
+    result_map, report = pipeline.run()
+    assert result_map["fail"][2] == 5
+    assert result_map["child"] == result_map["grandchild"] == (None, None, errno.ECANCELED)
+    assert result_map["other"] == ("other", "", 0)
+    assert report["task_time"]["child"] == 0.0
+
+
+def test_func_tasks():
+    call_list = []
+
+    def _raise():
+        raise RuntimeError("boom")
+
+    pipeline = _pipeline(max_workers=1)
+    pipeline.add_task("int", func=lambda: call_list.append("int") or 0)
+    pipeline.add_task("none", func=lambda: None, deps=["int"])
+    pipeline.add_task("tuple", func=lambda: ("out", "err", 0), deps=["none"])
+    pipeline.add_task("raise", func=_raise, deps=["tuple"])
+    pipeline.add_task("after", func=lambda: call_list.append("after"), deps=["raise"])
+    result_map, _ = pipeline.run()
+    assert result_map["int"] == result_map["none"] == (None, None, 0)
+    assert result_map["tuple"] == ("out", "err", 0)
+    assert result_map["raise"] == (None, None, errno.EIO)
+    assert result_map["after"] == (None, None, errno.ECANCELED)
+    assert call_list == ["int"]
+
+    # dry run calls nothing
+    assert set(ret_tuple[2] for ret_tuple in pipeline.run(is_dry_run=True)[0].values()) == {0}
+    assert call_list == ["int"]
+
+
+def test_invalid_tasks():
+    pipeline = _pipeline()
+    assert pipeline.add_task("a", cmd="true") == 0
+    assert pipeline.add_task("a", cmd="true") == errno.EEXIST
+    assert pipeline.add_task("b") == errno.EINVAL
+    assert pipeline.add_task("b", cmd="true", func=lambda: 0) == errno.EINVAL
+
+    pipeline.add_task("c", cmd="true", deps=["missing"])
+    assert pipeline.run() == (None, None)
+
+    pipeline = _pipeline()
+    pipeline.add_task("x", cmd="true", deps=["z"])
+    pipeline.add_task("y", cmd="true", deps=["x"])
+    pipeline.add_task("z", cmd="true", deps=["y"])
+    pipeline.add_task("free", cmd="true")
+    assert pipeline.run() == (None, None)
+
+
+def test_empty_pipeline():
+    result_map, report = _pipeline().run()
+    assert result_map == {}
+    assert (report["critical_path"], report["critical_path_time"]) == ([], 0.0)
@@ -0,0 +1,69 @@
+import concurrent.futures
+import errno
+import os
+import threading
+import time
+
+from my_py import cmd_handler
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_reactor")
+
+
+def _reactor_thread_num():
+    return sum(1 for thd in threading.enumerate() if thd.name == "cmd_io_reactor")
+
+
+def test_one_reactor_serves_concurrent_commands():
+    handler = _handler()
+    cmd_list = ["for i in 1 2 3; do echo {0}-$i; echo e{0} >&2; sleep 0.05; done".format(idx)
+                for idx in range(16)]
+    thread_num = threading.active_count()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        ret_list = list(executor.map(handler.run_shell, cmd_list))
+        # no reader thread per command
+        assert threading.active_count() <= thread_num + 16 + 1
+    for idx, (stdout_buf, stderr_buf, ret_code) in enumerate(ret_list):
+        assert stdout_buf.split() == ["{}-{}".format(idx, i) for i in (1, 2, 3)]
+        assert stderr_buf.split() == ["e{}".format(idx)] * 3
+        assert ret_code == 0
+    assert _reactor_thread_num() == 1
+
+
+def test_large_output_on_both_pipes():
+    size = 4 * 1024 * 1024
+    cmd = "head -c {0} /dev/zero | tr '\\0' a & head -c {0} /dev/zero | tr '\\0' b >&2; wait"
+    stdout_buf, stderr_buf, ret_code = _handler().run_shell(cmd.format(size))
+    assert (len(stdout_buf), len(stderr_buf), ret_code) == (size, size, 0)
+    assert set(stdout_buf) == {"a"} and set(stderr_buf) == {"b"}
+
+
+def test_verbose_decodes_split_characters(capsys):
+    # the 3 bytes of one character arrive in separate reads
+    cmd = "printf '\\342'; sleep 0.1; printf '\\202'; sleep 0.1; printf '\\254\\n'"
+    stdout_buf, _, ret_code = _handler().run_shell(cmd, is_verbose=True)
+    assert (stdout_buf, ret_code) == ("€", 0)
+    assert "€" in capsys.readouterr().out
+
+
+def test_timeout_detaches_pipe_held_by_orphan(monkeypatch):
+    monkeypatch.setattr(cmd_handler, "_g_terminate_timeout_second", 0.3)
+    start_time = time.monotonic()
+    # setsid moves the holder of the pipes out of the process group
+    _, _, ret_code = _handler().run_shell("setsid sleep 2 & echo started; sleep 5",
+                                          timeout=0.3)
+    assert ret_code == errno.ETIMEDOUT
+    assert time.monotonic() - start_time < 1.5
+    # the reactor keeps serving other commands
+    assert _handler().run_shell("echo next") == ("next", "", 0)
+
+
+def test_reactor_in_forked_child():
+    assert _handler().run_shell("true")[2] == 0
+    pid = os.fork()
+    if (pid == 0):
+        is_ok = _handler().run_shell("echo child") == ("child", "", 0)
+        os._exit(0 if is_ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
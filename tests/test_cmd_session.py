@@ -0,0 +1,91 @@
+import concurrent.futures
+import errno
+import subprocess
+import time
+
+import pytest
+
+from my_py import cmd_handler
+
+
+@pytest.fixture
+def session():
+    session = cmd_handler.ShellSession(handler_name="test_session")
+    yield session
+    session.close()
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def test_state_kept_across_commands(session, tmp_path):
+    shell_pid = session.run_shell("echo $$")[0]
+    assert session.run_shell("cd {} && export MY_PY_VAR=kept".format(tmp_path))[2] == 0
+    assert session.run_shell("pwd; echo $MY_PY_VAR") == ("{}\nkept".format(tmp_path), "", 0)
+    assert session.run_shell("echo $$")[0] == shell_pid
+
+
+def test_output_and_errors(session):
+    assert session.run_shell("echo out; echo err >&2; false") == ("out", "err", 1)
+    assert session.run_shell("printf 'no newline'")[0] == "no newline"
+    # a syntax error stays inside eval, the shell survives
+    shell_pid = session.run_shell("echo $$")[0]
+    _, stderr_buf, ret_code = session.run_shell("if then")
+    assert ret_code == 2 and "syntax error" in stderr_buf
+    assert session.run_shell("echo $$")[0] == shell_pid
+    # stdin of a command is /dev/null, not the session script
+    assert session.run_shell("cat", timeout=2) == ("", "", 0)
+
+
+def test_exit_restarts_the_session(session):
+    shell_pid = session.run_shell("echo $$")[0]
+    assert session.run_shell("echo bye; exit 3") == ("bye", "", 3)
+    new_shell_pid = session.run_shell("echo $$")[0]
+    assert new_shell_pid != shell_pid
+    session.close()
+    assert session.run_shell("echo $$")[0] not in (shell_pid, new_shell_pid)
+
+
+def test_timeout_restarts_the_session(session):
+    session.run_shell("export MY_PY_VAR=lost")
+    start_time = time.monotonic()
+    stdout_buf, _, ret_code = session.run_shell("echo partial; sleep 8", timeout=0.3)
+    assert (stdout_buf, ret_code) == ("partial", errno.ETIMEDOUT)
+    assert time.monotonic() - start_time < 2
+    time.sleep(0.2)
+    assert _count_proc("sleep 8") == 0
+    assert session.run_shell("echo ${MY_PY_VAR:-fresh}") == ("fresh", "", 0)
+
+
+def test_timeout_with_endless_output(session):
+    start_time = time.monotonic()
+    stdout_buf, _, ret_code = session.run_shell("yes | head -c 200000000", timeout=0.5)
+    assert ret_code == errno.ETIMEDOUT
+    assert stdout_buf.startswith("y\ny\n")
+    assert time.monotonic() - start_time < 3
+    assert session.run_shell("echo alive") == ("alive", "", 0)
+
+
+def test_verbose_hides_the_sentinel(session, capsys):
+    assert session.run_shell("echo shown; echo shown-err >&2", is_verbose=True)[2] == 0
+    printed = capsys.readouterr().out
+    assert "shown" in printed and "shown-err" in printed
+    assert "__my_py_session_" not in printed
+
+
+def test_no_run(session):
+    assert session.run_shell("echo x", is_dry_run=True) == (None, None, 0)
+    assert session.run_shell("echo x", timeout=-1) == (None, None, -1)
+
+
+def test_pool_runs_in_parallel():
+    with cmd_handler.ShellSessionPool(pool_size=4, handler_name="test_session_pool") as pool:
+        start_time = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            ret_list = list(executor.map(pool.run_shell, ["sleep 0.5; echo $$"] * 4))
+        assert time.monotonic() - start_time < 1.5
+        assert all(ret_code == 0 for _, _, ret_code in ret_list)
+        assert len({stdout_buf for stdout_buf, _, _ in ret_list}) == 4
+    assert all(session._process is None for session in pool._session_list)
@@ -0,0 +1,125 @@
+import errno
+import subprocess
+import time
+
+from my_py import cmd_handler
+
+CapturedOutput = cmd_handler.CapturedOutput
+STDOUT = cmd_handler.CmdOutputStream.STDOUT
+STDERR = cmd_handler.CmdOutputStream.STDERR
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_stream")
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def test_captured_output_in_memory():
+    with CapturedOutput(max_mem_size=64, preview_size=4) as captured:
+        captured.extend(b"ab\ncd\n")
+        captured.extend(b"ef")
+        assert not captured.is_spilled
+        assert len(captured) == 8
+        assert (captured.head, captured.tail) == (b"ab\nc", b"d\nef")
+        assert bytes(captured.view()) == b"ab\ncd\nef"
+        assert list(captured.iter_lines()) == ["ab", "cd", "ef"]
+        assert captured.text == captured.preview() == "ab\ncd\nef"
+
+
+def test_captured_output_spilled(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmd_handler, "_g_spill_dir", str(tmp_path))
+    captured = CapturedOutput(max_mem_size=16, preview_size=4)
+    line_list = ["line{:03d}".format(idx) for idx in range(100)]
+    for line in line_list:
+        captured.extend((line + "\n").encode())
+    assert captured.is_spilled
+    assert len(captured) == 800
+    assert (captured.head, captured.tail) == (b"line", b"099\n")
+    assert list(captured.iter_lines()) == line_list
+    assert captured.text == "\n".join(line_list)
+    assert captured.preview() == "line\n... (792 bytes omitted) ...\n099\n"
+    captured.close()
+    captured.close()
+
+
+def test_run_shell_capture_spills_huge_output():
+    size = 3 * 1024 * 1024
+    stdout_buf, stderr_buf, ret_code = _handler().run_shell_capture(
+        "seq 1 400000; head -c {} /dev/zero >&2".format(size), max_mem_size=64 * 1024)
+    with stdout_buf, stderr_buf:
+        assert ret_code == 0
+        assert stdout_buf.is_spilled and stderr_buf.is_spilled
+        assert len(stderr_buf) == size
+        line_num = 0
+        for line_num, line in enumerate(stdout_buf.iter_lines(), 1):
+            assert int(line) == line_num
+        assert line_num == 400000
+    assert _handler().run_shell_capture("echo x", is_dry_run=True) == (None, None, 0)
+
+
+def test_run_shell_iter():
+    output_stream = _handler().run_shell_iter(
+        "echo a; echo b >&2; printf 'c\\nno-newline'; exit 4")
+    assert output_stream.ret_code is None
+    line_list = list(output_stream)
+    assert [line for name, line in line_list if name == STDOUT] == ["a", "c", "no-newline"]
+    assert [line for name, line in line_list if name == STDERR] == ["b"]
+    assert output_stream.ret_code == 4
+
+
+def test_run_shell_iter_yields_before_exit():
+    output_stream = _handler().run_shell_iter("echo first; sleep 1; echo second")
+    start_time = time.monotonic()
+    line_iter = iter(output_stream)
+    assert next(line_iter) == (STDOUT, "first")
+    assert time.monotonic() - start_time < 0.8
+    assert list(line_iter) == [(STDOUT, "second")]
+
+
+def test_run_shell_iter_timeout():
+    start_time = time.monotonic()
+    output_stream = _handler().run_shell_iter("echo a; sleep 6; true", timeout=0.3)
+    assert list(output_stream) == [(STDOUT, "a")]
+    assert output_stream.ret_code == errno.ETIMEDOUT
+    assert time.monotonic() - start_time < 2
+    time.sleep(0.2)
+    assert _count_proc("sleep 6") == 0
+
+
+def test_run_shell_iter_timeout_with_endless_output():
+    start_time = time.monotonic()
+    output_stream = _handler().run_shell_iter("yes | head -c 400000000", timeout=0.5)
+    assert sum(1 for _ in output_stream) > 0
+    assert output_stream.ret_code == errno.ETIMEDOUT
+    assert time.monotonic() - start_time < 3
+    assert cmd_handler.get_running_jobs() == []
+
+
+def test_run_shell_iter_timeout_stops_the_group():
+    # the shell exits at once, its child holds the pipes open
+    output_stream = _handler().run_shell_iter("sleep 7.5 & echo started", timeout=0.3)
+    assert list(output_stream) == [(STDOUT, "started")]
+    assert output_stream.ret_code == errno.ETIMEDOUT
+    time.sleep(0.2)
+    assert _count_proc("sleep 7.5") == 0
+
+
+def test_run_shell_iter_early_stop():
+    output_stream = _handler().run_shell_iter("yes")
+    line_iter = iter(output_stream)
+    assert next(line_iter) == (STDOUT, "y")
+    # the consumer stops early, the command is stopped
+    line_iter.close()
+    assert output_stream.ret_code is not None and output_stream.ret_code != 0
+    assert cmd_handler.get_running_jobs() == []
+
+
+def test_run_shell_iter_no_run():
+    output_stream = _handler().run_shell_iter("echo x", is_dry_run=True)
+    assert (list(output_stream), output_stream.ret_code) == ([], 0)
+    output_stream = _handler().run_shell_iter("echo x", timeout=-1)
+    assert (list(output_stream), output_stream.ret_code) == ([], -1)
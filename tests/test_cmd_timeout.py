@@ -0,0 +1,61 @@
+import errno
+import os
+import subprocess
+import time
+
+import pytest
+
+from my_py import cmd_handler
+
+
+def _handler():
+    return cmd_handler.CmdHandler(handler_name="test_timeout")
+
+
+def _count_proc(args: str):
+    ps_out = subprocess.run(["ps", "-eo", "args"], capture_output=True, text=True).stdout
+    return sum(1 for line in ps_out.splitlines() if line.strip() == args)
+
+
+def test_no_polling_delay():
+    handler = _handler()
+    handler.run_shell("true", timeout=5)
+    start_time = time.monotonic()
+    for _ in range(10):
+        assert handler.run_shell("true", timeout=5)[2] == 0
+    # a 100ms sleep-poll loop would take >= 1s
+    assert time.monotonic() - start_time < 0.8
+
+
+def test_timeout_keeps_partial_output():
+    start_time = time.monotonic()
+    stdout_buf, _, ret_code = _handler().run_shell("echo partial; sleep 9; true", timeout=0.3)
+    assert (stdout_buf, ret_code) == ("partial", errno.ETIMEDOUT)
+    assert time.monotonic() - start_time < 1.5
+    time.sleep(0.2)
+    assert _count_proc("sleep 9") == 0
+
+
+def test_timeout_kills_term_ignoring_command(monkeypatch):
+    monkeypatch.setattr(cmd_handler, "_g_terminate_timeout_second", 0.3)
+    start_time = time.monotonic()
+    _, _, ret_code = _handler().run_shell("trap '' TERM; sleep 9; true", timeout=0.3)
+    assert ret_code == errno.ETIMEDOUT
+    assert time.monotonic() - start_time < 1.5
+
+
+def test_invalid_timeout():
+    assert _handler().run_shell("true", timeout=-1) == (None, None, -1)
+
+
+@pytest.mark.parametrize("is_pidfd", [True, False])
+def test_wait_process(monkeypatch, is_pidfd):
+    if (not is_pidfd):
+        monkeypatch.delattr(os, "pidfd_open", raising=False)
+    elif (not hasattr(os, "pidfd_open")):
+        pytest.skip("no pidfd_open")
+    process = subprocess.Popen(["sleep", "0.3"])
+    assert not cmd_handler._wait_process(process, 0.05)
+    assert cmd_handler._wait_process(process, 5)
+    assert process.wait() == 0
+    assert cmd_handler._wait_process(process, 0)
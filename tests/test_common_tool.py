@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from my_py import common_tool
+
+
+def test_is_module_exist():
+    assert common_tool.is_module_exist("json")
+    assert common_tool.is_module_exist("os.path")
+    assert not common_tool.is_module_exist("no_such_module_xyz")
+    assert not common_tool.is_module_exist("no_such_pkg_xyz.sub")
+
+
+def test_is_module_exist_does_not_import():
+    sys.modules.pop("this", None)
+    assert common_tool.is_module_exist("this")
+    assert "this" not in sys.modules
+
+
+def test_modules_import_without_find_loader():
+    # importlib.find_loader was removed in python 3.12
+    import_code = ("import importlib\n"
+                   "if hasattr(importlib, 'find_loader'):\n"
+                   "    del importlib.find_loader\n"
+                   "from my_py import crypto_tool, chunk_tool, os_util, third_lib\n")
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, "-c", import_code], cwd=repo_dir,
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,127 @@
+import errno
+import hashlib
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from my_py import crypto_tool
+
+AESCipher = crypto_tool.AESCipher
+_KEY = b"test-key"
+
+
+@pytest.fixture
+def plain_file(tmp_path):
+    file_path = os.path.join(tmp_path, "plain")
+    with open(file_path, "wb") as out_file:
+        out_file.write(os.urandom(200003))
+    return file_path
+
+
+def _read(file_path):
+    with open(file_path, "rb") as in_file:
+        return in_file.read()
+
+
+def _tmp_leftovers(dir_path):
+    return [name for name in os.listdir(dir_path) if ".tmp-" in name]
+
+
+def test_round_trip_and_plain_digest(plain_file, tmp_path):
+    enc_path = os.path.join(tmp_path, "enc")
+    dec_path = os.path.join(tmp_path, "dec")
+    plain_digest = hashlib.sha256(_read(plain_file)).hexdigest()
+    assert AESCipher.crypt_file(plain_file, _KEY, enc_path, True, True) == (0, plain_digest)
+    assert _read(enc_path).startswith(b"Salted__")
+    assert AESCipher.crypt_file(enc_path, _KEY, dec_path, False, True) == (0, plain_digest)
+    assert _read(dec_path) == _read(plain_file)
+    assert _tmp_leftovers(tmp_path) == []
+
+
+def test_new_output_mode_follows_umask(plain_file, tmp_path):
+    enc_path = os.path.join(tmp_path, "enc")
+    old_umask = os.umask(0o027)
+    try:
+        assert AESCipher.encrypt_with_key(plain_file, _KEY, enc_path) == 0
+    finally:
+        os.umask(old_umask)
+    assert os.stat(enc_path).st_mode & 0o777 == 0o640
+
+
+def test_existing_output_keeps_mode(plain_file, tmp_path):
+    enc_path = os.path.join(tmp_path, "enc")
+    with open(enc_path, "wb") as out_file:
+        out_file.write(b"old")
+    os.chmod(enc_path, 0o600)
+    assert AESCipher.encrypt_with_key(plain_file, _KEY, enc_path) == 0
+    assert os.stat(enc_path).st_mode & 0o777 == 0o600
+    assert _read(enc_path) != b"old"
+
+
+@pytest.mark.skipif(not crypto_tool._g_has_aes_backend, reason="cryptography not installed")
+def test_failed_crypt_keeps_existing_output(plain_file, tmp_path):
+    enc_path = os.path.join(tmp_path, "enc")
+    out_path = os.path.join(tmp_path, "out")
+    assert AESCipher.encrypt_with_key(plain_file, _KEY, enc_path) == 0
+    with open(out_path, "wb") as out_file:
+        out_file.write(b"keep me")
+
+    # wrong key: "bad decrypt"
+    assert AESCipher.crypt_file(enc_path, b"wrong", out_path, False) == (errno.EBADMSG, None)
+    assert _read(out_path) == b"keep me"
+    # not an encrypted file
+    assert AESCipher.crypt_file(plain_file, _KEY, out_path, False) == (errno.EBADMSG, None)
+    assert _read(out_path) == b"keep me"
+    # missing input, the output is never opened
+    ret, _ = AESCipher.crypt_file(os.path.join(tmp_path, "missing"), _KEY, out_path, False)
+    assert ret == errno.ENOENT
+    assert _read(out_path) == b"keep me"
+    assert _tmp_leftovers(tmp_path) == []
+
+
+def test_missing_input(tmp_path):
+    out_path = os.path.join(tmp_path, "out")
+    assert AESCipher.encrypt_with_key(os.path.join(tmp_path, "missing"), _KEY, out_path) != 0
+    assert not os.path.exists(out_path)
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl not installed")
+def test_openssl_interop(plain_file, tmp_path):
+    enc_path = os.path.join(tmp_path, "enc")
+    dec_path = os.path.join(tmp_path, "dec")
+    assert AESCipher.encrypt_with_key(plain_file, _KEY, enc_path) == 0
+    subprocess.run(["openssl", "enc", "-aes-256-cbc", "-d", "-in", enc_path,
+                    "-out", dec_path, "-k", _KEY.decode()], check=True)
+    assert _read(dec_path) == _read(plain_file)
+
+    subprocess.run(["openssl", "enc", "-aes-256-cbc", "-salt", "-in", plain_file,
+                    "-out", enc_path, "-k", _KEY.decode()], check=True)
+    os.unlink(dec_path)
+    assert AESCipher.decrypt_with_key(enc_path, _KEY, dec_path) == 0
+    assert _read(dec_path) == _read(plain_file)
+
+
+def test_crypt_tree(tmp_path):
+    src_dir = os.path.join(tmp_path, "src")
+    os.makedirs(os.path.join(src_dir, "sub"))
+    data_map = {"a": os.urandom(1000), os.path.join("sub", "b"): b"", "c": os.urandom(70000)}
+    for rel_path, data in data_map.items():
+        with open(os.path.join(src_dir, rel_path), "wb") as out_file:
+            out_file.write(data)
+
+    enc_dir = os.path.join(tmp_path, "enc")
+    dec_dir = os.path.join(tmp_path, "dec")
+    ret, digest_map = AESCipher.encrypt_tree(src_dir, _KEY, enc_dir, max_workers=2,
+                                             is_hash_plain=True)
+    assert ret == 0
+    assert digest_map == {rel_path: hashlib.sha256(data).hexdigest()
+                          for rel_path, data in data_map.items()}
+    ret, _ = AESCipher.decrypt_tree(enc_dir, _KEY, dec_dir, max_workers=2)
+    assert ret == 0
+    for rel_path, data in data_map.items():
+        assert _read(os.path.join(dec_dir, rel_path)) == data
+
+    ret, _ = AESCipher.decrypt_tree(os.path.join(tmp_path, "missing"), _KEY, dec_dir)
+    assert ret == errno.ENOENT
@@ -0,0 +1,53 @@
+import hashlib
+import os
+
+import pytest
+
+from my_py import crypto_tool
+
+Hasher = crypto_tool.Hasher
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    file_path = os.path.join(tmp_path, "data")
+    with open(file_path, "wb") as out_file:
+        out_file.write(os.urandom(300000))
+    # out of the racy window, so the digest may be cached
+    os.utime(file_path, (1000000000, 1000000000))
+    with open(file_path, "rb") as in_file:
+        return file_path, in_file.read()
+
+
+@pytest.mark.parametrize("algo", ["sha256", "blake2b", "sha1"])
+def test_hash_file_modes(data_file, algo):
+    file_path, data = data_file
+    expect_digest = hashlib.new(algo, data).hexdigest()
+    assert Hasher.hash_file(file_path, algo=algo) == expect_digest
+    assert Hasher.hash_file(file_path, algo=algo, is_mmap=True) == expect_digest
+    assert Hasher.hash_file(file_path, algo=algo, chunk_size=4096) == expect_digest
+    assert Hasher.hash_file(file_path, algo=algo, is_hex=False) == bytes.fromhex(expect_digest)
+
+
+def test_hash_file_errors(tmp_path):
+    assert Hasher.hash_file(os.path.join(tmp_path, "missing")) is None
+    assert Hasher.hash_file(os.path.join(tmp_path, "missing"), algo="md4") is None
+    empty_path = os.path.join(tmp_path, "empty")
+    open(empty_path, "w").close()
+    assert Hasher.hash_file(empty_path, is_mmap=True) == hashlib.sha256(b"").hexdigest()
+
+
+def test_hash_data_and_files(data_file, tmp_path):
+    file_path, data = data_file
+    assert Hasher.hash_data(memoryview(data)) == hashlib.sha256(data).hexdigest()
+    digest_map = Hasher.hash_files([file_path, os.path.join(tmp_path, "missing")])
+    assert digest_map == {file_path: hashlib.sha256(data).hexdigest(),
+                          os.path.join(tmp_path, "missing"): None}
+
+
+def test_hash_file_blocks(data_file):
+    file_path, data = data_file
+    digest_list = Hasher.hash_file_blocks(file_path, block_size=65536)
+    assert digest_list == [hashlib.sha256(data[offset:offset + 65536]).hexdigest()
+                           for offset in range(0, len(data), 65536)]
+    assert Hasher.hash_file_blocks(file_path, block_size=0) is None
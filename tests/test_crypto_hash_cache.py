@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from my_py import crypto_tool
+
+Hasher = crypto_tool.Hasher
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    file_path = os.path.join(tmp_path, "data")
+    with open(file_path, "wb") as out_file:
+        out_file.write(os.urandom(300000))
+    # out of the racy window, so the digest may be cached
+    os.utime(file_path, (1000000000, 1000000000))
+    with open(file_path, "rb") as in_file:
+        return file_path, in_file.read()
+
+
+@pytest.fixture
+def hash_cache(tmp_path):
+    hash_cache = crypto_tool.HashCache(os.path.join(tmp_path, "cache.db"))
+    Hasher.set_hash_cache(hash_cache)
+    yield hash_cache
+    Hasher.set_hash_cache(None)
+    hash_cache.close()
+
+
+def test_cache_hit_and_stat_change(data_file, hash_cache):
+    file_path, data = data_file
+    digest = Hasher.hash_file(file_path)
+    assert Hasher.hash_file(file_path) == digest
+    assert hash_cache.get_stats()["hit"] == 1
+    assert hash_cache.get_stats()["entry_num"] == 1
+    with open(file_path, "r+b") as out_file:
+        out_file.write(b"x")
+    os.utime(file_path, (1000000001, 1000000001))
+    assert Hasher.hash_file(file_path) == hashlib.sha256(b"x" + data[1:]).hexdigest()
+    assert Hasher.hash_file(file_path, is_use_cache=False) == hashlib.sha256(b"x" + data[1:]).hexdigest()
+
+
+def test_cache_skips_racy_file(tmp_path, hash_cache):
+    file_path = os.path.join(tmp_path, "new")
+    with open(file_path, "wb") as out_file:
+        out_file.write(b"fresh")
+    Hasher.hash_file(file_path)
+    assert hash_cache.get_stats()["entry_num"] == 0
+
+
+def test_cache_error_is_a_miss(data_file, hash_cache, monkeypatch):
+    file_path, data = data_file
+
+    def _raise(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(hash_cache, "get", _raise)
+    monkeypatch.setattr(hash_cache, "put", _raise)
+    assert Hasher.hash_file(file_path) == hashlib.sha256(data).hexdigest()
+
+
+def test_cache_hit_does_not_write(data_file, hash_cache, monkeypatch):
+    file_path, _ = data_file
+    Hasher.hash_file(file_path)
+    monkeypatch.setattr(crypto_tool, "_g_hash_cache_touch_batch_size", 3)
+    commit_list = []
+    db_conn = hash_cache._get_conn()
+    hash_cache._local.db_conn = _CountingConn(db_conn, commit_list)
+    Hasher.hash_file(file_path)
+    Hasher.hash_file(file_path)
+    assert commit_list == []
+    hash_cache.flush_access_time()
+    assert len(commit_list) == 1
+    hash_cache._local.db_conn = db_conn
+
+
+def test_cache_evict_lru(tmp_path):
+    hash_cache = crypto_tool.HashCache(os.path.join(tmp_path, "cache.db"), max_entry=2)
+    stat_list = []
+    for idx in range(3):
+        file_path = os.path.join(tmp_path, "f{}".format(idx))
+        open(file_path, "w").close()
+        os.utime(file_path, (1000000000 + idx, 1000000000 + idx))
+        stat_list.append(os.stat(file_path))
+        hash_cache.put(stat_list[-1], "sha256", b"d")
+    assert hash_cache.get(stat_list[0], "sha256") == b"d"
+    hash_cache.evict()
+    assert hash_cache.get_stats()["entry_num"] == 2
+    assert hash_cache.get(stat_list[0], "sha256") == b"d"
+    hash_cache.close()
+
+
+class _CountingConn:
+    def __init__(self, db_conn, commit_list):
+        self._db_conn = db_conn
+        self._commit_list = commit_list
+
+    def commit(self):
+        self._commit_list.append(True)
+        return self._db_conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._db_conn, name)
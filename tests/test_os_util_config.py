@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import types
+
+import pytest
+
+from my_py import os_util
+
+Config = os_util.Config
+
+
+@pytest.fixture(autouse=True)
+def config_state(monkeypatch):
+    monkeypatch.setattr(os_util, "_g_config_cache", {})
+    monkeypatch.setattr(os_util, "_g_config_watcher", None)
+    monkeypatch.setattr(os_util, "_g_config_poll_second", 0.05)
+    yield
+    if (os_util._g_config_watcher is not None):
+        os_util._g_config_watcher.stop()
+        os_util._g_config_watcher.join()
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    config_path = os.path.join(tmp_path, "config.json")
+    _write(config_path, {"name": "a", "list": [1, {"deep": True}], "map": {"x": 1}})
+    return config_path
+
+
+_g_mtime_ns = 10 ** 18
+
+
+def _write(config_path, json_data, is_replace=False):
+    # a distinct mtime each time, the file system clock may be coarse
+    global _g_mtime_ns
+    _g_mtime_ns += 10 ** 9
+    write_path = config_path + ".new" if is_replace else config_path
+    with open(write_path, "w") as out_file:
+        json.dump(json_data, out_file)
+    os.utime(write_path, ns=(_g_mtime_ns, _g_mtime_ns))
+    if (is_replace):
+        os.replace(write_path, config_path)
+
+
+def _wait(event_func, timeout=3.0):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.02)):
+        if (event_func()):
+            return True
+        event.wait(0.02)
+    return False
+
+
+def test_default_is_a_private_copy(config_path):
+    json_data = Config.load_json_config(config_path)
+    assert type(json_data) is dict and type(json_data["list"]) is list
+    # callers may modify and serialize it, the cache is not affected
+    json_data["name"] = "b"
+    json_data["list"][1]["deep"] = False
+    assert json.loads(json.dumps(json_data))["name"] == "b"
+    assert Config.load_json_config(config_path) == {
+        "name": "a", "list": [1, {"deep": True}], "map": {"x": 1}}
+    assert Config.load_json_config(config_path) is not Config.load_json_config(config_path)
+
+    json_data = Config.load_json_config(config_path, is_use_cache=False)
+    assert type(json_data) is dict and type(json_data["list"]) is list
+
+
+def test_frozen_shared_view(config_path):
+    json_view = Config.load_json_config(config_path, is_frozen=True)
+    assert isinstance(json_view, types.MappingProxyType)
+    assert json_view["list"] == (1, {"deep": True})
+    assert isinstance(json_view["list"][1], types.MappingProxyType)
+    with pytest.raises(TypeError):
+        json_view["name"] = "b"
+    with pytest.raises(TypeError):
+        json_view["map"]["x"] = 2
+    # one parse, the same object for each caller
+    assert Config.load_json_config(config_path, is_frozen=True) is json_view
+    assert Config.load_json_config(os.path.join(os.path.dirname(config_path), ".",
+                                                "config.json"), is_frozen=True) is json_view
+    assert Config.load_json_config(config_path)["name"] == "a"
+    _write(config_path, {"name": "b"})
+    assert Config.load_json_config(config_path, is_frozen=True)["name"] == "b"
+
+
+@pytest.mark.parametrize("is_replace", [False, True])
+def test_reload_on_change(config_path, is_replace):
+    call_list = []
+    Config.add_config_callback(config_path, lambda path, data: call_list.append(
+        (path, type(data), data["name"])))
+    Config.add_config_callback(config_path, lambda path, view: call_list.append(
+        (path, type(view), view["name"])), is_frozen=True)
+    json_view = Config.load_json_config(config_path, is_frozen=True)
+    _write(config_path, {"name": "b"}, is_replace=is_replace)
+    assert Config.load_json_config(config_path)["name"] == "b"
+    assert call_list == [(config_path, dict, "b"), (config_path, types.MappingProxyType, "b")]
+    assert json_view["name"] == "a"
+
+    # a new mtime with the same content keeps the view and skips the callbacks
+    new_view = Config.load_json_config(config_path, is_frozen=True)
+    _write(config_path, {"name": "b"}, is_replace=is_replace)
+    assert Config.load_json_config(config_path, is_frozen=True) is new_view
+    assert len(call_list) == 2
+
+
+def test_callback_errors_and_removal(config_path):
+    call_list = []
+
+    def _raise(path, view):
+        raise RuntimeError("boom")
+
+    def _record(path, view):
+        call_list.append(view["name"])
+    Config.add_config_callback(config_path, _raise)
+    Config.add_config_callback(config_path, _record)
+    _write(config_path, {"name": "b"})
+    assert Config.load_json_config(config_path)["name"] == "b"
+    assert call_list == ["b"]
+
+    Config.remove_config_callback(config_path, _record)
+    Config.remove_config_callback(config_path, _record)
+    Config.remove_config_callback(config_path + ".unknown", _record)
+    _write(config_path, {"name": "c"})
+    assert Config.load_json_config(config_path)["name"] == "c"
+    assert call_list == ["b"]
+
+
+def test_bad_reload_keeps_last_view(config_path):
+    json_view = Config.load_json_config(config_path, is_frozen=True)
+    with open(config_path, "w") as out_file:
+        out_file.write("{broken")
+    assert Config.load_json_config(config_path, is_frozen=True) is json_view
+    os.unlink(config_path)
+    assert Config.load_json_config(config_path, is_frozen=True) is json_view
+    assert Config.load_json_config(config_path)["name"] == "a"
+    _write(config_path, {"name": "fixed"})
+    assert Config.load_json_config(config_path)["name"] == "fixed"
+
+
+def test_first_load_errors(tmp_path):
+    with pytest.raises(SystemExit):
+        Config.load_json_config(os.path.join(tmp_path, "missing.json"))
+    broken_path = os.path.join(tmp_path, "broken.json")
+    with open(broken_path, "w") as out_file:
+        out_file.write("{broken")
+    with pytest.raises(SystemExit):
+        Config.load_json_config(broken_path)
+    assert os_util._g_config_cache == {}
+
+
+@pytest.mark.parametrize("has_orjson", sorted({False, os_util._g_has_orjson}))
+def test_parsers_agree(config_path, monkeypatch, has_orjson):
+    monkeypatch.setattr(os_util, "_g_has_orjson", has_orjson)
+    _write(config_path, {"text": "café ☃", "num": [1.5, -2, 10 ** 12],
+                         "null": None, "bool": False})
+    json_view = Config.load_json_config(config_path, is_frozen=True)
+    assert json_view["text"] == "café ☃"
+    assert json_view["num"] == (1.5, -2, 10 ** 12)
+    assert (json_view["null"], json_view["bool"]) == (None, False)
+
+
+@pytest.mark.parametrize("has_inotify", sorted({False, os_util._g_has_inotify}))
+def test_watch_config(config_path, monkeypatch, has_inotify):
+    monkeypatch.setattr(os_util, "_g_has_inotify", has_inotify)
+    call_list = []
+    Config.add_config_callback(config_path, lambda path, view: call_list.append(view["name"]))
+    Config.watch_config(config_path)
+    # the callback runs without a load call
+    _write(config_path, {"name": "b"}, is_replace=True)
+    assert _wait(lambda: call_list == ["b"])
+    _write(config_path, {"name": "c"})
+    assert _wait(lambda: call_list == ["b", "c"])
+
+    Config.unwatch_config(config_path)
+    assert os_util._g_config_watcher.path_set == set()
+    _write(config_path, {"name": "d"})
+    assert not _wait(lambda: len(call_list) == 3, timeout=0.3)
@@ -0,0 +1,125 @@
+import os
+import stat
+import threading
+
+import pytest
+
+from my_py import os_util
+
+FS = os_util.FS
+
+
+def _read(path):
+    with open(path, "rb") as in_file:
+        return in_file.read()
+
+
+def test_mkdir_chmod_rm_many(tmp_path):
+    path_list = [os.path.join(tmp_path, "a", "b"), os.path.join(tmp_path, "c")]
+    assert FS.mkdir_many(path_list) == 0
+    assert all(os.path.isdir(path) for path in path_list)
+    assert FS.chmod_many(path_list, "700") == 0
+    assert stat.S_IMODE(os.stat(path_list[1]).st_mode) == 0o700
+    assert FS.chmod_many(path_list, "u+x,g+r") == 0
+    assert stat.S_IMODE(os.stat(path_list[1]).st_mode) == 0o740
+    assert FS.rm_many(path_list + [os.path.join(tmp_path, "missing")]) == 0
+    assert not os.path.exists(path_list[0])
+
+
+def test_error_code_of_failed_path(tmp_path):
+    file_path = os.path.join(tmp_path, "file")
+    open(file_path, "w").close()
+    assert FS.mkdir_p(os.path.join(file_path, "sub")) != 0
+    assert FS.change_file_mode(os.path.join(tmp_path, "missing"), "600") != 0
+
+
+def test_glob_expanded_by_all(tmp_path):
+    for name in ["x1", "x2"]:
+        open(os.path.join(tmp_path, name), "w").close()
+    assert FS.chmod_many([os.path.join(tmp_path, "x*")], "600") == 0
+    for name in ["x1", "x2"]:
+        assert stat.S_IMODE(os.stat(os.path.join(tmp_path, name)).st_mode) == 0o600
+    os.mkdir(os.path.join(tmp_path, "d1"))
+    # a pattern matching dirs creates nothing new, one without matches is literal
+    assert FS.mkdir_many([os.path.join(tmp_path, "d*"), os.path.join(tmp_path, "n*")]) == 0
+    assert os.path.isdir(os.path.join(tmp_path, "n*"))
+    assert FS.rm_many([os.path.join(tmp_path, "x*")]) == 0
+    assert not os.path.exists(os.path.join(tmp_path, "x1"))
+    assert os.path.isdir(os.path.join(tmp_path, "d1"))
+
+
+def test_dry_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(os_util, "_g_is_dry_run", True)
+    assert FS.mkdir_p(os.path.join(tmp_path, "d")) == 0
+    assert not os.path.exists(os.path.join(tmp_path, "d"))
+
+
+def test_write_new_append_and_keep_mode(tmp_path):
+    file_path = os.path.join(tmp_path, "f")
+    assert FS.write_str_to_file("a b", file_path, False) == 0
+    assert FS.write_str_to_file("c", file_path, True) == 0
+    assert _read(file_path) == b"a b\nc\n"
+    os.chmod(file_path, 0o640)
+    old_ino = os.stat(file_path).st_ino
+    assert FS.write_str_to_file("d", file_path, False) == 0
+    assert _read(file_path) == b"d\n"
+    # replaced by a rename, mode kept
+    assert os.stat(file_path).st_ino != old_ino
+    assert stat.S_IMODE(os.stat(file_path).st_mode) == 0o640
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".tmp_")] == []
+
+
+def test_write_through_symlink_and_hardlink(tmp_path):
+    target_path = os.path.join(tmp_path, "target")
+    link_path = os.path.join(tmp_path, "link")
+    hard_path = os.path.join(tmp_path, "hard")
+    with open(target_path, "w") as out_file:
+        out_file.write("old\n")
+    os.symlink(target_path, link_path)
+    os.link(target_path, hard_path)
+    assert FS.write_str_to_file("new", link_path, False) == 0
+    assert os.path.islink(link_path)
+    assert _read(target_path) == b"new\n"
+    assert FS.write_str_to_file("new2", hard_path, False) == 0
+    assert _read(target_path) == b"new2\n"
+    assert os.stat(target_path).st_nlink == 2
+
+
+def test_write_to_fifo(tmp_path):
+    fifo_path = os.path.join(tmp_path, "fifo")
+    os.mkfifo(fifo_path)
+    read_list = []
+    reader = threading.Thread(target=lambda: read_list.append(_read(fifo_path)))
+    reader.start()
+    assert FS.write_str_to_file("through", fifo_path, False) == 0
+    reader.join(timeout=5)
+    assert read_list == [b"through\n"]
+    assert stat.S_ISFIFO(os.stat(fifo_path).st_mode)
+
+
+@pytest.mark.skipif(os.geteuid() == 0, reason="root can write any dir")
+def test_write_in_read_only_dir(tmp_path):
+    dir_path = os.path.join(tmp_path, "ro")
+    os.mkdir(dir_path)
+    file_path = os.path.join(dir_path, "f")
+    open(file_path, "w").close()
+    os.chmod(dir_path, 0o500)
+    try:
+        assert FS.write_str_to_file("x", file_path, False) == 0
+        assert _read(file_path) == b"x\n"
+    finally:
+        os.chmod(dir_path, 0o700)
+
+
+def test_write_missing_dir(tmp_path):
+    assert FS.write_str_to_file("x", os.path.join(tmp_path, "no", "f"), False) != 0
+
+
+def test_write_in_place_without_dir_access(tmp_path, monkeypatch):
+    file_path = os.path.join(tmp_path, "f")
+    open(file_path, "w").close()
+    old_ino = os.stat(file_path).st_ino
+    monkeypatch.setattr(os_util.os, "access", lambda path, mode: False)
+    assert FS.write_str_to_file("x", file_path, False) == 0
+    assert os.stat(file_path).st_ino == old_ino
+    assert _read(file_path) == b"x\n"
@@ -0,0 +1,73 @@
+import errno
+import os
+import stat
+
+from my_py import os_util
+
+FS = os_util.FS
+
+
+def _make_tree(root_path):
+    os.makedirs(os.path.join(root_path, "a", "b"))
+    for rel_path, data in [("f1", b"1"), ("a/f2", b"22" * 1000), ("a/b/f3", b"")]:
+        with open(os.path.join(root_path, rel_path), "wb") as out_file:
+            out_file.write(data)
+    os.symlink("f1", os.path.join(root_path, "link"))
+    os.chmod(os.path.join(root_path, "a", "f2"), 0o600)
+    os.chmod(os.path.join(root_path, "a", "b"), 0o750)
+    for rel_path in ["a/b", "a", ""]:
+        os.utime(os.path.join(root_path, rel_path), ns=(1000000000, 1500000000000000000))
+
+
+def test_walk_matches_os_walk(tmp_path):
+    _make_tree(tmp_path)
+    walk_set = {(dir_path, tuple(sorted(dir_list)), tuple(sorted(file_list)))
+                for dir_path, dir_list, file_list in FS.walk(str(tmp_path))}
+    os_walk_set = {(dir_path, tuple(sorted(dir_list)), tuple(sorted(file_list)))
+                   for dir_path, dir_list, file_list in os.walk(str(tmp_path))}
+    assert walk_set == os_walk_set
+
+
+def test_disk_usage(tmp_path):
+    _make_tree(tmp_path)
+    usage_dict = FS.disk_usage(str(tmp_path))
+    assert usage_dict["size"] >= 2001
+    assert usage_dict["file_num"] >= 3
+
+
+def test_copy_tree_like_cp_rp(tmp_path):
+    src_path = os.path.join(tmp_path, "src")
+    dst_path = os.path.join(tmp_path, "dst")
+    _make_tree(src_path)
+    progress_list = []
+    assert FS.copy_tree(src_path, dst_path,
+                        progress_callback=lambda *args: progress_list.append(args)) == 0
+    with open(os.path.join(dst_path, "a", "f2"), "rb") as in_file:
+        assert in_file.read() == b"22" * 1000
+    assert os.readlink(os.path.join(dst_path, "link")) == "f1"
+    assert stat.S_IMODE(os.stat(os.path.join(dst_path, "a", "f2")).st_mode) == 0o600
+    for rel_path in ["a/b", "a", "."]:
+        src_stat = os.stat(os.path.join(src_path, rel_path))
+        dst_stat = os.stat(os.path.join(dst_path, rel_path))
+        assert stat.S_IMODE(dst_stat.st_mode) == stat.S_IMODE(src_stat.st_mode)
+        assert dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+    assert progress_list[-1][0] == 4
+
+
+def test_copy_tree_missing_src(tmp_path):
+    assert FS.copy_tree(os.path.join(tmp_path, "none"), os.path.join(tmp_path, "d")) == errno.ENOENT
+
+
+def test_copy_tree_dir_removed_during_walk(tmp_path, monkeypatch):
+    src_path = os.path.join(tmp_path, "src")
+    _make_tree(src_path)
+    real_iter_tree = os_util._iter_tree
+
+    def _iter_tree(*args, **kwargs):
+        for dir_path, entry_list, err in real_iter_tree(*args, **kwargs):
+            yield dir_path, entry_list, err
+            if (dir_path == src_path):
+                yield os.path.join(src_path, "gone"), [], None
+    monkeypatch.setattr(os_util, "_iter_tree", _iter_tree)
+    assert FS.copy_tree(src_path, os.path.join(tmp_path, "dst")) == errno.ENOENT
+    assert os.path.exists(os.path.join(tmp_path, "dst", "a", "b", "f3"))
@@ -0,0 +1,144 @@
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from my_py import third_lib
+
+ProcessIndex = third_lib.ProcessIndex
+
+
+def _start_bash(marker):
+    # marker is $0 of the script, the trailing ":" keeps bash from exec'ing sleep
+    proc = subprocess.Popen(["bash", "-c", "sleep 30; :", marker], start_new_session=True)
+    # wait for both exec's, a forked bash not yet sleep shares the cmdline
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            bash_process = third_lib.psutil.Process(proc.pid)
+            if (bash_process.cmdline()[-1:] == [marker] and
+                [child.cmdline() for child in bash_process.children()] == [["sleep", "30"]]):
+                break
+        except third_lib.psutil.Error:
+            pass
+        time.sleep(0.01)
+    return proc
+
+
+def _stop(proc):
+    # the sleep child too
+    os.killpg(proc.pid, signal.SIGKILL)
+    proc.wait()
+
+
+@pytest.fixture
+def bash_proc():
+    proc = _start_bash("pidx-marker")
+    yield proc
+    _stop(proc)
+
+
+def test_find(bash_proc):
+    process_index = ProcessIndex()
+    pid = bash_proc.pid
+    assert process_index.get_info(pid) == ("bash", "bash -c sleep 30; : pidx-marker")
+    assert pid in process_index.find("BAS")
+    assert pid in process_index.find("bash", is_exact_match=True)
+    assert pid not in process_index.find("bas", is_exact_match=True)
+    assert pid in process_index.find(r"^b.*h$", is_regex=True)
+    assert process_index.find("PIDX-MARKER", is_exact_match=True, is_cmdline=True) == [pid]
+    assert process_index.find(r"; : pidx-", is_regex=True, is_cmdline=True) == [pid]
+    assert process_index.find_many(["pidx-marker", "no-such-proc"], is_cmdline=True) == {
+        "pidx-marker": [pid], "no-such-proc": []}
+    assert third_lib.Util.find_process_with_keyword(
+        "bash", is_exact_match=True, process_index=process_index) == \
+        process_index.find("bash", is_exact_match=True)
+    assert process_index.get_info(-1) is None
+
+
+def test_without_cmdline(bash_proc):
+    process_index = ProcessIndex(is_with_cmdline=False)
+    assert process_index.get_info(bash_proc.pid) == ("bash", "")
+    assert process_index.find("pidx-marker", is_cmdline=True) == []
+
+
+def test_refresh_new_and_gone():
+    process_index = ProcessIndex()
+    proc = _start_bash("pidx-refresh")
+    try:
+        new_num, _ = process_index.refresh()
+        assert new_num >= 1
+        assert process_index.find("pidx-refresh", is_cmdline=True) == [proc.pid]
+    finally:
+        _stop(proc)
+    _, gone_num = process_index.refresh()
+    assert gone_num >= 1
+    assert process_index.get_info(proc.pid) is None
+    assert process_index.find("pidx-refresh", is_cmdline=True) == []
+    # the lists stay consistent after removals in the middle
+    assert len(process_index) == len(process_index._pos_map)
+    for pid, pos in process_index._pos_map.items():
+        assert process_index._pid_list[pos] == pid
+
+
+def test_refresh_reused_pid(bash_proc):
+    process_index = ProcessIndex()
+    pid = bash_proc.pid
+    # as if the pid had belonged to an older process
+    process_index._create_time_list[process_index._pos_map[pid]] -= 100
+    process_index._ino_map[pid] = -1
+    new_num, gone_num = process_index.refresh()
+    assert new_num >= 1 and gone_num >= 1
+    assert process_index.get_info(pid) == ("bash", "bash -c sleep 30; : pidx-marker")
+    assert process_index.find("pidx-marker", is_cmdline=True) == [pid]
+    # the create time was read again, a later refresh keeps the entry
+    assert not process_index._is_reused(pid)
+
+
+def test_refresh_skips_unchanged_pids(bash_proc, monkeypatch):
+    process_index = ProcessIndex()
+    checked_pid_list = []
+    is_reused = process_index._is_reused
+
+    def _is_reused(pid):
+        checked_pid_list.append(pid)
+        return is_reused(pid)
+    monkeypatch.setattr(process_index, "_is_reused", _is_reused)
+    # a kept pid with the same /proc entry is not read again
+    assert process_index.refresh()[1] == 0
+    assert bash_proc.pid not in checked_pid_list
+    assert len(checked_pid_list) < len(process_index) // 2
+
+    # the create time is read when the entry changed, or is unknown
+    process_index._ino_map[bash_proc.pid] = -1
+    process_index.refresh()
+    assert bash_proc.pid in checked_pid_list
+    monkeypatch.setattr(ProcessIndex, "_scan_pid_map",
+                        staticmethod(lambda: dict.fromkeys(third_lib.psutil.pids())))
+    checked_pid_list.clear()
+    process_index.refresh()
+    assert bash_proc.pid in checked_pid_list
+    assert process_index.get_info(bash_proc.pid)[0] == "bash"
+
+
+def test_exec_keeps_name_until_full_refresh():
+    proc = subprocess.Popen(["bash", "-c", "read _; exec sleep 30"], stdin=subprocess.PIPE)
+    try:
+        process_index = ProcessIndex(is_with_cmdline=False)
+        assert process_index.get_info(proc.pid)[0] == "bash"
+        proc.stdin.write(b"\n")
+        proc.stdin.flush()
+        deadline = time.monotonic() + 5
+        while (third_lib.psutil.Process(proc.pid).name() != "sleep" and
+               time.monotonic() < deadline):
+            time.sleep(0.02)
+        process_index.refresh()
+        assert process_index.get_info(proc.pid)[0] == "bash"
+        process_index.refresh(is_full=True)
+        assert process_index.get_info(proc.pid)[0] == "sleep"
+    finally:
+        proc.kill()
+        proc.wait()
+
@@ -0,0 +1,71 @@
+import errno
+import time
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "cluster"
+_PWD = "cluster-pwd"
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_pool():
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    yield ssh_pool
+    ssh_pool.close_all()
+
+
+def _cluster(host_list, ssh_pool, **kwargs):
+    return third_lib.ClusterCmd(host_list, _USR, _PWD, ssh_pool=ssh_pool,
+                                host_log_level=logger.G_LOG_LEVEL_ERROR, **kwargs)
+
+
+def test_fan_out_and_grouping(ssh_port, ssh_pool):
+    # two names of the same server are two hosts of the cluster
+    host_list = ["127.0.0.1:{}".format(ssh_port), "localhost:{}".format(ssh_port)]
+    result_map = _cluster(host_list, ssh_pool).run_shell("sleep 0.5; echo same")
+    assert set(result_map) == set(host_list)
+    assert all(result[:3] == ("same", "", 0) for result in result_map.values())
+    assert all(result[3] >= 0.5 for result in result_map.values())
+    assert third_lib.ClusterCmd.group_results(result_map) == [
+        (host_list, ("same", "", 0))]
+
+
+def test_default_port_and_failed_host(ssh_port, ssh_pool):
+    # port 1 refuses the connection
+    cluster = _cluster(["127.0.0.1:{}".format(ssh_port), "127.0.0.1:1"], ssh_pool)
+    result_map = cluster.run_shell("echo ok")
+    assert result_map["127.0.0.1:{}".format(ssh_port)][:3] == ("ok", "", 0)
+    assert result_map["127.0.0.1:1"][:3] == (None, None, errno.ECONNREFUSED)
+    group_list = third_lib.ClusterCmd.group_results(result_map)
+    assert [len(host_list) for host_list, _ in group_list] == [1, 1]
+
+    result_map = _cluster(["127.0.0.1"], ssh_pool, port=ssh_port).run_shell("echo ok")
+    assert result_map["127.0.0.1"][:3] == ("ok", "", 0)
+
+
+def test_deadline(ssh_port, ssh_pool):
+    host_list = ["127.0.0.1:{}".format(ssh_port), "localhost:{}".format(ssh_port)]
+    # one host at a time, the second one never starts
+    cluster = _cluster(host_list, ssh_pool, max_workers=1)
+    start_time = time.monotonic()
+    result_map = cluster.run_shell("sleep 5", deadline=0.5)
+    assert time.monotonic() - start_time < 2
+    assert result_map[host_list[0]][2] == errno.ETIMEDOUT
+    assert result_map[host_list[1]][2] == errno.ECANCELED
+
+    result_map = _cluster(host_list, ssh_pool).run_shell("sleep 5", timeout=0.3)
+    assert [result[2] for result in result_map.values()] == [errno.ETIMEDOUT] * 2
+
+
+def test_dry_run(ssh_pool):
+    result_map = _cluster(["a", "b:2222"], ssh_pool).run_shell("echo x", is_dry_run=True)
+    assert result_map == {"a": (None, None, 0, 0.0), "b:2222": (None, None, 0, 0.0)}
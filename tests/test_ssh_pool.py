@@ -0,0 +1,136 @@
+import errno
+import threading
+import time
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "pool"
+_PWD = "pool-pwd"
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_pool():
+    ssh_pool = third_lib.SSHPool(max_conn_per_host=2, connect_timeout=5)
+    yield ssh_pool
+    ssh_pool.close_all()
+
+
+def _new_cmd(ssh_port, ssh_pool, pwd=_PWD):
+    ssh_cmd = third_lib.SSHCmd(ssh_port, "127.0.0.1", _USR, pwd,
+                               log_level=logger.G_LOG_LEVEL_ERROR, ssh_pool=ssh_pool)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    return ssh_cmd
+
+
+def _conn_num(ssh_pool, ssh_port):
+    pool_key = third_lib.SSHPool.make_key("127.0.0.1", ssh_port, _USR)
+    return ssh_pool.get_stats()["conn_num_map"].get(pool_key, 0)
+
+
+def test_reuse(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    assert ssh_cmd.connect() == 0
+    for idx in range(3):
+        stdout_buf, _, ret = ssh_cmd.run_shell("echo {}".format(idx))
+        assert (stdout_buf.strip(), ret) == (str(idx), 0)
+    # another SSHCmd to the same host shares the connection
+    assert _new_cmd(ssh_port, ssh_pool).run_shell("true")[2] == 0
+    stats = ssh_pool.get_stats()
+    assert stats["connect_count"] == 1
+    assert stats["reuse_count"] == 4
+    assert _conn_num(ssh_pool, ssh_port) == 1
+
+
+def test_reconnect_after_transport_death(ssh_port, ssh_pool):
+    conn, ret = ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD)
+    assert ret == 0
+    dead_client = conn.ssh_client
+    ssh_pool.release(conn)
+    dead_client.get_transport().close()
+
+    stdout_buf, _, ret = _new_cmd(ssh_port, ssh_pool).run_shell("echo alive")
+    assert (stdout_buf.strip(), ret) == ("alive", 0)
+    stats = ssh_pool.get_stats()
+    assert stats["reconnect_count"] == 1
+    assert stats["connect_count"] == 2
+    assert _conn_num(ssh_pool, ssh_port) == 1
+
+
+def test_per_host_limit(ssh_port, ssh_pool):
+    conn_list = [ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD)[0] for _ in range(2)]
+    assert None not in conn_list
+    assert conn_list[0] is not conn_list[1]
+
+    start_time = time.monotonic()
+    assert ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD, timeout=0.2) == (None, errno.EBUSY)
+    assert time.monotonic() - start_time >= 0.2
+
+    # a waiter gets the connection given back by another thread
+    threading.Timer(0.2, ssh_pool.release, args=(conn_list[0],)).start()
+    conn, ret = ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD, timeout=5)
+    assert (conn, ret) == (conn_list[0], 0)
+    assert _conn_num(ssh_pool, ssh_port) == 2
+    assert ssh_pool.get_stats()["connect_count"] == 2
+    ssh_pool.release(conn)
+    ssh_pool.release(conn_list[1])
+
+
+def test_wrong_password(ssh_port, ssh_pool):
+    assert _new_cmd(ssh_port, ssh_pool, pwd="wrong").run_shell("true") == (None, None,
+                                                                          errno.EINVAL)
+    assert _conn_num(ssh_pool, ssh_port) == 0
+    # the right password opens its own connection
+    assert _new_cmd(ssh_port, ssh_pool).run_shell("true")[2] == 0
+
+
+def test_idle_reaper(ssh_port):
+    ssh_pool = third_lib.SSHPool(idle_timeout_second=0.2)
+    conn, ret = ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD)
+    assert ret == 0
+    transport = conn.ssh_client.get_transport()
+    ssh_pool.release(conn)
+    # no later acquire needed to close it
+    deadline = time.monotonic() + 5
+    while _conn_num(ssh_pool, ssh_port) != 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _conn_num(ssh_pool, ssh_port) == 0
+    assert not transport.is_active()
+    assert ssh_pool._reaper_thread is None
+
+
+def test_close_gives_back_borrowed(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    line_iter = iter(ssh_cmd.run_shell_iter("echo first; sleep 30"))
+    assert next(line_iter) == (third_lib.SSHOutputStream.STDOUT, "first")
+    assert _conn_num(ssh_pool, ssh_port) == 1
+
+    ssh_cmd.close()
+    assert _conn_num(ssh_pool, ssh_port) == 0
+    # the iterator finishing later does not give it back twice
+    line_iter.close()
+    assert _conn_num(ssh_pool, ssh_port) == 0
+    assert ssh_cmd.run_shell("true")[2] == 0
+
+
+def test_close_all(ssh_port, ssh_pool):
+    conn, _ = ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD)
+    borrowed_transport = conn.ssh_client.get_transport()
+    idle_conn, _ = ssh_pool.acquire("127.0.0.1", ssh_port, _USR, _PWD)
+    idle_transport = idle_conn.ssh_client.get_transport()
+    ssh_pool.release(idle_conn)
+
+    ssh_pool.close_all()
+    assert not idle_transport.is_active()
+    assert borrowed_transport.is_active()
+    ssh_pool.release(conn)
+    assert not borrowed_transport.is_active()
+    assert ssh_pool.get_stats()["conn_num_map"] == {}
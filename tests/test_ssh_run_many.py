@@ -0,0 +1,75 @@
+import errno
+import time
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "many"
+_PWD = "many-pwd"
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_pool():
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    yield ssh_pool
+    ssh_pool.close_all()
+
+
+def _new_cmd(ssh_port, ssh_pool, pwd=_PWD):
+    ssh_cmd = third_lib.SSHCmd(ssh_port, "127.0.0.1", _USR, pwd,
+                               log_level=logger.G_LOG_LEVEL_ERROR, ssh_pool=ssh_pool)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    return ssh_cmd
+
+
+def test_order_and_concurrency(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    # the slowest command first, the results still come back in input order
+    cmd_list = ["sleep {}; echo {}".format(0.1 * (6 - idx), idx) for idx in range(6)]
+    cmd_list.append("echo err >&2; exit 3")
+    start_time = time.monotonic()
+    result_list = ssh_cmd.run_many(cmd_list, max_channels=8)
+    assert time.monotonic() - start_time < 1.5
+    assert result_list[:6] == [(str(idx), "", 0) for idx in range(6)]
+    assert result_list[6] == ("", "err", 3)
+    # all channels ran on one connection
+    stats = ssh_pool.get_stats()
+    assert (stats["connect_count"], stats["reconnect_count"]) == (1, 0)
+
+
+def test_max_channels(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    start_time = time.monotonic()
+    result_list = ssh_cmd.run_many(["sleep 0.3"] * 4, max_channels=2)
+    assert time.monotonic() - start_time >= 0.6
+    assert [result[2] for result in result_list] == [0] * 4
+
+
+def test_timeout(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    start_time = time.monotonic()
+    result_list = ssh_cmd.run_many(["sleep 5", "echo fast"], timeout=0.5)
+    assert time.monotonic() - start_time < 3
+    assert result_list[0][2] == errno.ETIMEDOUT
+    assert result_list[1] == ("fast", "", 0)
+    # the connection survives a timed out channel
+    assert ssh_cmd.run_many(["echo again"]) == [("again", "", 0)]
+    assert ssh_pool.get_stats()["connect_count"] == 1
+
+
+def test_dry_run_and_errors(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    assert ssh_cmd.run_many(["echo a", "echo b"], is_dry_run=True) == [(None, None, 0)] * 2
+    assert ssh_pool.get_stats()["connect_count"] == 0
+    assert ssh_cmd.run_many([]) == []
+
+    bad_cmd = _new_cmd(ssh_port, ssh_pool, pwd="wrong")
+    assert bad_cmd.run_many(["echo a", "echo b"]) == [(None, None, errno.EINVAL)] * 2
@@ -0,0 +1,177 @@
+import errno
+import filecmp
+import os
+import random
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "sftp"
+_PWD = "sftp-pwd"
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_pool():
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    yield ssh_pool
+    ssh_pool.close_all()
+
+
+def _new_cmd(ssh_port, ssh_pool):
+    ssh_cmd = third_lib.SSHCmd(ssh_port, "127.0.0.1", _USR, _PWD,
+                               log_level=logger.G_LOG_LEVEL_ERROR, ssh_pool=ssh_pool)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    return ssh_cmd
+
+
+def _write(file_path, size, seed=1, mode=0o644):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as out_file:
+        out_file.write(random.Random(seed).randbytes(size))
+    os.chmod(file_path, mode)
+
+
+def _mode(file_path):
+    return os.stat(file_path).st_mode & 0o777
+
+
+@pytest.mark.parametrize("is_compress", [False, True])
+def test_put_and_get_in_ranges(ssh_port, ssh_pool, tmp_path, is_compress):
+    local_path = os.path.join(tmp_path, "local", "data")
+    remote_path = os.path.join(tmp_path, "remote", "data")
+    os.makedirs(os.path.dirname(remote_path))
+    _write(local_path, 1000003, mode=0o751)
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    # 16 ranges over 4 channels
+    assert ssh_cmd.put(local_path, remote_path, max_channels=4, part_size=64 * 1024,
+                       is_compress=is_compress) == 0
+    assert filecmp.cmp(local_path, remote_path, shallow=False)
+    assert _mode(remote_path) == 0o751
+
+    back_path = os.path.join(tmp_path, "local", "back")
+    assert ssh_cmd.get(remote_path, back_path, max_channels=4, part_size=64 * 1024,
+                       is_compress=is_compress) == 0
+    assert filecmp.cmp(local_path, back_path, shallow=False)
+    assert _mode(back_path) == 0o751
+    # no temp file left on either side
+    assert os.listdir(os.path.dirname(remote_path)) == ["data"]
+    assert sorted(os.listdir(os.path.dirname(local_path))) == ["back", "data"]
+
+
+def test_put_replaces_and_empty_file(ssh_port, ssh_pool, tmp_path):
+    local_path = os.path.join(tmp_path, "local", "empty")
+    remote_path = os.path.join(tmp_path, "remote")
+    _write(local_path, 0)
+    with open(remote_path, "w") as out_file:
+        out_file.write("old content")
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    assert ssh_cmd.put(local_path, remote_path) == 0
+    assert os.path.getsize(remote_path) == 0
+    assert ssh_cmd.get(remote_path, os.path.join(tmp_path, "back")) == 0
+    assert os.path.getsize(os.path.join(tmp_path, "back")) == 0
+
+
+def test_missing_files(ssh_port, ssh_pool, tmp_path):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    assert ssh_cmd.put(os.path.join(tmp_path, "missing"),
+                       os.path.join(tmp_path, "remote")) == errno.ENOENT
+    assert not os.path.exists(os.path.join(tmp_path, "remote"))
+    assert ssh_cmd.get(os.path.join(tmp_path, "missing"),
+                       os.path.join(tmp_path, "local")) == errno.ENOENT
+    assert os.listdir(tmp_path) == []
+    # the connection is still good after the errors
+    assert ssh_cmd.run_shell("echo ok") == ("ok", "", 0)
+    assert ssh_pool.get_stats()["connect_count"] == 1
+
+
+def test_dry_run(ssh_port, ssh_pool, tmp_path):
+    local_path = os.path.join(tmp_path, "local", "data")
+    _write(local_path, 10)
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    assert ssh_cmd.put(local_path, os.path.join(tmp_path, "remote"), is_dry_run=True) == 0
+    assert ssh_cmd.get(local_path, os.path.join(tmp_path, "back"), is_dry_run=True) == 0
+    ret, stats = ssh_cmd.put_tree(os.path.join(tmp_path, "local"),
+                                  os.path.join(tmp_path, "tree"), is_dry_run=True)
+    assert (ret, stats["file_num"], stats["byte_num"]) == (0, 1, 10)
+    assert sorted(os.listdir(tmp_path)) == ["local"]
+    assert ssh_pool.get_stats()["connect_count"] == 0
+
+
+@pytest.mark.parametrize("is_compress", [False, True])
+def test_put_tree(ssh_port, ssh_pool, tmp_path, monkeypatch, is_compress):
+    # small files in two tar batches, two large files split into ranges
+    monkeypatch.setattr(third_lib, "_g_sftp_small_file_size", 4096)
+    monkeypatch.setattr(third_lib, "_g_sftp_tar_batch_size", 20000)
+    local_dir = os.path.join(tmp_path, "local")
+    for idx in range(10):
+        _write(os.path.join(local_dir, "sub{}".format(idx % 3), "small{}".format(idx)),
+               3000, seed=idx)
+    _write(os.path.join(local_dir, "large"), 100000, seed=100, mode=0o700)
+    _write(os.path.join(local_dir, "deep", "er", "large"), 50000, seed=101)
+    _write(os.path.join(local_dir, "name with space"), 10, seed=102)
+    os.makedirs(os.path.join(local_dir, "empty"))
+    os.symlink("large", os.path.join(local_dir, "link"))
+
+    remote_dir = os.path.join(tmp_path, "remote")
+    ret, stats = _new_cmd(ssh_port, ssh_pool).put_tree(
+        local_dir, remote_dir, max_channels=4, part_size=32 * 1024, is_compress=is_compress)
+    assert ret == 0
+    assert (stats["file_num"], stats["byte_num"]) == (13, 10 * 3000 + 150010)
+    assert stats["batch_num"] == 2
+    assert stats["part_num"] == 4 + 2
+    assert os.path.isdir(os.path.join(remote_dir, "empty"))
+    assert not os.path.lexists(os.path.join(remote_dir, "link"))
+    for dir_path, _, file_name_list in os.walk(local_dir):
+        for file_name in file_name_list:
+            local_path = os.path.join(dir_path, file_name)
+            if (os.path.islink(local_path)):
+                continue
+            remote_path = os.path.join(remote_dir, os.path.relpath(local_path, local_dir))
+            assert filecmp.cmp(local_path, remote_path, shallow=False)
+    assert _mode(os.path.join(remote_dir, "large")) == 0o700
+
+
+def test_put_tree_tar_fallback(ssh_port, ssh_pool, tmp_path, monkeypatch):
+    # the remote tar fails, the small files go over sftp
+    local_dir = os.path.join(tmp_path, "local")
+    for idx in range(3):
+        _write(os.path.join(local_dir, "small{}".format(idx)), 100, seed=idx)
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    monkeypatch.setattr(ssh_cmd, "_put_tar_batch", lambda *args: errno.EIO)
+    remote_dir = os.path.join(tmp_path, "remote")
+    ret, stats = ssh_cmd.put_tree(local_dir, remote_dir)
+    assert (ret, stats["batch_num"], stats["part_num"]) == (0, 1, 3)
+    assert sorted(os.listdir(remote_dir)) == ["small0", "small1", "small2"]
+
+
+def test_put_tree_within_max_sessions(tmp_path, monkeypatch):
+    # like a stock sshd, which refuses channels beyond its MaxSessions, one
+    # spare for a channel closed by the server whose close reply is in flight
+    limited_port = bench._start_stub_ssh_server(_USR, _PWD, max_sessions=5)
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    monkeypatch.setattr(third_lib, "_g_sftp_small_file_size", 4096)
+    monkeypatch.setattr(third_lib, "_g_sftp_tar_batch_size", 3000)
+    local_dir = os.path.join(tmp_path, "local")
+    for idx in range(8):
+        _write(os.path.join(local_dir, "small{}".format(idx)), 3000, seed=idx)
+    for idx in range(4):
+        _write(os.path.join(local_dir, "large{}".format(idx)), 100000, seed=100 + idx)
+    try:
+        for max_channels in (4, 1):
+            remote_dir = os.path.join(tmp_path, "remote{}".format(max_channels))
+            ret, stats = _new_cmd(limited_port, ssh_pool).put_tree(
+                local_dir, remote_dir, max_channels=max_channels, part_size=32 * 1024)
+            assert ret == 0
+            # every batch went through tar, none fell back to sftp
+            assert (stats["batch_num"], stats["part_num"]) == (8, 4 * 4)
+            assert len(os.listdir(remote_dir)) == 12
+    finally:
+        ssh_pool.close_all()
@@ -0,0 +1,119 @@
+import errno
+import time
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "stream"
+_PWD = "stream-pwd"
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_pool():
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    yield ssh_pool
+    ssh_pool.close_all()
+
+
+def _new_cmd(ssh_port, ssh_pool, pwd=_PWD):
+    ssh_cmd = third_lib.SSHCmd(ssh_port, "127.0.0.1", _USR, pwd,
+                               log_level=logger.G_LOG_LEVEL_ERROR, ssh_pool=ssh_pool)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    return ssh_cmd
+
+
+def test_large_output_both_streams(ssh_port, ssh_pool, monkeypatch):
+    # spill to a temp file early, and write both streams at once so a reader
+    # blocked on one of them would deadlock
+    monkeypatch.setattr(third_lib, "_g_ssh_capture_mem_size", 64 * 1024)
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    stdout_buf, stderr_buf, ret = ssh_cmd.run_shell(
+        "seq 1 300000 >&2 & head -c 3000000 /dev/zero | tr '\\0' a; wait; exit 4")
+    assert ret == 4
+    assert stdout_buf == "a" * 3000000
+    assert stderr_buf.split("\n") == [str(idx) for idx in range(1, 300001)]
+
+
+def test_timeout_keeps_partial_output(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    start_time = time.monotonic()
+    assert ssh_cmd.run_shell("echo start; echo warn >&2; sleep 5", timeout=0.5) == (
+        "start", "warn", errno.ETIMEDOUT)
+    assert time.monotonic() - start_time < 3
+    assert ssh_cmd.run_shell("echo next") == ("next", "", 0)
+    assert ssh_pool.get_stats()["connect_count"] == 1
+
+
+def test_iter_lines(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    # lines split across reads and a last line without a line break
+    output_stream = ssh_cmd.run_shell_iter(
+        "printf 'one\\ntw'; sleep 0.2; printf 'o\\n'; echo err >&2; printf tail; exit 2")
+    assert output_stream.ret_code is None
+    line_list = list(output_stream)
+    assert [line for stream_name, line in line_list
+            if stream_name == third_lib.SSHOutputStream.STDOUT] == ["one", "two", "tail"]
+    assert (third_lib.SSHOutputStream.STDERR, "err") in line_list
+    assert output_stream.ret_code == 2
+
+
+def test_iter_lines_arrive_as_produced(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    start_time = time.monotonic()
+    for stream_name, line in ssh_cmd.run_shell_iter("echo first; sleep 1; echo second"):
+        assert (stream_name, line) == (third_lib.SSHOutputStream.STDOUT, "first")
+        assert time.monotonic() - start_time < 0.9
+        break
+
+
+def test_iter_early_stop_and_timeout(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    output_stream = ssh_cmd.run_shell_iter("seq 1 100000")
+    line_list = []
+    for _, line in output_stream:
+        line_list.append(line)
+        if (len(line_list) == 10):
+            break
+    # the generator is closed when the loop drops it
+    assert line_list == [str(idx) for idx in range(1, 11)]
+    assert output_stream.ret_code == errno.ECANCELED
+
+    output_stream = ssh_cmd.run_shell_iter("echo partial; sleep 5", timeout=0.5)
+    assert list(output_stream) == [(third_lib.SSHOutputStream.STDOUT, "partial")]
+    assert output_stream.ret_code == errno.ETIMEDOUT
+    # the connection is given back and still works
+    assert ssh_cmd.run_shell("echo ok") == ("ok", "", 0)
+    assert ssh_pool.get_stats()["connect_count"] == 1
+
+
+def test_iter_dry_run_and_errors(ssh_port, ssh_pool):
+    output_stream = _new_cmd(ssh_port, ssh_pool).run_shell_iter("echo x", is_dry_run=True)
+    assert (list(output_stream), output_stream.ret_code) == ([], 0)
+    assert ssh_pool.get_stats()["connect_count"] == 0
+
+    output_stream = _new_cmd(ssh_port, ssh_pool, pwd="wrong").run_shell_iter("echo x")
+    assert (list(output_stream), output_stream.ret_code) == ([], errno.EINVAL)
+
+
+def test_timeout_with_endless_output(ssh_port, ssh_pool):
+    ssh_cmd = _new_cmd(ssh_port, ssh_pool)
+    # the remote side ends by itself, the channel must be closed long before
+    chatty_cmd = "timeout 20 yes"
+    start_time = time.monotonic()
+    stdout_buf, _, ret = ssh_cmd.run_shell(chatty_cmd, timeout=0.5)
+    assert ret == errno.ETIMEDOUT
+    assert stdout_buf.startswith("y\ny\n")
+    assert ssh_cmd.run_many([chatty_cmd, "echo fast"], timeout=0.5)[0][2] == errno.ETIMEDOUT
+
+    output_stream = ssh_cmd.run_shell_iter(chatty_cmd, timeout=0.5)
+    line_num = sum(1 for _ in output_stream)
+    assert (line_num > 0, output_stream.ret_code) == (True, errno.ETIMEDOUT)
+    assert time.monotonic() - start_time < 5
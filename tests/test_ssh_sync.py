@@ -0,0 +1,120 @@
+import errno
+import os
+import random
+
+import pytest
+
+import bench
+from my_py import logger
+from my_py import third_lib
+
+_USR = "sync"
+_PWD = "sync-pwd"
+_BLOCK_SIZE = 4096
+_NUMPY_MODE_LIST = [True, False] if third_lib._g_has_numpy else [False]
+
+
+@pytest.fixture(scope="module")
+def ssh_port():
+    return bench._start_stub_ssh_server(_USR, _PWD)
+
+
+@pytest.fixture
+def ssh_cmd(ssh_port):
+    ssh_pool = third_lib.SSHPool(connect_timeout=5)
+    ssh_cmd = third_lib.SSHCmd(ssh_port, "127.0.0.1", _USR, _PWD,
+                               log_level=logger.G_LOG_LEVEL_ERROR, ssh_pool=ssh_pool)
+    ssh_cmd._logger.setLevel(logger.G_LOG_LEVEL_ERROR)
+    yield ssh_cmd
+    ssh_pool.close_all()
+
+
+def _write(file_path, data):
+    with open(file_path, "wb") as out_file:
+        out_file.write(data)
+
+
+def _read(file_path):
+    with open(file_path, "rb") as in_file:
+        return in_file.read()
+
+
+def _sync(ssh_cmd, tmp_path, local_data, remote_data, **kwargs):
+    local_path = os.path.join(tmp_path, "local")
+    remote_path = os.path.join(tmp_path, "remote")
+    _write(local_path, local_data)
+    if (remote_data is not None):
+        _write(remote_path, remote_data)
+        os.chmod(remote_path, 0o640)
+    ret, stats = ssh_cmd.sync_file(local_path, remote_path, block_size=_BLOCK_SIZE, **kwargs)
+    return ret, stats, remote_path
+
+
+@pytest.mark.parametrize("is_use_numpy", _NUMPY_MODE_LIST)
+def test_modified_file_reuses_blocks(ssh_cmd, tmp_path, is_use_numpy):
+    remote_data = random.Random(1).randbytes(200003)
+    # an insert shifts the rest of the file, a change rewrites one block
+    local_data = bytearray(remote_data[:50000] + b"inserted" + remote_data[50000:])
+    local_data[150000:150010] = bytes(10)
+    ret, stats, remote_path = _sync(ssh_cmd, tmp_path, bytes(local_data), remote_data,
+                                    is_use_numpy=is_use_numpy)
+    assert ret == 0
+    assert _read(remote_path) == local_data
+    assert os.stat(remote_path).st_mode & 0o777 == 0o640
+    assert sorted(os.listdir(tmp_path)) == ["local", "remote"]
+    assert stats["is_full_copy"] is False
+    assert stats["block_num"] == 49
+    # the short last block is reused as well
+    assert stats["matched_block_num"] >= stats["block_num"] - 3
+    assert stats["literal_size"] < 4 * _BLOCK_SIZE
+    assert stats["saved_size"] > len(local_data) * 0.8
+
+
+@pytest.mark.parametrize("is_use_numpy", _NUMPY_MODE_LIST)
+def test_identical_and_truncated_file(ssh_cmd, tmp_path, is_use_numpy):
+    data = random.Random(2).randbytes(100000)
+    ret, stats, remote_path = _sync(ssh_cmd, tmp_path, data, data, is_use_numpy=is_use_numpy)
+    assert ret == 0
+    assert (stats["matched_block_num"], stats["sent_size"]) == (stats["block_num"], 0)
+
+    ret, stats, remote_path = _sync(ssh_cmd, tmp_path, data[:40000], data,
+                                    is_use_numpy=is_use_numpy)
+    assert ret == 0
+    assert _read(remote_path) == data[:40000]
+    # 9 whole blocks are copied, the 3136 bytes after them are sent
+    assert (stats["matched_block_num"], stats["literal_size"]) == (9, 40000 - 9 * _BLOCK_SIZE)
+
+
+def test_full_copy(ssh_cmd, tmp_path):
+    data = random.Random(3).randbytes(20000)
+    ret, stats, remote_path = _sync(ssh_cmd, tmp_path, data, None)
+    assert (ret, stats["is_full_copy"], stats["sent_size"]) == (0, True, 20000)
+    assert _read(remote_path) == data
+
+    # smaller than a block, nothing to match
+    ret, stats, remote_path = _sync(ssh_cmd, tmp_path, b"tiny", data)
+    assert (ret, stats["is_full_copy"]) == (0, True)
+    assert _read(remote_path) == b"tiny"
+
+
+def test_digest_mismatch_keeps_remote(ssh_cmd, tmp_path, monkeypatch):
+    remote_data = random.Random(4).randbytes(50000)
+    local_data = remote_data[:20000] + b"changed" + remote_data[20000:]
+    # the remote side checks the rebuilt file against this digest
+    monkeypatch.setattr(third_lib.crypto_tool.Hasher, "hash_data",
+                        staticmethod(lambda data: "0" * 64))
+    ret, _, remote_path = _sync(ssh_cmd, tmp_path, local_data, remote_data)
+    assert ret == errno.EBADMSG
+    assert _read(remote_path) == remote_data
+    assert sorted(os.listdir(tmp_path)) == ["local", "remote"]
+
+
+def test_errors_and_dry_run(ssh_cmd, tmp_path):
+    remote_path = os.path.join(tmp_path, "remote")
+    ret, stats = ssh_cmd.sync_file(os.path.join(tmp_path, "missing"), remote_path)
+    assert (ret, stats["sent_size"]) == (errno.ENOENT, 0)
+
+    _write(os.path.join(tmp_path, "local"), b"x" * 10000)
+    assert ssh_cmd.sync_file(os.path.join(tmp_path, "local"), remote_path,
+                             is_dry_run=True)[0] == 0
+    assert not os.path.exists(remote_path)